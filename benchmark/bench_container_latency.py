@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+"""
+Latency of detection_node in the multi-process layout (one process per node) vs the single-process layout (perception_container).
+
+A probe node publishes synthetic depth images (smart_track.synthetic_depth), the camera info
+and a static map -> camera transform. It measures the time from the image stamp to the arrival of detections_poses.
+Each layout is started with ros2 run as a subprocess, with detection_node and yolo2pose_node.
+yolo2pose_node gets no YOLO detections, but still receives every depth image, as in the observer setup.
+
+Requires a sourced ROS 2 environment with smart_track installed.
+
+Usage:
+    python3 benchmark/bench_container_latency.py [--layouts multi single] [--rate 30] [--duration 20]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+import rclpy
+from cv_bridge import CvBridge
+from geometry_msgs.msg import PoseArray, TransformStamped
+from rclpy.node import Node
+from sensor_msgs.msg import CameraInfo, Image
+from tf2_ros.static_transform_broadcaster import StaticTransformBroadcaster
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from smart_track.synthetic_depth import SyntheticDepthScene  # noqa: E402
+
+# Contour filter bounds of config/detection_param.yaml
+PARAMS = ['-p', 'reference_frame:=map', '-p', 'debug:=false', '-p', 'publish_processed_images:=false', '-p', 'show_debug_images:=false',
+          '-p', 'area_bounds:=[300, 10000]', '-p', 'convexity_bounds:=[0.7, 1.0]']
+LAYOUTS = {
+    'multi': [
+        ['ros2', 'run', 'smart_track', 'detection_node', '--ros-args'] + PARAMS,
+        ['ros2', 'run', 'smart_track', 'yolo2pose_node', '--ros-args'] + PARAMS,
+    ],
+    'single': [
+        ['ros2', 'run', 'smart_track', 'perception_container', '--nodes', 'detection', 'yolo2pose', '--ros-args',
+         '-p', 'depth_transport:=intra', '-r', 'depth_camera_node:__node:=detection_node'] + PARAMS,
+    ],
+}
+
+
+class LatencyProbe(Node):
+
+    def __init__(self, width, height, rate):
+        super().__init__('latency_probe')
+        self.cv_bridge_ = CvBridge()
+        scene = SyntheticDepthScene(width, height)
+        camera = scene.camera()
+        # Generated beforehand, so the frame generation is not in the measured latency
+        self.images_ = [scene.frame()[0] for _ in range(30)]
+        self.caminfo_ = CameraInfo(width=width, height=height, k=[camera.fx_, 0.0, camera.cx_, 0.0, camera.fy_, camera.cy_, 0.0, 0.0, 1.0])
+        self.caminfo_.header.frame_id = 'camera'
+
+        self.image_pub_ = self.create_publisher(Image, 'observer/depth_image', 10)
+        self.caminfo_pub_ = self.create_publisher(CameraInfo, 'observer/camera_info', 10)
+        self.create_subscription(PoseArray, 'detections_poses', self.detectionsCallback, 10)
+
+        tf = TransformStamped()
+        tf.header.stamp = self.get_clock().now().to_msg()
+        tf.header.frame_id = 'map'
+        tf.child_frame_id = 'camera'
+        tf.transform.rotation.w = 1.0
+        self.tf_broadcaster_ = StaticTransformBroadcaster(self)
+        self.tf_broadcaster_.sendTransform(tf)
+
+        self.sent_ = 0
+        self.latencies_ = []
+        self.create_timer(1.0 / rate, self.timerCallback)
+
+    def timerCallback(self):
+        msg = self.cv_bridge_.cv2_to_imgmsg(self.images_[self.sent_ % len(self.images_)], encoding='32FC1')
+        msg.header.stamp = self.get_clock().now().to_msg()
+        msg.header.frame_id = 'camera'
+        self.caminfo_.header.stamp = msg.header.stamp
+        self.caminfo_pub_.publish(self.caminfo_)
+        self.image_pub_.publish(msg)
+        self.sent_ += 1
+
+    def detectionsCallback(self, msg: PoseArray):
+        stamp = msg.header.stamp.sec + msg.header.stamp.nanosec * 1e-9
+        self.latencies_.append(self.get_clock().now().nanoseconds * 1e-9 - stamp)
+
+
+def run_layout(name, args):
+    processes = [subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for cmd in LAYOUTS[name]]
+    probe = LatencyProbe(args.width, args.height, args.rate)
+    try:
+        # Warm-up: discovery, first camera info and TF
+        t_end = time.monotonic() + args.warmup
+        while time.monotonic() < t_end:
+            rclpy.spin_once(probe, timeout_sec=0.01)
+        probe.sent_, probe.latencies_ = 0, []
+        t_end = time.monotonic() + args.duration
+        while time.monotonic() < t_end:
+            rclpy.spin_once(probe, timeout_sec=0.01)
+        return probe.sent_, np.array(probe.latencies_)
+    finally:
+        probe.destroy_node()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark multi-process vs single-process detection latency')
+    parser.add_argument('--layouts', nargs='+', default=['multi', 'single'], choices=list(LAYOUTS))
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--rate', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--duration', type=float, default=20.0)
+    args = parser.parse_args()
+
+    rclpy.init()
+    print('{:>8} {:>6} {:>9} {:>10} {:>10} {:>10}'.format('layout', 'sent', 'received', 'p50 [ms]', 'p95 [ms]', 'mean [ms]'))
+    try:
+        for name in args.layouts:
+            sent, latencies = run_layout(name, args)
+            if len(latencies) == 0:
+                print('{:>8} {:>6} {:>9}'.format(name, sent, 0))
+                continue
+            p50, p95 = np.percentile(latencies, [50, 95]) * 1e3
+            print('{:>8} {:>6} {:>9} {:>10.2f} {:>10.2f} {:>10.2f}'.format(name, sent, len(latencies), p50, p95, latencies.mean() * 1e3))
+    finally:
+        rclpy.shutdown()
+
+
+if __name__ == '__main__':
+    main()
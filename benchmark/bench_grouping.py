@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Micro-benchmark of the contour grouping step of DroneDetector.
+
+Compares DroneDetector.getValidDetections() (pairwise) against
+DroneDetector.getValidDetectionsGrid() (grid) on synthetic candidate sets.
+That both produce the same detections is tested in test/test_detection.py.
+
+Usage:
+    python3 benchmark/bench_grouping.py [--sizes 10 100 1000 10000] [--max-pairwise 2000]
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from smart_track.detection import DroneDetector  # noqa: E402
+
+
+def make_candidates(n_centers, n_slices=8, n_targets=5, clutter_ratio=0.5, width=640, height=480, seed=0):
+    """
+    Generates per-slice lists of contour centers, depths and radii.
+    A fraction of the centers are jittered copies of a few targets (valid groups),
+    the rest are uniformly distributed clutter.
+    """
+    rng = np.random.default_rng(seed)
+    targets = rng.uniform([0, 0], [height, width], size=(n_targets, 2))
+    n_clutter = int(n_centers * clutter_ratio)
+
+    points = np.vstack([
+        targets[rng.integers(0, n_targets, n_centers - n_clutter)] + rng.normal(0, 5, (n_centers - n_clutter, 2)),
+        rng.uniform([0, 0], [height, width], size=(n_clutter, 2)),
+    ]).astype(int)
+    slices = rng.integers(0, n_slices, n_centers)
+
+    centers_list, depths_list, radii_list = [], [], []
+    for k in range(n_slices):
+        idx = np.flatnonzero(slices == k)
+        if len(idx) == 0:
+            continue
+        centers_list.append([list(p) for p in points[idx]])
+        depths_list.append(list(rng.uniform(1.0, 10.0, len(idx))))
+        radii_list.append(list(rng.integers(5, 40, len(idx))))
+    return centers_list, depths_list, radii_list
+
+
+def run(method, candidates, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        # getValidDetections() consumes the centers lists
+        args = copy.deepcopy(candidates)
+        t = time.perf_counter()
+        result = method(*args)
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark DroneDetector contour grouping')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--max-pairwise', type=int, default=2000,
+                        help='Skip the pairwise implementation above this number of centers')
+    parser.add_argument('--d-group-max', type=int, default=30)
+    parser.add_argument('--min-group-size', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    detector = DroneDetector([300, 10000], [0.4, 0.99], [0.7, 1.0], args.d_group_max, args.min_group_size,
+                             10.0, 1.0, 2.0, False)
+
+    print('{:>8} {:>14} {:>14} {:>9} {:>11}'.format('centers', 'pairwise [ms]', 'grid [ms]', 'speedup', 'detections'))
+    for n in args.sizes:
+        candidates = make_candidates(n)
+        t_grid, res_grid = run(detector.getValidDetectionsGrid, candidates, args.repeats)
+        if n <= args.max_pairwise:
+            t_pair, _ = run(detector.getValidDetections, candidates, args.repeats)
+            print('{:>8} {:>14.3f} {:>14.3f} {:>8.1f}x {:>11}'.format(
+                n, t_pair * 1e3, t_grid * 1e3, t_pair / t_grid, len(res_grid[0])))
+        else:
+            print('{:>8} {:>14} {:>14.3f} {:>9} {:>11}'.format(n, 'skipped', t_grid * 1e3, '-', len(res_grid[0])))
+
+
+if __name__ == '__main__':
+    main()
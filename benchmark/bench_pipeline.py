@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+
+"""
+Offline replay benchmark of the depth detection pipeline (DroneDetector.preProcessing + depthTo3D).
+
+Feeds synthetic frames (smart_track.synthetic_depth) or recorded frames (smart_track.depth_recording, or a .npy stack)
+straight into the detector, without ROS, and reports:
+    - per-stage timings (mean, p50, p95), by wrapping the stage methods of the detector instance
+    - frames per second of the whole pipeline
+    - memory peak of the processing (tracemalloc, which also tracks the NumPy buffers), and the process max RSS
+    - precision/recall and depth error against the ground truth (synthetic frames only)
+
+Results can be saved with --json, and compared against a saved baseline with --baseline:
+the exit status is 1 if the FPS dropped by more than --tolerance, or the recall by more than 0.02.
+
+Usage:
+    python3 benchmark/bench_pipeline.py [--frames 200] [--slicing-mode adaptive] [--grouping-mode grid]
+    python3 benchmark/bench_pipeline.py --input depth_recording
+    python3 benchmark/bench_pipeline.py --input frames.npy
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from smart_track.camera_model import PinholeCamera  # noqa: E402
+from smart_track.depth_recording import DepthRecording  # noqa: E402
+from smart_track.detection import DroneDetector  # noqa: E402
+from smart_track.synthetic_depth import SyntheticDepthScene, match_detections  # noqa: E402
+
+# Stage name -> DroneDetector methods called by preProcessing(). The rest of preProcessing() is reported as 'other'
+STAGES = {
+    'erode': ['erode'],
+    'thresholds': ['getAdaptiveDepthThresholds'],
+    'segmentation': ['segmentMultiPass'],
+    'grouping': ['getValidDetections', 'getValidDetectionsGrid'],
+    'refine': ['refineDetections'],
+}
+
+
+def instrument(detector, timings):
+    """
+    Replaces the stage methods of the detector instance with wrappers that add their run time to timings[stage] of the current frame.
+    """
+    def wrap(stage, method):
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[stage] += time.perf_counter() - t
+        return timed
+
+    for stage, names in STAGES.items():
+        for name in names:
+            setattr(detector, name, wrap(stage, getattr(detector, name)))
+
+
+def make_detector(args):
+    return DroneDetector([300, 10000], [0.4, 0.99], [0.7, 1.0], 30, 4, args.max_depth, 1.0, 2.0, False,
+                         grouping_mode=args.grouping_mode,
+                         pyramid_level=args.pyramid_level,
+                         slicing_mode=args.slicing_mode)
+
+
+def load_frames(args):
+    """
+    @return frames, list of ground truth target arrays (None for recorded frames), camera model
+    """
+    if args.input and not args.input.endswith('.npy'):
+        recording = DepthRecording(args.input)
+        n = min(args.frames, len(recording)) if args.frames > 0 else len(recording)
+        return [np.asarray(recording.frame(i), dtype=np.float32) for i in range(n)], None, recording.camera(0)
+    if args.input:
+        frames = np.load(args.input, mmap_mode='r')
+        n = min(args.frames, len(frames)) if args.frames > 0 else len(frames)
+        h, w = frames.shape[1:3]
+        # Intrinsics are not stored in a .npy file. Only the 3D projection cost depends on them
+        return [np.asarray(frames[i], dtype=np.float32) for i in range(n)], None, PinholeCamera(args.fx, args.fx, w / 2.0, h / 2.0, w, h)
+
+    scene = SyntheticDepthScene(args.width, args.height, args.fx, args.fx, max_depth=args.max_depth,
+                                n_drones=args.drones, n_clutter=args.clutter, hole_fraction=args.holes, seed=args.seed)
+    frames, targets = [], []
+    for _ in range(args.frames):
+        image, frame_targets = scene.frame()
+        frames.append(image)
+        targets.append(frame_targets)
+    return frames, targets, scene.camera()
+
+
+def run(args):
+    frames, targets, camera = load_frames(args)
+    detector = make_detector(args)
+    detector.camera_model_ = camera
+
+    frame_timings = defaultdict(float)
+    instrument(detector, frame_timings)
+    stage_times = defaultdict(list)
+    tp = fp = fn = 0
+    depth_errors = []
+
+    # Warm-up: buffer pool allocation, OpenCV lazy initialization
+    for image in frames[:args.warmup]:
+        detector.preProcessing(image.copy())
+
+    tracemalloc.start()
+    total = 0.0
+    for i, image in enumerate(frames):
+        # preProcessing() replaces the NaN/inf values of its input
+        image = image.copy()
+        frame_timings.clear()
+
+        t0 = time.perf_counter()
+        detections, depths, _ = detector.preProcessing(image)
+        t1 = time.perf_counter()
+        detector.depthTo3D(detections, depths)
+        t2 = time.perf_counter()
+
+        for stage in STAGES:
+            stage_times[stage].append(frame_timings[stage])
+        stage_times['other'].append((t1 - t0) - sum(frame_timings.values()))
+        stage_times['depthTo3D'].append(t2 - t1)
+        stage_times['total'].append(t2 - t0)
+        total += t2 - t0
+
+        if targets is not None:
+            matches = match_detections(detections, targets[i])
+            tp += len(matches)
+            fp += len(detections) - len(matches)
+            fn += len(targets[i]) - len(matches)
+            depth_errors.extend(abs(depths[d] - targets[i][t, 2]) for d, t in matches)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {
+        'frames': len(frames),
+        'fps': len(frames) / total,
+        'stages': {stage: {'mean_ms': float(np.mean(t)) * 1e3,
+                           'p50_ms': float(np.percentile(t, 50)) * 1e3,
+                           'p95_ms': float(np.percentile(t, 95)) * 1e3} for stage, t in stage_times.items()},
+        'tracemalloc_peak_mb': peak / 1e6,
+        # KiB on Linux
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'rejections': dict(detector.rejection_counts_),
+    }
+    if targets is not None:
+        results['precision'] = tp / max(1, tp + fp)
+        results['recall'] = tp / max(1, tp + fn)
+        results['depth_error_m'] = float(np.mean(depth_errors)) if depth_errors else float('nan')
+    return results
+
+
+def print_results(results):
+    print('{:>14} {:>10} {:>10} {:>10}'.format('stage', 'mean [ms]', 'p50 [ms]', 'p95 [ms]'))
+    for stage, t in results['stages'].items():
+        print('{:>14} {:>10.3f} {:>10.3f} {:>10.3f}'.format(stage, t['mean_ms'], t['p50_ms'], t['p95_ms']))
+    print()
+    print('frames: {}, FPS: {:.1f}'.format(results['frames'], results['fps']))
+    print('memory peak: {:.1f} MB (tracemalloc), max RSS {:.1f} MB'.format(results['tracemalloc_peak_mb'], results['max_rss_mb']))
+    print('rejections: {}'.format(results['rejections']))
+    if 'recall' in results:
+        print('precision: {:.3f}, recall: {:.3f}, mean depth error: {:.3f} m'.format(
+            results['precision'], results['recall'], results['depth_error_m']))
+
+
+def check_baseline(results, baseline, tolerance):
+    """
+    @return List of regressions with respect to baseline
+    """
+    regressions = []
+    if results['fps'] < baseline['fps'] * (1.0 - tolerance):
+        regressions.append('FPS {:.1f} < baseline {:.1f}'.format(results['fps'], baseline['fps']))
+    if 'recall' in results and 'recall' in baseline and results['recall'] < baseline['recall'] - 0.02:
+        regressions.append('recall {:.3f} < baseline {:.3f}'.format(results['recall'], baseline['recall']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark of the DroneDetector pipeline')
+    parser.add_argument('--input', help='Base path of a depth recording (depth_recorder_node), or .npy stack of depth frames [m] (NxHxW). '
+                                        'Synthetic frames if not given')
+    parser.add_argument('--frames', type=int, default=200, help='Number of frames (0 = all the recorded frames)')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--fx', type=float, default=460.0)
+    parser.add_argument('--max-depth', type=float, default=15.0, help='Far wall of the synthetic frames, and max_cam_depth of the detector')
+    parser.add_argument('--drones', type=int, default=2)
+    parser.add_argument('--clutter', type=int, default=4)
+    parser.add_argument('--holes', type=float, default=0.01, help='Fraction of NaN pixels')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--grouping-mode', default='grid', choices=['pairwise', 'grid'])
+    parser.add_argument('--slicing-mode', default='uniform', choices=['uniform', 'adaptive'])
+    parser.add_argument('--pyramid-level', type=int, default=0)
+    parser.add_argument('--json', help='Save the results to this file')
+    parser.add_argument('--baseline', help='Results file of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative FPS drop with respect to the baseline')
+    args = parser.parse_args()
+
+    results = run(args)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION: ' + regression)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
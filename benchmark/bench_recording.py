@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the replay of a depth recording (smart_track.depth_recording).
+
+Writes a recording of synthetic frames, then measures:
+    - the write rate
+    - the sequential replay rate, with the frames converted to float32 (the copy preProcessing() needs)
+    - random access by stamp
+and compares the replay rate with the real-time rate of the camera.
+
+Usage:
+    python3 benchmark/bench_recording.py [--frames 300] [--dtype float32 float16] [--path /tmp/bench_recording]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from smart_track.depth_recording import DepthRecording, DepthRecordingWriter  # noqa: E402
+from smart_track.synthetic_depth import SyntheticDepthScene  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark depth recording replay')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--dtype', nargs='+', default=['float32', 'float16'], choices=['float32', 'float16'])
+    parser.add_argument('--path', default='/tmp/bench_recording')
+    parser.add_argument('--camera-rate', type=float, default=30.0, help='Real-time frame rate [Hz]')
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+
+    scene = SyntheticDepthScene(seed=0)
+    # A few distinct frames, written repeatedly, so the frame generation is not part of the write timing
+    images = [scene.frame()[0] for _ in range(10)]
+    period_ns = int(1e9 / args.camera_rate)
+
+    print('{:>8} {:>10} {:>13} {:>14} {:>12} {:>15}'.format('dtype', 'size [MB]', 'write [fps]', 'replay [fps]', 'x real-time', 'lookup [us]'))
+    for dtype in args.dtype:
+        path = '{}_{}'.format(args.path, dtype)
+        t = time.perf_counter()
+        with DepthRecordingWriter(path, scene.width_, scene.height_, dtype) as writer:
+            for i in range(args.frames):
+                writer.write_frame(i * period_ns, images[i % len(images)], scene.camera())
+        write_fps = args.frames / (time.perf_counter() - t)
+        size = os.path.getsize(path + '.depth') / 1e6
+
+        # Sequential replay. The page cache is warm, as right after a recording
+        recording = DepthRecording(path)
+        t = time.perf_counter()
+        for _, frame in recording:
+            np.array(frame, dtype=np.float32)
+        replay_fps = len(recording) / (time.perf_counter() - t)
+
+        stamps = np.random.default_rng(0).integers(0, args.frames * period_ns, args.lookups)
+        t = time.perf_counter()
+        for stamp in stamps:
+            recording.frame(recording.find(int(stamp), period_ns))
+        lookup_us = (time.perf_counter() - t) / args.lookups * 1e6
+
+        print('{:>8} {:>10.1f} {:>13.0f} {:>14.0f} {:>11.0f}x {:>15.1f}'.format(
+            dtype, size, write_fps, replay_fps, replay_fps / args.camera_rate, lookup_us))
+        for ext in ('.json', '.depth', '.index', '.detections'):
+            os.remove(path + ext)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the depth frame handoff to N consumer nodes on the same machine.
+
+Compares the topic transport (each consumer deserializes its own copy of the Image message
+and converts it with cv_bridge) against the shared memory ring of smart_track.shm_ring
+(the producer writes the frame once, each consumer deserializes a Header and gets a read-only view),
+and checks that the consumers see the same pixels.
+
+The serialization stands in for the intra-machine middleware copy. The DDS transport itself is not included,
+so the topic timings are a lower bound.
+
+Requires a sourced ROS 2 environment (rclpy, sensor_msgs, std_msgs, cv_bridge).
+
+Usage:
+    python3 benchmark/bench_shm_ring.py [--consumers 1 2 4] [--width 640] [--height 480]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from cv_bridge import CvBridge
+from rclpy.serialization import deserialize_message, serialize_message
+from sensor_msgs.msg import Image
+from std_msgs.msg import Header
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from smart_track.shm_ring import ShmFrameClient, ShmFrameRing  # noqa: E402
+
+
+def topic_handoff(msg, bridge, consumers):
+    data = serialize_message(msg)
+    views = []
+    for _ in range(consumers):
+        received = deserialize_message(data, Image)
+        views.append(bridge.imgmsg_to_cv2(received, desired_encoding='passthrough'))
+    return views
+
+
+def shm_handoff(ring, clients, image, header):
+    ring.write(image, header.stamp.sec, header.stamp.nanosec)
+    data = serialize_message(header)
+    views = []
+    for client in clients:
+        frame = client.get(deserialize_message(data, Header))
+        views.append(frame.array)
+    return views
+
+
+def best_time(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark topic vs shared memory depth frame handoff')
+    parser.add_argument('--consumers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    bridge = CvBridge()
+    image = np.random.default_rng(0).uniform(0.3, 20.0, size=(args.height, args.width)).astype(np.float32)
+    msg = bridge.cv2_to_imgmsg(image, encoding='32FC1')
+    msg.header.frame_id = 'camera'
+
+    ring = ShmFrameRing.create('smart_track_bench', args.slots, image.nbytes)
+    try:
+        print('{:>10} {:>12} {:>10} {:>9} {:>10}'.format('consumers', 'topic [ms]', 'shm [ms]', 'speedup', 'max error'))
+        for n in args.consumers:
+            clients = [ShmFrameClient('smart_track_bench') for _ in range(n)]
+            stamp = iter(range(1, 1000000))
+
+            def shm():
+                msg.header.stamp.sec = next(stamp)
+                return shm_handoff(ring, clients, image, msg.header)
+
+            t_topic, ref = best_time(lambda: topic_handoff(msg, bridge, n), args.repeats)
+            t_shm, res = best_time(shm, args.repeats)
+            err = max(float(np.abs(a - b).max()) for a, b in zip(ref, res))
+            print('{:>10} {:>12.3f} {:>10.3f} {:>8.1f}x {:>10.2e}'.format(n, t_topic * 1e3, t_shm * 1e3, t_topic / t_shm, err))
+            for client in clients:
+                client.close()
+    finally:
+        ring.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the camera-to-map transform of detections.
+
+Compares the per-pose path (one tf2_geometry_msgs Pose + do_transform_pose per detection)
+against the batch path of smart_track.transforms (one 4x4 matrix, one matrix multiply per frame),
+and checks that both give the same poses.
+
+Requires a sourced ROS 2 environment (geometry_msgs, tf2_geometry_msgs).
+
+Usage:
+    python3 benchmark/bench_transforms.py [--sizes 1 10 100 1000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from geometry_msgs.msg import TransformStamped
+from tf2_geometry_msgs import Pose as TF2Pose
+from tf2_geometry_msgs import do_transform_pose
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from smart_track.transforms import TransformMatrixCache  # noqa: E402
+
+
+def make_transform(seed=0):
+    rng = np.random.default_rng(seed)
+    q = rng.normal(size=4)
+    q /= np.linalg.norm(q)
+    tr = TransformStamped()
+    tr.header.frame_id = 'map'
+    tr.child_frame_id = 'camera'
+    tr.transform.translation.x, tr.transform.translation.y, tr.transform.translation.z = rng.normal(size=3).tolist()
+    tr.transform.rotation.x, tr.transform.rotation.y, tr.transform.rotation.z, tr.transform.rotation.w = q.tolist()
+    return tr
+
+
+def per_pose(points, tr):
+    poses = []
+    for p in points:
+        pose = TF2Pose()
+        pose.position.x, pose.position.y, pose.position.z = p
+        pose.orientation.w = 1.0
+        poses.append(do_transform_pose(pose, tr))
+    return poses
+
+
+def batch(points, tr):
+    # A new cache per call, so the matrix conversion is part of the timing
+    pose_array, _ = TransformMatrixCache().transform_to_pose_array(points, tr, 'map', tr.header.stamp)
+    return pose_array.poses
+
+
+def best_time(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-pose vs batch transforms')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    tr = make_transform()
+    print('{:>7} {:>15} {:>12} {:>9} {:>12}'.format('points', 'per-pose [ms]', 'batch [ms]', 'speedup', 'max error'))
+    for n in args.sizes:
+        points = np.random.default_rng(n).uniform(-10, 10, size=(n, 3)).tolist()
+        t_ref, ref = best_time(lambda: per_pose(points, tr), args.repeats)
+        t_batch, res = best_time(lambda: batch(points, tr), args.repeats)
+        err = max((abs(a.position.x - b.position.x) + abs(a.position.y - b.position.y) + abs(a.position.z - b.position.z)
+                   for a, b in zip(ref, res)), default=0.0)
+        print('{:>7} {:>15.3f} {:>12.3f} {:>8.1f}x {:>12.2e}'.format(n, t_ref * 1e3, t_batch * 1e3, t_ref / t_batch, err))
+
+
+if __name__ == '__main__':
+    main()
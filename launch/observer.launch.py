@@ -2,18 +2,26 @@
 
 import os
 from launch import LaunchDescription
-from launch.actions import IncludeLaunchDescription
+from launch.actions import DeclareLaunchArgument, IncludeLaunchDescription
+from launch.conditions import IfCondition, UnlessCondition
 from launch_ros.actions import Node
 from ament_index_python import get_package_share_directory
 from launch_ros.substitutions import FindPackageShare
 from launch.launch_description_sources import PythonLaunchDescriptionSource
-from launch.substitutions import PathJoinSubstitution
+from launch.substitutions import LaunchConfiguration, PathJoinSubstitution
 from math import radians
 def generate_launch_description():
     ld = LaunchDescription()
 
     ns='observer'
 
+    # Run the smart_track perception nodes in one process (perception_container) instead of one process per node
+    single_process = LaunchConfiguration('single_process')
+    single_process_launch_arg = DeclareLaunchArgument(
+        'single_process',
+        default_value='False'
+    )
+
     # Node for Drone 1
     world = {'gz_world': 'default'}
     # world = {'gz_world': 'ihunter_world'}
@@ -178,7 +186,36 @@ def generate_launch_description():
             'detector_ns' : '',
             'reference_frame' : 'observer/odom',
             'use_sim_time' : 'True'
-        }.items()
+        }.items(),
+        condition=UnlessCondition(single_process)
+    )
+
+    # Same nodes, in one process
+    perception_container_launch = IncludeLaunchDescription(
+        PythonLaunchDescriptionSource([
+            PathJoinSubstitution([
+                FindPackageShare('smart_track'),
+                'perception_container.launch.py'
+            ])
+        ]),
+        launch_arguments={
+            'nodes': 'yolo2pose marker',
+            'depth_topic': 'observer/depth_image',
+            'debug' : 'false',
+            'caminfo_topic' : 'observer/camera_info',
+            'detections_poses_topic': 'yolo_detections_poses',
+            'yolo_detections_topic': 'detections',
+            'detector_ns' : '',
+            'reference_frame' : 'observer/odom',
+            'use_sim_time' : 'True',
+            'odom_topic': '/observer/mavros/local_position/odom',
+            'marker_topic': ns+'/quadcopter_marker',
+            'propeller_size': '0.15',
+            'arm_length': '0.3',
+            'body_color': '[0.0, 1.0, 0.0, 1.0]',
+            'propeller_color': '[1.0, 1.0, 0.0, 1.0]'
+        }.items(),
+        condition=IfCondition(single_process)
     )
 
     # Drone marker in RViz
@@ -197,6 +234,7 @@ def generate_launch_description():
             'propeller_color': '[1.0, 1.0, 0.0, 1.0]',  # Set propeller_color directly
             'odom_topic': '/observer/mavros/local_position/odom',     # Set odom_topic directly
         }.items(),
+        condition=UnlessCondition(single_process)
     )
 
     # Rviz2
@@ -208,6 +246,7 @@ def generate_launch_description():
         arguments=['-d' + os.path.join(get_package_share_directory('smart_track'), 'smart_track.rviz')]
     )
 
+    ld.add_action(single_process_launch_arg)
     ld.add_action(gz_launch)
     ld.add_action(map2pose_tf_node)
     ld.add_action(cam_tf_node)
@@ -215,8 +254,9 @@ def generate_launch_description():
     ld.add_action(kf_launch) # Estimates target's states based on position measurements( Reqiures yolov8_launch & yolo2pose_launch OR gt_target_tf)
     ld.add_action(yolov8_launch)
     ld.add_action(yolo2pose_launch) # Comment this if you want to use the target ground truth (gt_target_tf.launch.py)
+    ld.add_action(perception_container_launch) # Replaces yolo2pose_launch and quadcopter_marker_launch with single_process:=True
     ld.add_action(mavros_launch)
     ld.add_action(rviz_node)
-    # ld.add_action(quadcopter_marker_launch)
+    ld.add_action(quadcopter_marker_launch)
 
     return ld
\ No newline at end of file
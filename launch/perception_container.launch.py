@@ -0,0 +1,170 @@
+from launch import LaunchDescription
+from launch_ros.actions import Node
+from launch.actions import DeclareLaunchArgument
+from launch.substitutions import LaunchConfiguration
+from ament_index_python.packages import get_package_share_directory
+import os
+
+def generate_launch_description():
+    # Runs detection_node, yolo2pose_node and/or drone_marker_node in one process (perception_container).
+    # The depth images are received once and handed over to both nodes (depth_transport 'intra')
+    nodes = LaunchConfiguration('nodes')
+    detection_yaml = LaunchConfiguration('detection_yaml')
+    depth_topic = LaunchConfiguration('depth_topic')
+    caminfo_topic = LaunchConfiguration('caminfo_topic')
+    detections_topic = LaunchConfiguration('detections_topic')
+    detections_poses_topic = LaunchConfiguration('detections_poses_topic')
+    yolo_detections_topic = LaunchConfiguration('yolo_detections_topic')
+    namespace = LaunchConfiguration('detector_ns')
+    debug = LaunchConfiguration('debug')
+    reference_frame = LaunchConfiguration('reference_frame')
+    use_sim_time = LaunchConfiguration('use_sim_time')
+    odom_topic = LaunchConfiguration('odom_topic')
+    marker_topic = LaunchConfiguration('marker_topic')
+    propeller_size = LaunchConfiguration('propeller_size')
+    arm_length = LaunchConfiguration('arm_length')
+    body_color = LaunchConfiguration('body_color')
+    propeller_color = LaunchConfiguration('propeller_color')
+
+    config = os.path.join(
+        get_package_share_directory('smart_track'),
+        'detection_param.yaml'
+    )
+
+    nodes_launch_arg = DeclareLaunchArgument(
+        'nodes',
+        default_value='detection yolo2pose',
+        description='Nodes of the process: detection, yolo2pose, marker'
+    )
+
+    detection_yaml_launch_arg = DeclareLaunchArgument(
+        'detection_yaml',
+        default_value=config
+    )
+
+    depth_topic_launch_arg = DeclareLaunchArgument(
+        'depth_topic',
+        default_value='observer/depth_image'
+    )
+
+    caminfo_topic_launch_arg = DeclareLaunchArgument(
+        'caminfo_topic',
+        default_value='observer/camera_info'
+    )
+
+    detections_topic_launch_arg = DeclareLaunchArgument(
+        'detections_topic',
+        default_value='detections_poses'
+    )
+
+    detections_poses_topic_launch_arg = DeclareLaunchArgument(
+        'detections_poses_topic',
+        default_value='yolo_detections_poses'
+    )
+
+    yolo_detections_topic_launch_arg = DeclareLaunchArgument(
+        'yolo_detections_topic',
+        default_value='detections'
+    )
+
+    namespace_launch_arg = DeclareLaunchArgument(
+        'detector_ns',
+        default_value=''
+    )
+
+    debug_launch_arg = DeclareLaunchArgument(
+        'debug',
+        default_value='False'
+    )
+
+    reference_frame_launch_arg = DeclareLaunchArgument(
+        'reference_frame',
+        default_value='map'
+    )
+
+    use_sim_time_launch_arg = DeclareLaunchArgument(
+        'use_sim_time',
+        default_value='True'
+    )
+
+    # Drone marker (quadcopter_marker.launch.py arguments)
+    odom_topic_launch_arg = DeclareLaunchArgument(
+        'odom_topic',
+        default_value='odom'
+    )
+
+    marker_topic_launch_arg = DeclareLaunchArgument(
+        'marker_topic',
+        default_value='quadcopter_marker'
+    )
+
+    propeller_size_launch_arg = DeclareLaunchArgument(
+        'propeller_size',
+        default_value='0.1'
+    )
+
+    arm_length_launch_arg = DeclareLaunchArgument(
+        'arm_length',
+        default_value='0.5'
+    )
+
+    body_color_launch_arg = DeclareLaunchArgument(
+        'body_color',
+        default_value='[1.0, 0.0, 0.0, 1.0]'
+    )
+
+    propeller_color_launch_arg = DeclareLaunchArgument(
+        'propeller_color',
+        default_value='[0.0, 0.0, 1.0, 1.0]'
+    )
+
+    # No name=: it would rename all the nodes of the process.
+    # The parameter dicts apply to all the nodes. detection_yaml is keyed by the name of the detection node
+    container_node = Node(
+        package='smart_track',
+        executable='perception_container',
+        namespace=namespace,
+        output='screen',
+        arguments=['--nodes', nodes],
+        parameters=[detection_yaml,
+                    {'depth_transport': 'intra'},
+                    {'debug': debug},
+                    {'reference_frame': reference_frame},
+                    {'use_sim_time': use_sim_time},
+                    {'propeller_size': propeller_size,
+                     'arm_length': arm_length,
+                     'body_color': body_color,
+                     'propeller_color': propeller_color}],
+        remappings=[('depth_camera_node:__node', 'detection_node'),
+                    ('observer/depth_image', depth_topic),
+                    ('observer/camera_info', caminfo_topic),
+                    ('detections_poses', detections_topic),
+                    ('yolo_poses', detections_poses_topic),
+                    ('detections', yolo_detections_topic),
+                    ('odom', odom_topic),
+                    ('quadcopter_marker', marker_topic)
+                    ]
+    )
+
+    ld = LaunchDescription()
+
+    ld.add_action(nodes_launch_arg)
+    ld.add_action(detection_yaml_launch_arg)
+    ld.add_action(depth_topic_launch_arg)
+    ld.add_action(caminfo_topic_launch_arg)
+    ld.add_action(detections_topic_launch_arg)
+    ld.add_action(detections_poses_topic_launch_arg)
+    ld.add_action(yolo_detections_topic_launch_arg)
+    ld.add_action(namespace_launch_arg)
+    ld.add_action(debug_launch_arg)
+    ld.add_action(reference_frame_launch_arg)
+    ld.add_action(use_sim_time_launch_arg)
+    ld.add_action(odom_topic_launch_arg)
+    ld.add_action(marker_topic_launch_arg)
+    ld.add_action(propeller_size_launch_arg)
+    ld.add_action(arm_length_launch_arg)
+    ld.add_action(body_color_launch_arg)
+    ld.add_action(propeller_color_launch_arg)
+    ld.add_action(container_node)
+
+    return ld
@@ -32,6 +32,9 @@ setup(
             'drone_marker_node = smart_track.drone_marker_node:main',
             'offboard_control = smart_track.offboard_control_node:main',
             'gt_target_tf = smart_track.gt_target_tf:main',
+            'depth_shm_node = smart_track.depth_shm_node:main',
+            'perception_container = smart_track.perception_container:main',
+            'depth_recorder_node = smart_track.depth_recorder_node:main',
         ],
     },
 )
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+BufferPool
+
+Resolution-keyed pool of named working buffers, reused across frames so the
+image processing pipeline does not allocate new arrays for every frame.
+Buffers are passed to NumPy/OpenCV through their out=/dst= arguments.
+
+Buffers are grouped by frame resolution. The buffers of the max_resolutions most
+recently used resolutions are kept (e.g. full frames and fixed-size ROI windows),
+older ones are dropped and re-allocated lazily if that resolution comes back.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class BufferPool:
+
+    def __init__(self, max_resolutions=2):
+        self.max_resolutions_ = max(1, max_resolutions)
+        self.resolution_ = None
+        self.buffers_ = {}
+        self.pools_ = OrderedDict() # resolution -> {name: buffer}
+
+        # Bytes of the buffers used since the last begin_frame(), and the peak over all frames
+        self.frame_bytes_ = 0
+        self.peak_frame_bytes_ = 0
+        self.frame_buffers_ = set()
+
+    def begin_frame(self, resolution):
+        """
+        Starts a new frame, and selects the buffers of its resolution.
+
+        @param resolution: (height, width) of the frame
+        """
+        resolution = tuple(resolution[:2])
+        if resolution != self.resolution_:
+            self.buffers_ = self.pools_.setdefault(resolution, {})
+            self.resolution_ = resolution
+        self.pools_.move_to_end(resolution)
+        while len(self.pools_) > self.max_resolutions_:
+            self.pools_.popitem(last=False)
+        self.frame_bytes_ = 0
+        self.frame_buffers_.clear()
+
+    def end_frame(self):
+        """
+        Ends the current frame.
+
+        @return frame_bytes: Working-set bytes of the buffers used in this frame
+        """
+        self.peak_frame_bytes_ = max(self.peak_frame_bytes_, self.frame_bytes_)
+        return self.frame_bytes_
+
+    def get(self, name, dtype, shape=None):
+        """
+        Returns the buffer called name. Its content is left over from the previous use.
+
+        @param name: Buffer name. Each name owns one buffer.
+        @param dtype: Buffer data type
+        @param shape: Buffer shape. Defaults to the frame resolution.
+
+        @return buf: np.ndarray of the requested shape and dtype
+        """
+        if shape is None:
+            shape = self.resolution_
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+
+        buf = self.buffers_.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = np.empty(shape, dtype)
+            self.buffers_[name] = buf
+
+        if name not in self.frame_buffers_:
+            self.frame_buffers_.add(name)
+            self.frame_bytes_ += buf.nbytes
+        return buf
+
+    def total_bytes(self):
+        """
+        @return Bytes held by all the buffers of the pool
+        """
+        return sum(buf.nbytes for buffers in self.pools_.values() for buf in buffers.values())
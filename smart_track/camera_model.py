@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""
+PinholeCamera
+
+Pinhole camera model built once from sensor_msgs/CameraInfo.
+Keeps the inverse intrinsics and a per-pixel ray lookup table for the current
+resolution, so arrays of pixels (or whole depth crops) are back-projected to
+3D points in the camera frame (+X-right, +Y-down, +Z-outward) in one call.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import numpy as np
+
+
+class PinholeCamera:
+
+    def __init__(self, fx, fy, cx, cy, width=0, height=0):
+        self.fx_ = float(fx)
+        self.fy_ = float(fy)
+        self.cx_ = float(cx)
+        self.cy_ = float(cy)
+        self.inv_fx_ = 1.0 / self.fx_
+        self.inv_fy_ = 1.0 / self.fy_
+        self.width_ = int(width)
+        self.height_ = int(height)
+
+        # Ray lookup table: the ray through pixel (u, v) is (ray_x_[u], ray_y_[v], 1).
+        # The pinhole model is separable, so one row and one column cover all the pixels.
+        self.ray_x_ = None
+        self.ray_y_ = None
+        if self.width_ > 0 and self.height_ > 0:
+            self.set_resolution(self.width_, self.height_)
+
+    @classmethod
+    def from_camera_info(cls, msg):
+        """
+        @param msg: sensor_msgs/CameraInfo
+        @return PinholeCamera, or None if the intrinsic matrix is not valid
+        """
+        K = np.asarray(msg.k, dtype=np.float64)
+        if len(K) != 9 or K[0] == 0.0 or K[4] == 0.0:
+            return None
+        return cls(K[0], K[4], K[2], K[5], msg.width, msg.height)
+
+    def matches(self, msg):
+        """
+        @return True if msg (sensor_msgs/CameraInfo) has the same intrinsics and resolution as this model
+        """
+        K = msg.k
+        return (len(K) == 9 and K[0] == self.fx_ and K[4] == self.fy_ and K[2] == self.cx_ and K[5] == self.cy_
+                and msg.width == self.width_ and msg.height == self.height_)
+
+    def set_resolution(self, width, height):
+        """
+        Builds the ray lookup table for a width x height image.
+        """
+        self.width_ = int(width)
+        self.height_ = int(height)
+        self.ray_x_ = (np.arange(self.width_, dtype=np.float64) - self.cx_) * self.inv_fx_
+        self.ray_y_ = (np.arange(self.height_, dtype=np.float64) - self.cy_) * self.inv_fy_
+
+    def backproject(self, u, v, depth):
+        """
+        Back-projects pixels with known depths.
+
+        @param u: Horizontal pixel coordinates (array-like of N)
+        @param v: Vertical pixel coordinates (array-like of N)
+        @param depth: Depths along the optical axis (array-like of N)
+
+        @return points: Nx3 array of 3D points in the camera frame
+        """
+        u = np.asarray(u, dtype=np.float64)
+        v = np.asarray(v, dtype=np.float64)
+        d = np.asarray(depth, dtype=np.float64)
+        points = np.empty(np.broadcast(u, v, d).shape + (3,))
+        points[..., 0] = d * (u - self.cx_) * self.inv_fx_
+        points[..., 1] = d * (v - self.cy_) * self.inv_fy_
+        points[..., 2] = d
+        return points.reshape(-1, 3)
+
+    def backproject_crop(self, depth_crop, x0=0, y0=0):
+        """
+        Back-projects every pixel of a depth crop using the ray lookup table.
+
+        @param depth_crop: HxW depth image crop
+        @param x0: Column of the crop's top-left pixel in the full image
+        @param y0: Row of the crop's top-left pixel in the full image
+
+        @return points: HxWx3 array of 3D points in the camera frame
+        """
+        h, w = depth_crop.shape[:2]
+        if self.ray_x_ is None or x0 + w > self.width_ or y0 + h > self.height_:
+            self.set_resolution(max(self.width_, x0 + w), max(self.height_, y0 + h))
+        d = np.asarray(depth_crop, dtype=np.float64)
+        points = np.empty((h, w, 3))
+        np.multiply(d, self.ray_x_[x0:x0 + w][np.newaxis, :], out=points[..., 0])
+        np.multiply(d, self.ray_y_[y0:y0 + h][:, np.newaxis], out=points[..., 1])
+        points[..., 2] = d
+        return points
+
+    def project(self, points):
+        """
+        Projects 3D points in the camera frame to pixel coordinates.
+
+        @param points: Nx3 array-like of points
+        @return pixels: Nx2 array of (u, v). Points with z == 0 are projected to (0, 0).
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        pixels = np.zeros((len(points), 2))
+        z = points[:, 2]
+        valid = z != 0
+        pixels[valid, 0] = self.fx_ * points[valid, 0] / z[valid] + self.cx_
+        pixels[valid, 1] = self.fy_ * points[valid, 1] / z[valid] + self.cy_
+        return pixels
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+Debug logging helpers for the detection hot path.
+
+RateLimitedLogger emits at most one message per key and period. The message is only formatted when it is emitted,
+and the number of messages suppressed in between is appended to the next one.
+The sink is any logger with info/warning/debug methods: a Python logger by default, or the rclpy logger of a node.
+
+RejectionLog keeps a sample (one in sample_period) of the contours rejected by DroneDetector.filterContours
+in a bounded ring, which can be dumped on demand (e.g. by a service of the node).
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import logging
+import time
+from collections import deque
+
+
+class RateLimitedLogger:
+
+    def __init__(self, sink=None, period=1.0, clock=time.monotonic):
+        """
+        @param sink: Logger with info/warning/debug methods. Python logger 'smart_track' if None
+        @param period: Minimum time between two messages of the same key [s]
+        @param clock: Time source [s]
+        """
+        self.sink_ = sink if sink is not None else logging.getLogger('smart_track')
+        self.period_ = period
+        self.clock_ = clock
+        self.last_ = {}        # key -> time of the last emitted message
+        self.suppressed_ = {}  # key -> number of messages suppressed since then
+
+    def log(self, level, key, fmt, *args):
+        """
+        @param level: 'info', 'warning' or 'debug'
+        @param key: Rate limiting key, e.g. the name of the calling method
+        @param fmt: str.format() format string. Only formatted if the message is emitted
+        @param args: Arguments of fmt
+        @return True if the message was emitted
+        """
+        now = self.clock_()
+        last = self.last_.get(key)
+        if last is not None and now - last < self.period_:
+            self.suppressed_[key] = self.suppressed_.get(key, 0) + 1
+            return False
+        self.last_[key] = now
+        message = fmt.format(*args) if args else fmt
+        suppressed = self.suppressed_.pop(key, 0)
+        if suppressed:
+            message += ' ({} similar messages suppressed)'.format(suppressed)
+        getattr(self.sink_, level)(message)
+        return True
+
+    def info(self, key, fmt, *args):
+        return self.log('info', key, fmt, *args)
+
+    def warning(self, key, fmt, *args):
+        return self.log('warning', key, fmt, *args)
+
+    def debug(self, key, fmt, *args):
+        return self.log('debug', key, fmt, *args)
+
+
+class RejectionLog:
+
+    def __init__(self, capacity=256, sample_period=10):
+        """
+        @param capacity: Maximum number of records. The oldest are dropped when it is full
+        @param sample_period: One rejected contour in sample_period is recorded
+        """
+        self.records_ = deque(maxlen=capacity)
+        self.sample_period_ = max(1, sample_period)
+        self.seen_ = 0
+
+    def add(self, frame, reason, values, areas, bounds):
+        """
+        Records a sample of the contours rejected by one stage of the filter.
+
+        @param frame: Frame number
+        @param reason: 'area', 'circularity' or 'convexity'
+        @param values: Array of the feature values of the rejected contours
+        @param areas: Array of the areas of the rejected contours [px]
+        @param bounds: Bounds of the feature
+        """
+        n = len(values)
+        # Offset of the first sampled contour, so the sampling continues across calls
+        start = (-self.seen_) % self.sample_period_
+        self.seen_ += n
+        for i in range(start, n, self.sample_period_):
+            self.records_.append((frame, reason, float(values[i]), float(areas[i]), bounds))
+
+    def dump(self, clear=False):
+        """
+        @param clear: Empty the ring
+        @return List of records {'frame', 'reason', 'value', 'area', 'bounds'}, oldest first
+        """
+        records = [{'frame': frame, 'reason': reason, 'value': value, 'area': area, 'bounds': list(bounds)}
+                   for frame, reason, value, area, bounds in self.records_]
+        if clear:
+            self.records_.clear()
+        return records
+
+    def __len__(self):
+        return len(self.records_)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+DepthRingBuffer
+
+Bounded ring buffer of depth image messages, indexed by their header stamp.
+A single depth subscription fills it, and the consumers (e.g. YOLO detections and KF tracks)
+query the frame nearest to their own stamp within a slop. The capacity is set in megabytes,
+and the oldest frames are evicted first.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import bisect
+
+
+class DepthRingBuffer:
+
+    def __init__(self, capacity_mb=64.0, slop=0.1):
+        """
+        @param capacity_mb: Maximum total size of the buffered frames [MB]
+        @param slop: Maximum stamp difference for a frame to match a query [s]
+        """
+        self.capacity_bytes_ = int(capacity_mb * 1024 * 1024)
+        self.slop_ = slop
+
+        # Sorted by stamp
+        self.stamps_ = []
+        self.frames_ = []
+        self.sizes_ = []
+        self.bytes_ = 0
+
+        # Statistics
+        self.hits_ = 0
+        self.misses_ = 0
+        self.evictions_ = 0
+        self.match_error_sum_ = 0.0
+        self.match_error_max_ = 0.0
+
+    def __len__(self):
+        return len(self.stamps_)
+
+    def push(self, stamp, frame, nbytes):
+        """
+        Adds a frame. Out-of-order frames are inserted at their stamp position.
+
+        @param stamp: Frame stamp [s]
+        @param frame: Frame (e.g. sensor_msgs/Image)
+        @param nbytes: Frame size [bytes], e.g. len(msg.data)
+        """
+        i = bisect.bisect_right(self.stamps_, stamp)
+        self.stamps_.insert(i, stamp)
+        self.frames_.insert(i, frame)
+        self.sizes_.insert(i, nbytes)
+        self.bytes_ += nbytes
+
+        # Evict the oldest frames, but always keep the newest one
+        while self.bytes_ > self.capacity_bytes_ and len(self.stamps_) > 1:
+            self.stamps_.pop(0)
+            self.frames_.pop(0)
+            self.bytes_ -= self.sizes_.pop(0)
+            self.evictions_ += 1
+
+    def nearest(self, stamp):
+        """
+        @return (index, |stamp error|) of the buffered frame nearest to stamp, or (None, inf) if empty
+        """
+        if not self.stamps_:
+            return None, float('inf')
+        i = bisect.bisect_left(self.stamps_, stamp)
+        candidates = [j for j in (i - 1, i) if 0 <= j < len(self.stamps_)]
+        j = min(candidates, key=lambda j: abs(self.stamps_[j] - stamp))
+        return j, abs(self.stamps_[j] - stamp)
+
+    def lookup(self, stamp, record_miss=True):
+        """
+        Frame nearest to stamp within the slop. Updates the hit/miss statistics.
+
+        @param stamp: Query stamp [s]
+        @param record_miss: If False, a miss is not counted (e.g. the query is retried when new frames arrive)
+        @return frame, or None if no frame is within the slop
+        """
+        j, error = self.nearest(stamp)
+        if j is None or error > self.slop_:
+            if record_miss:
+                self.misses_ += 1
+            return None
+        self.hits_ += 1
+        self.match_error_sum_ += error
+        self.match_error_max_ = max(self.match_error_max_, error)
+        return self.frames_[j]
+
+    def may_match_later(self, stamp):
+        """
+        @return True if a frame matching stamp within the slop may still arrive, i.e. the newest frame is older than stamp + slop
+        """
+        return not self.stamps_ or self.stamps_[-1] < stamp + self.slop_
+
+    def stats(self):
+        """
+        @return dict of the buffer occupancy, hit/miss counts and match error
+        """
+        return {
+            'frames': len(self.stamps_),
+            'bytes': self.bytes_,
+            'occupancy': self.bytes_ / self.capacity_bytes_ if self.capacity_bytes_ > 0 else 0.0,
+            'hits': self.hits_,
+            'misses': self.misses_,
+            'evictions': self.evictions_,
+            'mean_match_error': self.match_error_sum_ / self.hits_ if self.hits_ > 0 else 0.0,
+            'max_match_error': self.match_error_max_,
+        }
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""
+DepthRecorderNode
+
+Records the depth images, their camera intrinsics and the YOLO detections in the format of smart_track.depth_recording,
+for offline profiling and tests (see benchmark/bench_pipeline.py --input).
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import numpy as np
+import rclpy
+from rclpy.node import Node
+from sensor_msgs.msg import Image, CameraInfo
+from cv_bridge import CvBridge
+from yolov8_msgs.msg import DetectionArray
+
+from .camera_model import PinholeCamera
+from .depth_recording import DepthRecordingWriter
+
+
+class DepthRecorderNode(Node):
+
+    def __init__(self):
+        super().__init__("depth_recorder_node")
+        self.cv_bridge_ = CvBridge()
+
+        self.declare_parameters(
+            namespace='',
+            parameters=[
+                ('output_path', 'depth_recording'),
+                ('storage_dtype', 'float32'),
+                ('depth_scale_factor', 1.0),
+                ('record_detections', True),
+                ('max_frames', 0),
+            ]
+        )
+        # Base path of the recording files (<output_path>.json, .depth, .index, .detections)
+        self.output_path_ = self.get_parameter('output_path').value
+        # 'float32', or 'float16' for half the size
+        self.storage_dtype_ = self.get_parameter('storage_dtype').value
+        # Depth values are multiplied by this factor to get meters (e.g. 0.001 for 16UC1 images in mm)
+        self.depth_scale_factor_ = self.get_parameter('depth_scale_factor').value
+        # Stop recording after this many frames (0 = no limit)
+        self.max_frames_ = self.get_parameter('max_frames').value
+
+        # Created on the first frame, when the frame size is known
+        self.writer_ = None
+        self.camera_model_ = None
+
+        self.image_sub_ = self.create_subscription(Image, "observer/depth_image", self.imageCallback, 10)
+        self.caminfo_sub_ = self.create_subscription(CameraInfo, 'observer/camera_info', self.caminfoCallback, 10)
+        self.detections_sub_ = None
+        if self.get_parameter('record_detections').value:
+            self.detections_sub_ = self.create_subscription(DetectionArray, "detections", self.detectionsCallback, 10)
+
+    def caminfoCallback(self, msg: CameraInfo):
+        if self.camera_model_ is not None and self.camera_model_.matches(msg):
+            return
+        camera_model = PinholeCamera.from_camera_info(msg)
+        if camera_model is None:
+            self.get_logger().warn("Invalid camera info received.", throttle_duration_sec=5)
+            return
+        self.camera_model_ = camera_model
+
+    def imageCallback(self, msg: Image):
+        if self.camera_model_ is None:
+            self.get_logger().warn("No camera info yet. Skipping the frame", throttle_duration_sec=5)
+            return
+        if self.max_frames_ > 0 and self.writer_ is not None and self.writer_.frames_ >= self.max_frames_:
+            return
+        try:
+            cv_image = self.cv_bridge_.imgmsg_to_cv2(msg, desired_encoding="passthrough")
+        except Exception as e:
+            self.get_logger().error("ros_to_cv conversion error {}".format(e))
+            return
+        depth = np.asarray(cv_image, dtype=np.float32)
+        if self.depth_scale_factor_ != 1.0:
+            depth = depth * np.float32(self.depth_scale_factor_)
+
+        if self.writer_ is None:
+            self.writer_ = DepthRecordingWriter(self.output_path_, depth.shape[1], depth.shape[0], self.storage_dtype_, msg.header.frame_id)
+            self.get_logger().info("Recording {}x{} {} frames to {}".format(depth.shape[1], depth.shape[0], self.storage_dtype_, self.output_path_))
+        try:
+            self.writer_.write_frame(rclpy.time.Time.from_msg(msg.header.stamp).nanoseconds, depth, self.camera_model_)
+        except ValueError as e:
+            self.get_logger().error("Could not record the frame: {}".format(e), throttle_duration_sec=5)
+            return
+        self.get_logger().info("Recorded {} frames, {} detections".format(self.writer_.frames_, self.writer_.detections_),
+                               throttle_duration_sec=5)
+
+    def detectionsCallback(self, msg: DetectionArray):
+        if self.writer_ is None:
+            return
+        boxes = [(d.bbox.center.position.x, d.bbox.center.position.y, d.bbox.size.x, d.bbox.size.y, d.score, d.class_id)
+                 for d in msg.detections]
+        self.writer_.write_detections(rclpy.time.Time.from_msg(msg.header.stamp).nanoseconds, boxes)
+
+    def close(self):
+        if self.writer_ is not None:
+            self.writer_.close()
+            self.writer_ = None
+
+
+def main(args=None):
+    rclpy.init(args=args)
+    depth_recorder_node = DepthRecorderNode()
+    depth_recorder_node.get_logger().info("Depth recorder node has started")
+    try:
+        rclpy.spin(depth_recorder_node)
+    finally:
+        depth_recorder_node.close()
+    depth_recorder_node.destroy_node()
+    rclpy.shutdown()
+
+if __name__ == "__main__":
+    main()
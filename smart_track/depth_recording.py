@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+"""
+DepthRecording
+
+Compact recording of depth frames, camera intrinsics and detections, for offline profiling without rosbag.
+A recording is a set of files with a common base path:
+    <path>.json        width, height, storage dtype and frame id
+    <path>.depth       frames, back to back, with a fixed stride of width * height * itemsize (float16 or float32, meters)
+    <path>.index       one record per frame: stamp [ns] and intrinsics (fx, fy, cx, cy)
+    <path>.detections  one record per detection: stamp [ns] of its message, bounding box center and size [px], score, class id
+
+All the files are appended frame by frame, so a recording that was interrupted can still be read (up to its last complete frame).
+DepthRecording memory-maps the files. Frames are zero-copy read-only views, with random access by index or by stamp.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .camera_model import PinholeCamera
+
+VERSION = 1
+INDEX_DTYPE = np.dtype([('stamp_ns', np.int64), ('fx', np.float64), ('fy', np.float64), ('cx', np.float64), ('cy', np.float64)])
+DETECTION_DTYPE = np.dtype([('stamp_ns', np.int64), ('cx', np.float32), ('cy', np.float32), ('w', np.float32), ('h', np.float32),
+                            ('score', np.float32), ('class_id', np.int32)])
+
+
+class DepthRecordingWriter:
+
+    def __init__(self, path, width, height, dtype='float32', frame_id=''):
+        """
+        @param path: Base path of the recording files. Existing files are overwritten
+        @param width, height: Frame size [px]
+        @param dtype: Storage type of the depths, 'float32' or 'float16' (half the size, about 1 cm resolution at 10 m)
+        @param frame_id: Camera frame
+        """
+        if dtype not in ('float32', 'float16'):
+            raise ValueError("dtype must be 'float32' or 'float16', not '{}'".format(dtype))
+        self.width_ = width
+        self.height_ = height
+        self.dtype_ = np.dtype(dtype)
+        self.frames_ = 0
+        self.detections_ = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path + '.json', 'w') as f:
+            json.dump({'version': VERSION, 'width': width, 'height': height, 'dtype': dtype, 'frame_id': frame_id}, f)
+        self.depth_file_ = open(path + '.depth', 'wb')
+        self.index_file_ = open(path + '.index', 'wb')
+        self.detections_file_ = open(path + '.detections', 'wb')
+
+    def write_frame(self, stamp_ns, image, camera):
+        """
+        @param stamp_ns: Frame stamp [ns]
+        @param image: HxW depth image [m]. NaN/inf are kept
+        @param camera: PinholeCamera of the frame
+        """
+        if image.shape != (self.height_, self.width_):
+            raise ValueError('Frame of shape {} in a {}x{} recording'.format(image.shape, self.height_, self.width_))
+        self.depth_file_.write(np.ascontiguousarray(image, dtype=self.dtype_).data)
+        record = np.array((stamp_ns, camera.fx_, camera.fy_, camera.cx_, camera.cy_), dtype=INDEX_DTYPE)
+        # Written after the frame, so a complete index record always has its frame
+        self.index_file_.write(record.tobytes())
+        self.frames_ += 1
+
+    def write_detections(self, stamp_ns, boxes):
+        """
+        @param stamp_ns: Stamp of the detections message [ns]
+        @param boxes: Iterable of (cx, cy, w, h, score, class_id)
+        """
+        records = np.array([(stamp_ns,) + tuple(box) for box in boxes], dtype=DETECTION_DTYPE)
+        self.detections_file_.write(records.tobytes())
+        self.detections_ += len(records)
+
+    def close(self):
+        for f in (self.depth_file_, self.index_file_, self.detections_file_):
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DepthRecording:
+
+    def __init__(self, path):
+        """
+        @param path: Base path of the recording files
+        """
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        if meta['version'] != VERSION:
+            raise ValueError('Unsupported recording version {}'.format(meta['version']))
+        self.width_ = meta['width']
+        self.height_ = meta['height']
+        self.dtype_ = np.dtype(meta['dtype'])
+        self.frame_id_ = meta['frame_id']
+
+        # Only the complete frames that have an index record
+        frame_bytes = self.width_ * self.height_ * self.dtype_.itemsize
+        n = min(os.path.getsize(path + '.depth') // frame_bytes, os.path.getsize(path + '.index') // INDEX_DTYPE.itemsize)
+        self.frames_ = self.map(path + '.depth', self.dtype_, (n, self.height_, self.width_))
+        self.index_ = self.map(path + '.index', INDEX_DTYPE, (n,))
+        n_detections = os.path.getsize(path + '.detections') // DETECTION_DTYPE.itemsize
+        self.detections_ = self.map(path + '.detections', DETECTION_DTYPE, (n_detections,))
+        # Detections sorted by stamp, for detections_at()
+        self.detections_ = self.detections_[np.argsort(self.detections_['stamp_ns'], kind='stable')]
+        self.stamps_ = np.asarray(self.index_['stamp_ns'])
+        self.sorted_ = bool(np.all(np.diff(self.stamps_) >= 0))
+        self.order_ = None if self.sorted_ else np.argsort(self.stamps_, kind='stable')
+
+    @staticmethod
+    def map(filename, dtype, shape):
+        if shape[0] == 0:
+            # An empty file cannot be memory-mapped
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(filename, dtype=dtype, mode='r', shape=shape)
+
+    def __len__(self):
+        return len(self.frames_)
+
+    def frame(self, i):
+        """
+        @return Read-only view of frame i, in the storage dtype. No data is read before it is accessed
+        """
+        return self.frames_[i]
+
+    def stamp(self, i):
+        """
+        @return Stamp of frame i [ns]
+        """
+        return int(self.stamps_[i])
+
+    def camera(self, i):
+        """
+        @return PinholeCamera of frame i
+        """
+        record = self.index_[i]
+        return PinholeCamera(float(record['fx']), float(record['fy']), float(record['cx']), float(record['cy']), self.width_, self.height_)
+
+    def find(self, stamp_ns, slop_ns=0):
+        """
+        @param stamp_ns: Stamp [ns]
+        @param slop_ns: Maximum stamp difference [ns]
+        @return Index of the frame nearest to stamp_ns, or None if it is further than slop_ns
+        """
+        if len(self.stamps_) == 0:
+            return None
+        stamps = self.stamps_ if self.sorted_ else self.stamps_[self.order_]
+        j = int(np.searchsorted(stamps, stamp_ns))
+        candidates = [k for k in (j - 1, j) if 0 <= k < len(stamps)]
+        k = min(candidates, key=lambda k: abs(int(stamps[k]) - stamp_ns))
+        if abs(int(stamps[k]) - stamp_ns) > slop_ns:
+            return None
+        return k if self.sorted_ else int(self.order_[k])
+
+    def detections_at(self, stamp_ns):
+        """
+        @return Detection records (DETECTION_DTYPE) of the detections message with this stamp
+        """
+        stamps = self.detections_['stamp_ns']
+        return self.detections_[np.searchsorted(stamps, stamp_ns, 'left'):np.searchsorted(stamps, stamp_ns, 'right')]
+
+    def __iter__(self):
+        """
+        Iterates over (stamp [ns], frame view)
+        """
+        for i in range(len(self)):
+            yield int(self.stamps_[i]), self.frames_[i]
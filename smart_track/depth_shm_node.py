@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""
+DepthShmNode
+
+Copies each depth image into a shared memory frame ring (smart_track.shm_ring) once, and publishes its header
+on a small index topic. Nodes on the same machine with depth_transport 'shm' read the frames from the ring,
+instead of each deserializing its own copy of the image.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import rclpy
+from rclpy.node import Node
+from sensor_msgs.msg import Image
+from std_msgs.msg import Header
+from cv_bridge import CvBridge
+
+from .shm_ring import ShmFrameRing
+
+
+class DepthShmNode(Node):
+
+    def __init__(self):
+        super().__init__("depth_shm_node")
+        self.cv_bridge_ = CvBridge()
+
+        self.declare_parameters(
+            namespace='',
+            parameters=[
+                ('shm_name', 'smart_track_depth'),
+                ('shm_slots', 8),
+                ('debug', False),
+            ]
+        )
+        self.shm_name_ = self.get_parameter('shm_name').value
+        # A frame stays readable until shm_slots - 1 newer frames are written
+        self.shm_slots_ = self.get_parameter('shm_slots').value
+        self.debug_ = self.get_parameter('debug').value
+
+        # Created on the first frame, when the frame size is known
+        self.ring_ = None
+
+        self.image_sub_ = self.create_subscription(Image, "observer/depth_image", self.imageCallback, 10)
+        self.index_pub_ = self.create_publisher(Header, "observer/depth_image/shm", 10)
+
+    def imageCallback(self, msg: Image):
+        try:
+            cv_image = self.cv_bridge_.imgmsg_to_cv2(msg, desired_encoding="passthrough")
+        except Exception as e:
+            self.get_logger().error("ros_to_cv conversion error {}".format(e))
+            return
+
+        if self.ring_ is None or cv_image.nbytes > self.ring_.slot_bytes_:
+            # The consumers attach again when they do not find a new stamp in the old segment
+            if self.ring_ is not None:
+                self.ring_.close()
+            self.ring_ = ShmFrameRing.create(self.shm_name_, self.shm_slots_, cv_image.nbytes)
+            self.get_logger().info("Created shared memory ring '{}': {} slots of {} bytes".format(
+                self.shm_name_, self.shm_slots_, cv_image.nbytes))
+
+        self.ring_.write(cv_image, msg.header.stamp.sec, msg.header.stamp.nanosec)
+        # Published after the write, so the frame is in the ring when the consumers receive its stamp
+        self.index_pub_.publish(msg.header)
+
+        if self.debug_:
+            self.get_logger().info("Frames written: {}".format(self.ring_.frames_written_), throttle_duration_sec=5)
+
+    def close(self):
+        """
+        Unlinks the shared memory segment.
+        """
+        if self.ring_ is not None:
+            self.ring_.close()
+            self.ring_ = None
+
+
+def main(args=None):
+    rclpy.init(args=args)
+    depth_shm_node = DepthShmNode()
+    depth_shm_node.get_logger().info("Depth shared memory node has started")
+    try:
+        rclpy.spin(depth_shm_node)
+    finally:
+        depth_shm_node.close()
+    depth_shm_node.destroy_node()
+    rclpy.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,10 @@ import cv2
 import math
 import time
 
+from .buffer_pool import BufferPool
+from .debug_log import RateLimitedLogger, RejectionLog
+from .overlay_renderer import draw_detection_marker
+
 class DroneDetector:
     def __init__(self,area_bounds: list[int],
                  circular_bounds: list[float],
@@ -13,9 +17,18 @@ class DroneDetector:
                  max_cam_depth: float,
                  depth_scale_factor: float,
                  depth_step: float,
-                 debug: bool):
-
-        self.camera_info_ = None
+                 debug: bool,
+                 grouping_mode: str = 'pairwise',
+                 pyramid_level: int = 0,
+                 slicing_mode: str = 'uniform',
+                 max_slices: int = 16,
+                 adaptive_bin_width: float = 0.25,
+                 rejection_log_size: int = 256,
+                 rejection_sample_period: int = 10,
+                 log_period: float = 1.0):
+
+        # PinholeCamera, set by the node from the camera info
+        self.camera_model_ = None
         """
         Contour constraints
         """
@@ -30,91 +43,283 @@ class DroneDetector:
         self.depth_scale_factor_ = depth_scale_factor # Scaling factor to make depth values in meters
         self.depth_step_ = depth_step
         self.debug_ = debug
+        # 'pairwise': compare every contour center with all the others (getValidDetections)
+        # 'grid': only compare centers in neighbouring cells of a d_group_max grid (getValidDetectionsGrid)
+        self.grouping_mode_ = grouping_mode
+        # Number of contours checked, and rejected by each stage of filterContours(). See resetRejectionCounts()
+        self.rejection_counts_ = {'contours': 0, 'area': 0, 'circularity': 0, 'convexity': 0}
+        # Sample of the rejected contours (one in rejection_sample_period), with their feature values. None if rejection_log_size is 0
+        self.rejection_log_ = RejectionLog(rejection_log_size, rejection_sample_period) if rejection_log_size > 0 else None
+        # Debug messages are formatted only when emitted, at most once per log_period seconds per message.
+        # The sink is a Python logger, replaced by the node logger in the nodes
+        self.log_ = RateLimitedLogger(period=log_period)
+        self.frame_count_ = 0
+        # Scratch buffer for the per-contour depth masks. See getScratchMask()
+        self.scratch_mask_ = np.zeros((0, 0), np.uint8)
+        # Working buffers reused across frames (normalize, erode, threshold, masks). Resized when the image resolution changes
+        self.buffer_pool_ = BufferPool()
+        # Radii of the detections returned by the last preProcessing() call
+        self.last_radii_ = []
+        # (min, max) depth [m] of the image of the last preProcessing() call
+        self.last_depth_range_ = (0.0, 0.0)
+
+        # 'uniform': depth thresholds evenly spaced between the min and max depth of the frame
+        # 'adaptive': thresholds placed after the modes of the depth histogram, at most max_slices per frame and never more than 'uniform' (getAdaptiveDepthThresholds)
+        self.slicing_mode_ = slicing_mode
+        self.max_slices_ = max_slices
+        self.adaptive_bin_width_ = adaptive_bin_width # [m] Histogram bin width, and spacing of the adaptive thresholds
+
+        # Coarse-to-fine mode: segmentation and grouping run on the depth image downsampled by 2^pyramid_level,
+        # then each detection is refined on the full-resolution image (refineDetections)
+        self.pyramid_level_ = max(0, int(pyramid_level))
+        self.pyramid_scale_ = 2**self.pyramid_level_
+        self.refine_depth_tolerance_ = 0.5 # [m] Pixels within this distance from the min depth are used to refine the center
+        # Pixel-based parameters at the processing resolution
+        self.level_area_bounds_ = [self.area_bounds_[0] / self.pyramid_scale_**2, self.area_bounds_[1] / self.pyramid_scale_**2]
+        self.level_d_group_max_ = self.d_group_max_ / self.pyramid_scale_
+        kernel_size = max(1, int(round(15 / self.pyramid_scale_)))
+        if kernel_size % 2 == 0:
+            kernel_size += 1
+        self.erode_kernel_ = np.ones((kernel_size,kernel_size),np.uint8)
 
     def depthTo3D(self, detections, depths):
         """
         @brief Computes 3D projections of detections in the camera frame (+X-right, +y-down, +Z-outward)
         @param detections : xy coordinates in 2D camera frame
         @param depths : Depths of detections in meters in camerra frame
-        @return positions : 3D projections in camera frame
+        @return positions : Nx3 array of 3D projections in camera frame
         """
-        positions = []
-        if self.camera_info_ is None:
-            print("Camera intrinsic parameters are not available. Skipping 3D projections.")
-            return positions
-
-        fx = self.camera_info_['fx']
-        fy = self.camera_info_['fy']
-        cx = self.camera_info_['cx']
-        cy = self.camera_info_['cy']
-        for i in range(len(detections)):
-            u = detections[i][1] # horizontal image coordinate
-            v = detections[i][0] # vertical image coordinate
-            d = depths[i] # depth
-
-            x = d*(u-cx)/fx
-            y = d*(v-cy)/fy
+        if self.camera_model_ is None:
+            self.log_.warning('depthTo3D', "Camera intrinsic parameters are not available. Skipping 3D projections.")
+            return []
+        if len(detections) == 0:
+            return np.empty((0, 3))
 
-            p = [x,y,d]
-            positions.append(p)
-
-        return positions
+        # detections are [row, col], i.e. [v, u]
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 2)
+        return self.camera_model_.backproject(detections[:, 1], detections[:, 0], depths)
 
     def preProcessing(self, img):
         """
         Pre-process input depth image.
         Finds list of contours (and their features) of a set of thresholded binary images.
 
-        @param img: depth image
-        @return valid_contours_list: List of valid contours in different thresholded images.
-        @return contours_depths_list: List of depth values of each contour, for different thresholded images.
-        @return contours_centers_list: List of each contour center, for different thresholded images.
+        @param img: depth image. Its NaN/inf values are replaced in place
+        @return valid_detections: List of detection centers [row, col], in full-frame pixels
+        @return valid_depths: List of detection depths
+        @return img: The input image, with the NaN/inf values replaced. Nothing is drawn on it: the detection markers are
+            drawn on a copy by the overlay renderer (smart_track.overlay_renderer), from the detections and self.last_radii_
+        The detection radii are kept in self.last_radii_, and the depth thresholds range in self.last_depth_range_.
         """
         t1 = time.time()
+        self.frame_count_ += 1
         if self.debug_:
-            print("[preProcessing] Type of img:", type(img))
-        img[np.isnan(img)] = self.max_cam_depth_ # Remove NaN values with the maximum distance provided by the camera
-        img[np.isinf(img)] = self.max_cam_depth_
+            self.log_.debug('preProcessing.type', '[preProcessing] Type of img: {}', type(img))
+        self.buffer_pool_.begin_frame(img.shape)
+        # Remove NaN/inf values with the maximum distance provided by the camera
+        invalid = self.buffer_pool_.get('invalid', bool, img.shape)
+        np.isfinite(img, out=invalid)
+        np.logical_not(invalid, out=invalid)
+        np.copyto(img, self.max_cam_depth_, where=invalid)
+        full_img = img
+        if self.pyramid_level_ > 0:
+            img = self.downsample(full_img)
         max_depth_meter = img.max() * self.depth_scale_factor_
         min_depth_meter = img.min() * self.depth_scale_factor_
 
         if self.debug_:
-            print( '[preProcessing] Max depth= {} Min depth = {}'.format( max_depth_meter, min_depth_meter) )
+            self.log_.info('preProcessing.depth', '[preProcessing] Max depth= {} Min depth = {}', max_depth_meter, min_depth_meter)
 
         # Normalize depth values
-        norm_img = cv2.normalize(img, None, 0, 1, cv2.NORM_MINMAX)
+        norm_img = cv2.normalize(img, self.buffer_pool_.get('norm', img.dtype, img.shape), 0, 1, cv2.NORM_MINMAX)
 
         # Erosion
         eroded_img = self.erode(norm_img)
 
-        thr_img_list = [] # List of all thresholded images
-        imgs_cnt_list = [] # List of contours in each image
+        # List of depth thresholds [ meters]
+        if self.slicing_mode_ == 'adaptive':
+            depth_range = self.getAdaptiveDepthThresholds(img, min_depth_meter, max_depth_meter)
+        else:
+            depth_range = np.linspace(min_depth_meter+1.0, max_depth_meter, math.floor((max_depth_meter-min_depth_meter+1/self.depth_step_)))
+
+        contours_centers_list, contours_depths_list, contours_radii_list = self.segmentMultiPass(img, norm_img, eroded_img, depth_range, min_depth_meter, max_depth_meter)
+
+        # Extract valid detections
+        valid_detections = []
+        valid_depths = []
+        valid_radii = []
+        if len(contours_centers_list) > 0 :
+            if self.grouping_mode_ == 'grid':
+                valid_detections, valid_depths, valid_radii = self.getValidDetectionsGrid(contours_centers_list, contours_depths_list, contours_radii_list)
+            else:
+                valid_detections, valid_depths, valid_radii = self.getValidDetections(contours_centers_list, contours_depths_list, contours_radii_list)
+            if self.debug_:
+                self.log_.info('preProcessing.detections', '[preProcessing] Number of valid detections = {}, centers = {}, depths = {}',
+                               len(valid_detections), valid_detections, valid_depths)
+        else:
+            if self.debug_:
+                self.log_.info('preProcessing.detections', '[preProcessing] No contours found!')
+
+        if self.pyramid_level_ > 0:
+            img = full_img
+            valid_detections, valid_depths, valid_radii = self.refineDetections(img, valid_detections, valid_radii)
+        self.last_radii_ = valid_radii
+
+        self.buffer_pool_.end_frame()
+        dt = time.time() - t1
+        if self.debug_:
+            self.log_.info('preProcessing.time', '[preProcessing] Detection extraction time = {}, working-set bytes = {}, peak = {}',
+                           dt, self.buffer_pool_.frame_bytes_, self.buffer_pool_.peak_frame_bytes_)
+
+            #cv2.imshow("Thresholded image window: depth = " + str(depth), thr_img)
+
+        self.last_depth_range_ = (min_depth_meter, max_depth_meter)
+
+        return valid_detections, valid_depths, img
+
+    def getAdaptiveDepthThresholds(self, img, min_depth_meter, max_depth_meter):
+        """
+        @brief Places depth thresholds where the frame has content, instead of uniformly between its min and max depth.
+        A depth histogram (adaptive_bin_width bins) is built on a 4x subsampled frame. Its modes are the local maxima
+        that stand out of the local median by at least the minimum contour area in pixels, so a smooth surface such as
+        the floor does not produce any. Each mode gets min_group_size thresholds, starting at the far edge of its bin
+        and spaced by adaptive_bin_width, so an object in front of the next surface still shows up in enough slices
+        to form a valid group. Thresholds are kept as bin edge indices, so overlapping modes share them.
+        Modes are taken smallest first, as a drone is a small surface, until the number of thresholds would exceed
+        max_slices or the number of uniform thresholds, so adaptive slicing never costs more than uniform slicing.
+
+        @param img: Depth image (NaN/inf already removed)
+        @param min_depth_meter: Minimum depth in the image
+        @param max_depth_meter: Maximum depth in the image
+
+        @return depth_range: Sorted depth thresholds in meters
+        """
+        depth_span = max_depth_meter - min_depth_meter
+        n_uniform = math.floor((max_depth_meter-min_depth_meter+1/self.depth_step_))
+        max_slices = min(self.max_slices_, n_uniform)
+        if depth_span <= 0 or max_slices < 1:
+            return np.empty(0)
+
+        n_bins = max(1, int(math.ceil(depth_span / self.adaptive_bin_width_)))
+        bin_width = depth_span / n_bins
+        step = 4
+        hist = cv2.calcHist([img[::step, ::step].astype(np.float32, copy=False)], [0], None, [n_bins],
+                            [float(min_depth_meter / self.depth_scale_factor_), float(max_depth_meter / self.depth_scale_factor_) + 1e-6]).ravel()
+        hist *= step * step
+
+        # Local maxima of the histogram, with their height above the local median
+        slices_per_mode = max(1, self.min_group_size_)
+        windows = np.lib.stride_tricks.sliding_window_view(np.pad(hist, slices_per_mode), 2 * slices_per_mode + 1)
+        prominence = hist - np.median(windows, axis=1)
+        padded = np.concatenate(([-1.0], hist, [-1.0]))
+        is_mode = (hist > padded[:-2]) & (hist >= padded[2:]) & (prominence >= self.level_area_bounds_[0])
+        modes = np.flatnonzero(is_mode)
+        modes = modes[np.argsort(prominence[modes], kind='stable')]
+
+        # A threshold at the max depth would keep the whole frame, so the last edge is n_bins - 1
+        edges = set()
+        for i in modes:
+            mode_edges = range(i + 1, min(i + 1 + slices_per_mode, n_bins))
+            if len(edges.union(mode_edges)) <= max_slices:
+                edges.update(mode_edges)
+
+        return min_depth_meter + np.array(sorted(edges)) * bin_width
+
+    def downsample(self, img):
+        """
+        @brief Downsamples the depth image by 2^pyramid_level.
+        Nearest-neighbor interpolation is used so that no new depth values are created at object edges.
+        """
+        h, w = img.shape[:2]
+        s = self.pyramid_scale_
+        small = self.buffer_pool_.get('pyramid', img.dtype, (h // s, w // s))
+        return cv2.resize(img, (w // s, h // s), dst=small, interpolation=cv2.INTER_NEAREST)
+
+    def refineDetections(self, img, detections, radii):
+        """
+        @brief Maps detections found on the downsampled image back to full resolution,
+        and refines their center and min depth on the full-resolution crop around each detection
+
+        @param img: Full-resolution depth image in meters
+        @param detections: Detection centers [row, col] at the downsampled resolution
+        @param radii: Detection radii at the downsampled resolution
+
+        @return refined_detections: Centers [row, col] at full resolution
+        @return refined_depths: Min depths in the full-resolution crops
+        @return refined_radii: Radii at full resolution
+        """
+        refined_detections = []
+        refined_depths = []
+        refined_radii = []
+        h, w = img.shape[:2]
+        s = self.pyramid_scale_
+        for center, radius in zip(detections, radii):
+            row, col = center[0] * s, center[1] * s
+            r = max(radius * s, s)
+            y0, y1 = max(0, int(row - r)), min(h, int(row + r) + 1)
+            x0, x1 = max(0, int(col - r)), min(w, int(col + r) + 1)
+            crop = img[y0:y1, x0:x1]
+            if crop.size == 0:
+                continue
+
+            depth = float(crop.min())
+            # Center of the pixels that belong to the nearest surface in the crop
+            ys, xs = np.nonzero(crop <= depth + self.refine_depth_tolerance_)
+            refined_detections.append(np.array([y0 + ys.mean(), x0 + xs.mean()]))
+            refined_depths.append(depth)
+            refined_radii.append(r)
+
+        return refined_detections, refined_depths, refined_radii
+
+    def detectionAgreement(self, reference_detections, detections, max_dist=None):
+        """
+        @brief Fraction of reference detections that have a detection within max_dist pixels
+
+        @param reference_detections: Reference centers [row, col], e.g. from a full-resolution detector
+        @param detections: Centers [row, col] to evaluate
+        @param max_dist: Matching distance in pixels. Defaults to d_group_max
+
+        @return agreement: Matched fraction of reference_detections (1.0 if both lists are empty)
+        """
+        if max_dist is None:
+            max_dist = self.d_group_max_
+        if len(reference_detections) == 0:
+            return 1.0 if len(detections) == 0 else 0.0
+        if len(detections) == 0:
+            return 0.0
+
+        ref = np.asarray(reference_detections, dtype=np.float64).reshape(-1, 2)
+        det = np.asarray(detections, dtype=np.float64).reshape(-1, 2)
+        dist = np.linalg.norm(ref[:, None, :] - det[None, :, :], axis=2)
+        return float(np.mean(dist.min(axis=1) <= max_dist))
+
+    def segmentMultiPass(self, img, norm_img, eroded_img, depth_range, min_depth_meter, max_depth_meter):
+        """
+        @brief Thresholds the eroded image once per depth level, and extracts the valid contours of each thresholded image
+
+        @param img: Depth image in meters (NaN/inf already removed)
+        @param norm_img: Normalized depth image
+        @param eroded_img: Eroded normalized depth image
+        @param depth_range: Depth thresholds in meters
+        @param min_depth_meter: Minimum depth in the image
+        @param max_depth_meter: Maximum depth in the image
+
+        @return contours_centers_list: List of each contour center, for different thresholded images.
+        @return contours_depths_list: List of depth values of each contour, for different thresholded images.
+        @return contours_radii_list: List of each contour radius, for different thresholded images.
+        """
         valid_contours_list = []
         contours_depths_list = [] # Each element is a list of depths of contours found in the corresponding image
         contours_centers_list = []
         contours_radii_list = []
-        imgs_cnt_features = [] # List of controus' features for each image
 
-        # Loop through list of depth thresholds [ meters]
-        min_threshold = int(min_depth_meter)+1
-        max_threshold = int(max_depth_meter)
-        # depth_range = range(min_threshold, max_threshold, self.depth_step_)
-        depth_range = np.linspace(min_depth_meter+1.0, max_depth_meter, math.floor((max_depth_meter-min_depth_meter+1/self.depth_step_)))
         for depth in depth_range:
             # convert depth in meters to normalized value for OpenCV processing
             normalized_d = self.linearMap(depth, [min_depth_meter, max_depth_meter], [0., 1.])
 
             # Apply thresholding to the eroded image
-            thr_img = self.thresholding(eroded_img, normalized_d)
-            not_eroded_thr_img = self.thresholding(norm_img, normalized_d)
-            thr_img_list.append(thr_img)
-
-            # Extract contours and their features from the thresholded image
-            #contours, cnt_features = self.getContours(thr_img)
-
-
-            #imgs_cnt_list.append(contours)
-            #imgs_cnt_features.append(cnt_features)
+            thr_img = self.thresholding(eroded_img, normalized_d, self.buffer_pool_.get('thr', eroded_img.dtype, eroded_img.shape))
+            not_eroded_thr_img = self.thresholding(norm_img, normalized_d, self.buffer_pool_.get('not_eroded_thr', norm_img.dtype, norm_img.shape))
 
             # Find valid contours
             valid_contours, contours_depths, contours_centers, contours_radii = self.getValidContours2(thr_img, img, not_eroded_thr_img)
@@ -123,67 +328,8 @@ class DroneDetector:
                 contours_depths_list.append(contours_depths)
                 contours_centers_list.append(contours_centers)
                 contours_radii_list.append(contours_radii)
-                
-            # else:
-            #     print("No valid contours found at depth {}".format(depth))
-        # print("Number of valid contours lists: {}".format(len(valid_contours_list)))
 
-        # Extract valid detections
-        valid_detections = []
-        valid_depths = []
-        valid_radii = []
-        if len(contours_centers_list) > 0 :
-            valid_detections, valid_depths, valid_radii = self.getValidDetections(contours_centers_list, contours_depths_list, contours_radii_list)
-            if self.debug_:
-                print('[preProcessing] Number of valid detections  = ', len(valid_detections))
-                print('[preProcessing] Centers of valid detections  = ', valid_detections)
-                print('[preProcessing] Depths of valid detections  = ', valid_depths)
-        else:
-            if self.debug_:
-                print('[preProcessing] No contours found!')
-
-        dt = time.time() - t1
-        if self.debug_:
-            print('[preProcessing] Detection extraction time = ', dt)
-
-            #cv2.imshow("Thresholded image window: depth = " + str(depth), thr_img)
-
-        
-        # Draw image with detections
-        font                   = cv2.FONT_HERSHEY_SIMPLEX
-        bottomLeftCornerOfText = (10,450)
-        fontScale              = 0.6
-        fontColor              = (0,0,255) # Red
-        fontThickness          = 1
-        lineType               = cv2.LINE_AA
-
-        # cv2.imshow("Depth image window", norm_img)
-
-        # cv2.imshow("Eroded image window", eroded_img)
-        # middle_idx = int(len(thr_img_list)/2)
-        # cv2.imshow("Thresholded image window", thr_img_list[middle_idx])
-
-        # Draw valid detections
-        backtorgb = img
-        if len(valid_detections) > 0:
-            # backtorgb = cv2.cvtColor(norm_img,cv2.COLOR_GRAY2RGB)
-            for i in range(len(valid_detections)):
-                center = valid_detections[i]
-            # for center in valid_detections:
-                backtorgb = self.drawDetectionMarker(backtorgb, center, valid_radii[i])
-                # backtorgb = cv2.circle(backtorgb,(center[1],center[0]), valid_radii[i], (0,0,255), 2)
-            backtorgb = cv2.putText(backtorgb,'Min Depth: {}, Max depth: {}'.format(min_depth_meter, max_depth_meter), 
-            bottomLeftCornerOfText, 
-            font, 
-            fontScale,
-            fontColor,
-            fontThickness,
-            lineType)
-            # if self.show_debug_images_:
-            #     cv2.imshow("Valid detections window: ", backtorgb)
-            #     cv2.waitKey(1)
-
-        return valid_detections, valid_depths, backtorgb
+        return contours_centers_list, contours_depths_list, contours_radii_list
 
     def getValidDetections(self, contours_centers, contours_depths_list, contours_radii_list):
         """
@@ -228,7 +374,7 @@ class DroneDetector:
                                     p1 = np.array(cnt1)
                                     p2 = np.array(cnt2)
                                     dist = np.linalg.norm(p1-p2)
-                                    if int(dist) <= self.d_group_max_: # compare distance between centers
+                                    if int(dist) <= self.level_d_group_max_: # compare distance between centers
                                         group.append(cnt2)
                                         group_depths.append(contours_depths_list[i2][j2])
                                         group_radii.append(contours_radii_list[i2][j2])
@@ -254,6 +400,66 @@ class DroneDetector:
 
         return detections, detections_depths, detections_radii
 
+    def getValidDetectionsGrid(self, contours_centers, contours_depths_list, contours_radii_list):
+        """
+        @brief Same grouping as getValidDetections(), in near-linear time.
+        Contour centers are hashed into a grid of (d_group_max + 1) pixel cells, so each seed contour
+        is only compared against the centers in its 3x3 cell neighbourhood instead of all the other centers.
+        Seeds are visited in the same order as in getValidDetections(), so both methods produce the same groups.
+
+        @param contours_centers : list of countours center in each thresholded image
+        @param contours_depths_list : Corresponding contours depths
+        @param contours_radii_list List of controus radii, at each depth
+
+        @return detections : List of centers of valid detections
+        @return detections_depths : List of detections depths
+        @return detections_radii : List of detections radii
+        """
+        detections = []
+        detections_depths = []
+        detections_radii = []
+
+        counts = [len(centers) for centers in contours_centers]
+        n = sum(counts)
+        if n == 0:
+            return detections, detections_depths, detections_radii
+
+        centers = np.array([c for centers in contours_centers for c in centers], dtype=np.float64).reshape(n, 2)
+        depths = np.array([d for depths in contours_depths_list for d in depths], dtype=np.float64)
+        radii = np.array([r for radii in contours_radii_list for r in radii], dtype=np.float64)
+        slice_idx = np.repeat(np.arange(len(counts)), counts)
+
+        # int(dist) <= d_group_max  <=>  dist < d_group_max + 1, so grouped centers are always in neighbouring cells
+        cell_size = self.level_d_group_max_ + 1
+        cells = np.floor(centers / cell_size).astype(np.int64)
+        grid = {}
+        for i, cell in enumerate(zip(cells[:, 0].tolist(), cells[:, 1].tolist())):
+            grid.setdefault(cell, []).append(i)
+
+        assigned = np.zeros(n, dtype=bool)
+        for i in range(n):
+            if assigned[i]:
+                continue
+            assigned[i] = True
+
+            row, col = cells[i]
+            neighbours = [j for dr in (-1, 0, 1) for dc in (-1, 0, 1) for j in grid.get((row + dr, col + dc), ())]
+            neighbours = np.sort(np.array(neighbours, dtype=np.intp))
+            # skip assigned contours, and contours at the same threshold level
+            neighbours = neighbours[~assigned[neighbours] & (slice_idx[neighbours] != slice_idx[i])]
+            diff = centers[neighbours] - centers[i]
+            dist = np.sqrt(np.sum(diff*diff, axis=1))
+            group = neighbours[np.floor(dist) <= self.level_d_group_max_]
+            assigned[group] = True
+
+            if len(group) + 1 >= self.min_group_size_:
+                detections.append((centers[i] + centers[group].sum(axis=0)) / (len(group) + 1))
+                detections_depths.append(min(depths[i], depths[group].min()) if len(group) > 0 else depths[i])
+                # As in getValidDetections(), the radius of the seed contour is not part of the average
+                detections_radii.append(radii[group].mean() if len(group) > 0 else radii[i])
+
+        return detections, detections_depths, detections_radii
+
     def getContours(self, img):
         contours, _ = cv2.findContours(img.astype(np.uint8), cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[-2:]
         # TODO: find valid contours in this method directly instead of using separate method getValidcontours() ????
@@ -297,28 +503,21 @@ class DroneDetector:
         @return valid_contours_radius Radii of valid contours
         """
         # contours, _ = cv2.findContours(binary_img.astype(np.uint8), cv2.RETR_TREE, cv2.CHAIN_APPROX_NONE)[-2:]
-        contours, _ = cv2.findContours(binary_img.astype(np.uint8), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[-2:]
-        
+        binary_u8 = self.buffer_pool_.get('contours_mask', np.uint8, binary_img.shape)
+        np.copyto(binary_u8, binary_img, casting='unsafe')
+        contours, _ = cv2.findContours(binary_u8, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[-2:]
+
         valid_contours = []
         valid_contours_depths = []
         valid_contours_centers = []
         valid_contours_radius = []
 
-        for cnt in contours:
+        # Area, circularity and convexity are checked in stages, so the depth and center are only computed for valid contours
+        for i in self.filterContours(contours):
+            cnt = contours[i]
             # Minimum enclosing circle
             (x,y),radius = cv2.minEnclosingCircle(cnt)
             radius = int(radius)
-            # Compute area
-            area = cv2.contourArea(cnt)
-            # perimeter
-            perimeter = cv2.arcLength(cnt,True)
-            # Circularity
-            circularity = 4.0*math.pi * area / perimeter**2
-            # Convexity (Solidity in OpenCV ?)
-            hull = cv2.convexHull(cnt)
-            hull_area = cv2.contourArea(hull)
-            solidity = float(area)/hull_area
-            convexity = solidity
             # Contour depth
             depth, coordinates = self.getContourDepth(cnt, orig_grayimg, not_eroded_thr_img)
             # Center
@@ -326,28 +525,83 @@ class DroneDetector:
             cx = int(M['m10']/M['m00'])
             cy = int(M['m01']/M['m00'])
             center = [cy, cx]
-            # center = [coordinates[1], coordinates[0]]
-            #depth = orig_grayimg[cx, cy]
-
-            isAreaValid = area >= self.area_bounds_[0] and area <= self.area_bounds_[1]
-            isCircValid = circularity >= self.circ_bounds_[0] and circularity <= self.circ_bounds_[1]
-            isConvValid = convexity >= self.conv_bounds_[0] and convexity <= self.conv_bounds_[1]
-
-            valid = isAreaValid and isCircValid and isConvValid
-            if valid:
-                valid_contours.append(cnt)
-                valid_contours_depths.append(depth)
-                valid_contours_centers.append(center)
-                valid_contours_radius.append(radius)
-            else:
-                if self.debug_:
-                    print('[getValidContours2] Area, circulariy, convexity contraints are not met')
-                    print(f'[getValidContours2] Area constraint is not satisfied: area={area} bounds={self.area_bounds_}' )
-                    print(f'Circularity constraint is not satisfied: circularity={circularity} bounds={self.circ_bounds_}' )
-                    print(f'Convexity constraint is not satisfied: convexity={convexity} bounds={self.conv_bounds_}')
+
+            valid_contours.append(cnt)
+            valid_contours_depths.append(depth)
+            valid_contours_centers.append(center)
+            valid_contours_radius.append(radius)
 
         return valid_contours, valid_contours_depths, valid_contours_centers, valid_contours_radius
 
+    def filterContours(self, contours):
+        """
+        @brief Staged area, circularity and convexity filter.
+        Each stage computes its feature in bulk only for the contours that survived the previous stages (area -> perimeter -> convex hull),
+        and adds the number of contours it rejects to self.rejection_counts_. A sample of the rejected contours is kept in self.rejection_log_
+
+        @param contours: List of contours
+
+        @return valid_idx: Indices of the contours that satisfy all the bounds
+        """
+        n = len(contours)
+        self.rejection_counts_['contours'] += n
+        if n == 0:
+            return np.empty(0, dtype=np.intp)
+
+        # Area
+        areas = np.fromiter((cv2.contourArea(cnt) for cnt in contours), dtype=np.float64, count=n)
+        valid_idx = np.flatnonzero((areas >= self.level_area_bounds_[0]) & (areas <= self.level_area_bounds_[1]))
+        self.rejection_counts_['area'] += n - len(valid_idx)
+        if len(valid_idx) < n:
+            if self.rejection_log_ is not None:
+                rejected = np.ones(n, bool)
+                rejected[valid_idx] = False
+                self.rejection_log_.add(self.frame_count_, 'area', areas[rejected], areas[rejected], self.level_area_bounds_)
+            if self.debug_:
+                self.log_.info('filterContours.area', '[filterContours] Area constraint is not satisfied by {} contours. bounds={}',
+                               n - len(valid_idx), self.level_area_bounds_)
+        if len(valid_idx) == 0:
+            return valid_idx
+
+        # Circularity
+        perimeters = np.fromiter((cv2.arcLength(contours[i], True) for i in valid_idx), dtype=np.float64, count=len(valid_idx))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            circularity = 4.0*math.pi * areas[valid_idx] / perimeters**2
+        is_valid = (circularity >= self.circ_bounds_[0]) & (circularity <= self.circ_bounds_[1])
+        self.rejection_counts_['circularity'] += len(valid_idx) - int(is_valid.sum())
+        if not is_valid.all():
+            if self.rejection_log_ is not None:
+                self.rejection_log_.add(self.frame_count_, 'circularity', circularity[~is_valid], areas[valid_idx[~is_valid]], self.circ_bounds_)
+            if self.debug_:
+                self.log_.info('filterContours.circularity', '[filterContours] Circularity constraint is not satisfied: circularity={} bounds={}',
+                               circularity[~is_valid], self.circ_bounds_)
+        valid_idx = valid_idx[is_valid]
+        if len(valid_idx) == 0:
+            return valid_idx
+
+        # Convexity (Solidity in OpenCV ?)
+        hull_areas = np.fromiter((cv2.contourArea(cv2.convexHull(contours[i])) for i in valid_idx), dtype=np.float64, count=len(valid_idx))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            convexity = areas[valid_idx] / hull_areas
+        is_valid = (convexity >= self.conv_bounds_[0]) & (convexity <= self.conv_bounds_[1])
+        self.rejection_counts_['convexity'] += len(valid_idx) - int(is_valid.sum())
+        if not is_valid.all():
+            if self.rejection_log_ is not None:
+                self.rejection_log_.add(self.frame_count_, 'convexity', convexity[~is_valid], areas[valid_idx[~is_valid]], self.conv_bounds_)
+            if self.debug_:
+                self.log_.info('filterContours.convexity', '[filterContours] Convexity constraint is not satisfied: convexity={} bounds={}',
+                               convexity[~is_valid], self.conv_bounds_)
+
+        return valid_idx[is_valid]
+
+    def resetRejectionCounts(self):
+        """
+        @brief Resets the per-stage contour rejection counters and returns their previous values
+        """
+        counts = self.rejection_counts_
+        self.rejection_counts_ = {'contours': 0, 'area': 0, 'circularity': 0, 'convexity': 0}
+        return counts
+
     def getValidContours(self,contours, features):
         """
         @brief
@@ -376,58 +630,59 @@ class DroneDetector:
 
     def getContourDepth(self, cnt, img, not_eroded_thr_img):
         """
-        @brief Computes the average intensity of all pixels inside a contour
+        @brief Computes the minimum depth of the pixels inside the (non-eroded) contour found in the bounding box of cnt.
+        Only the bounding box crop is processed, using a reusable scratch mask, so the cost scales with the contour size instead of the image size.
 
-        @param img: Input image in gray scale
         @param cnt: Input contour
+        @param img: Input image in gray scale
+        @param not_eroded_thr_img: Thresholded image without erosion
 
-        @return cnt_depth: Contour depth in the same unit as the input image
+        @return min_val: Contour depth in the same unit as the input image
+        @return min_loc: (x, y) location of min_val in img
         """
-
-        # Get tighter contour
-        # M = cv2.moments(cnt)
-        # cx = int(M['m10']/M['m00'])
-        # cy = int(M['m01']/M['m00'])
         x,y,w,h = cv2.boundingRect(cnt)
 
-        # reduce size of bounding rectangle to focus more on the object pixels
-        # w=int(w/4)
-        # h=int(h/4)
-        # x = cx - w/2
-        # y = cy - h/2
-        # mask[y:y+h,x:x+w] = 255
-
-        mask = np.zeros(img.shape,np.uint8)
-        mask[y:y+h,x:x+w] = not_eroded_thr_img[y:y+h,x:x+w]
+        # The crop is padded with one zero pixel on each side, so findContours sees the same blobs as on a full-frame mask
+        # that is zero outside the bounding box
+        mask = self.getScratchMask(h+2, w+2)
+        mask[1:h+1, 1:w+1] = not_eroded_thr_img[y:y+h,x:x+w]
         contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[-2:]
 
-        mask = np.zeros(img.shape,np.uint8)
-        mask = cv2.drawContours(mask,contours,0,255,-1)
+        mask.fill(0)
+        cv2.drawContours(mask,contours,0,255,-1)
 
-        #cv2.imshow("Mask", mask)
-        #pixelpoints = np.transpose(np.nonzero(mask))
-        cnt_depth = cv2.mean(img,mask = mask)
-        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(img,mask = mask)
-        # return cnt_depth[0]
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(img[y:y+h,x:x+w], mask = mask[1:h+1, 1:w+1])
+        if min_loc[0] >= 0:
+            min_loc = (min_loc[0] + x, min_loc[1] + y)
         return min_val, min_loc
 
+    def getScratchMask(self, h, w):
+        """
+        @brief Returns a zeroed h x w uint8 view of a scratch buffer that is reused across calls, and only grows when a larger mask is needed
+        """
+        buf_h, buf_w = self.scratch_mask_.shape
+        if h > buf_h or w > buf_w:
+            self.scratch_mask_ = np.zeros((max(h, buf_h), max(w, buf_w)), np.uint8)
+        mask = self.scratch_mask_[:h, :w]
+        mask.fill(0)
+        return mask
+
     def erode(self, img):
-        kernel = np.ones((15,15),np.uint8)
-        erosion = cv2.erode(img,kernel,iterations = 1)
+        erosion = cv2.erode(img,self.erode_kernel_,dst=self.buffer_pool_.get('eroded', img.dtype, img.shape),iterations = 1)
         return erosion
 
-    def thresholding(self, img, thr):
+    def thresholding(self, img, thr, dst=None):
         t = thr
         # Sanity check on the threshold value
         if t < 0:
-            print(f'Image threshold value is  {t} < 0. Setting threshold to 0.')
+            self.log_.warning('thresholding', 'Image threshold value is {} < 0. Setting threshold to 0.', t)
             t = 0.0
 
         if t > 1:
-            print(f'Image threshold value {t} > 1. Setting threshold to 1.')
+            self.log_.warning('thresholding', 'Image threshold value {} > 1. Setting threshold to 1.', t)
             t = 1.0
 
-        _, threshold = cv2.threshold(img, t, 255, cv2.THRESH_BINARY_INV)
+        _, threshold = cv2.threshold(img, t, 255, cv2.THRESH_BINARY_INV, dst=dst)
         return threshold
 
     def linearMap(self, val, in_range, out_range):
@@ -457,31 +712,4 @@ class DroneDetector:
         --
         @return out_img Output image with marker drawn on target at center c
         """
-        r = int(r)
-        color = (0, 0, 255) # Red
-        thickness = 2
-        cx = int(c[1])
-        cy = int(c[0])
-        img = cv2.circle(in_img,(cx,cy), r, color, int(thickness))
-
-        # Line pointing to the right of the enclosing circle
-        start_point = (cx+int(r/2), cy)
-        end_point = (cx+int(r/2)+r, cy)
-        img = cv2.line(img, start_point, end_point, color, thickness)
-
-        # Line pointing to the left of the enclosing circle
-        start_point = (cx-int(r/2), cy)
-        end_point = (cx-int(r/2)-r, cy)
-        img = cv2.line(img, start_point, end_point, color, thickness)
-
-        # Line pointing to the top of the enclosing circle
-        start_point = (cx, cy-int(r/2))
-        end_point = (cx, cy-int(r/2)-r)
-        img = cv2.line(img, start_point, end_point, color, thickness)
-
-        # Line pointing to the bottom of the enclosing circle
-        start_point = (cx, cy+int(r/2))
-        end_point = (cx, cy+int(r/2)+r)
-        img = cv2.line(img, start_point, end_point, color, thickness)
-
-        return img
+        return draw_detection_marker(in_img, c, r)
@@ -1,19 +1,30 @@
 #!/usr/bin/env python3
+import json
 import numpy as np
-import math
+import time
 import rclpy
 from rclpy.node import Node
 from sensor_msgs.msg import Image, CameraInfo
+from std_msgs.msg import Header
 from cv_bridge import CvBridge
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+from example_interfaces.srv import Trigger
+from .camera_model import PinholeCamera
 from .detection import DroneDetector
+from .detector_pool import DetectorPool
+from .overlay_renderer import FORMATS as OVERLAY_FORMATS, OverlayRenderer
+from .pending_frames import PendingFrameQueue
+from .roi_gate import RoiGate
+from .shm_ring import ShmFrame, ShmFrameClient
+from .stage_timer import StageTimer
+from .tf_cache import TFCache
+from .transforms import TransformMatrixCache
 
 from tf2_ros import TransformException
 from tf2_ros.buffer import Buffer
 from tf2_ros.transform_listener import TransformListener
-from tf2_geometry_msgs import Pose as TF2Pose
 
-from geometry_msgs.msg import PoseArray, PointStamped, Pose, TransformStamped
-from tf2_geometry_msgs import do_transform_point, do_transform_pose
+from geometry_msgs.msg import PoseArray, TransformStamped
 
 class DepthCameraNode(Node):
 
@@ -38,6 +49,31 @@ class DepthCameraNode(Node):
                 ('show_debug_images', True),
                 ('publish_processed_images', True),
                 ('reference_frame', 'map'),
+                ('grouping_mode', 'pairwise'),
+                ('pyramid_level', 0),
+                ('pyramid_check_period', 0),
+                ('slicing_mode', 'uniform'),
+                ('max_slices', 16),
+                ('adaptive_bin_width', 0.25),
+                ('roi_gating', False),
+                ('roi_history', 5),
+                ('roi_margin', 40),
+                ('roi_full_scan_period', 10),
+                ('camera_mount_frame', ''),
+                ('tf_stamp_tolerance', 0.0),
+                ('tf_pending_max', 5),
+                ('tf_pending_timeout', 0.5),
+                ('detector_workers', 0),
+                ('detector_queue_size', 2),
+                ('depth_transport', 'topic'),
+                ('shm_name', 'smart_track_depth'),
+                ('stage_timing', True),
+                ('diagnostics_period', 5.0),
+                ('rejection_log_size', 256),
+                ('rejection_sample_period', 10),
+                ('overlay_format', 'raw'),
+                ('overlay_max_rate', 5.0),
+                ('overlay_scale', 1.0),
             ]
         )
 
@@ -54,6 +90,28 @@ class DepthCameraNode(Node):
         self.show_debug_images_ = self.get_parameter('show_debug_images').get_parameter_value().bool_value
         self.pub_processed_images_ =self.get_parameter('publish_processed_images').get_parameter_value().bool_value
         self.reference_frame_ =self.get_parameter('reference_frame').get_parameter_value().string_value
+        # Format of the detections image: 'raw' (32FC1 depth), 'bgr8' (8-bit visualization) or 'jpeg' (compressed 8-bit, on detections_image/compressed)
+        self.overlay_format_ = self.get_parameter('overlay_format').get_parameter_value().string_value
+        if self.overlay_format_ not in OVERLAY_FORMATS:
+            self.get_logger().warn("Unknown overlay_format '{}'. Using 'raw'".format(self.overlay_format_))
+            self.overlay_format_ = 'raw'
+        self.grouping_mode_ = self.get_parameter('grouping_mode').get_parameter_value().string_value
+        if self.grouping_mode_ not in ('pairwise', 'grid'):
+            self.get_logger().warn("Unknown grouping_mode '{}'. Using 'pairwise'".format(self.grouping_mode_))
+            self.grouping_mode_ = 'pairwise'
+        # Detection runs on the depth image downsampled by 2^pyramid_level (0 = full resolution)
+        self.pyramid_level_ = self.get_parameter('pyramid_level').get_parameter_value().integer_value
+        # Every pyramid_check_period frames, the full-resolution detector also runs to report speedup and agreement (0 = disabled)
+        self.pyramid_check_period_ = self.get_parameter('pyramid_check_period').get_parameter_value().integer_value
+        self.slicing_mode_ = self.get_parameter('slicing_mode').get_parameter_value().string_value
+        if self.slicing_mode_ not in ('uniform', 'adaptive'):
+            self.get_logger().warn("Unknown slicing_mode '{}'. Using 'uniform'".format(self.slicing_mode_))
+            self.slicing_mode_ = 'uniform'
+        self.max_slices_ = self.get_parameter('max_slices').get_parameter_value().integer_value
+        self.adaptive_bin_width_ = self.get_parameter('adaptive_bin_width').get_parameter_value().double_value
+        # Size of the ring of sampled contour rejections (0 = disabled), and sampling period (one rejected contour in rejection_sample_period)
+        self.rejection_log_size_ = self.get_parameter('rejection_log_size').get_parameter_value().integer_value
+        self.rejection_sample_period_ = self.get_parameter('rejection_sample_period').get_parameter_value().integer_value
 
         # Initiate class member 'detector'
         # TODO group all parameters into a dictionary before passing it to DroneDetector()
@@ -65,52 +123,333 @@ class DepthCameraNode(Node):
                                       self.max_cam_depth_,
                                       self.depth_scale_factor_,
                                       self.depth_step_ ,
-                                      self.debug_
+                                      self.debug_,
+                                      grouping_mode=self.grouping_mode_,
+                                      pyramid_level=self.pyramid_level_,
+                                      slicing_mode=self.slicing_mode_,
+                                      max_slices=self.max_slices_,
+                                      adaptive_bin_width=self.adaptive_bin_width_,
+                                      rejection_log_size=self.rejection_log_size_,
+                                      rejection_sample_period=self.rejection_sample_period_
                                       )
+        # Rate-limited debug messages of the detector go to the node logger
+        self.detector_.log_.sink_ = self.get_logger()
+        # Returns the sampled contour rejections as JSON. With detector_workers > 0, the detection runs in the workers and the ring stays empty
+        self.dump_rejections_srv_ = self.create_service(Trigger, 'dump_contour_rejections', self.dumpRejectionsCallback)
 
-        # Subscribe to image topic
-        self.image_sub_ = self.create_subscription(Image,"observer/depth_image",self.imageCallback,10)
+        # Full-resolution detector used as reference for the pyramid mode
+        self.reference_detector_ = None
+        if self.pyramid_level_ > 0 and self.pyramid_check_period_ > 0:
+            self.reference_detector_ = DroneDetector(self.area_bounds_,
+                                                     self.circ_bounds_,
+                                                     self.conv_bounds_,
+                                                     self.d_group_max_,
+                                                     self.min_group_size_,
+                                                     self.max_cam_depth_,
+                                                     self.depth_scale_factor_,
+                                                     self.depth_step_ ,
+                                                     False,
+                                                     grouping_mode=self.grouping_mode_,
+                                                     slicing_mode=self.slicing_mode_,
+                                                     max_slices=self.max_slices_,
+                                                     adaptive_bin_width=self.adaptive_bin_width_
+                                                     )
+        self.frame_count_ = 0
+
+        # Pool of detector worker processes (0 = detection in the node process)
+        self.detector_pool_ = None
+        detector_workers = self.get_parameter('detector_workers').get_parameter_value().integer_value
+        if detector_workers > 0:
+            if self.reference_detector_ is not None or self.get_parameter('roi_gating').get_parameter_value().bool_value:
+                self.get_logger().warn("pyramid_check_period and roi_gating need the detections of the previous frame. They are disabled with detector_workers > 0")
+                self.reference_detector_ = None
+            self.detector_pool_ = DetectorPool(detector_workers,
+                                               (self.area_bounds_, self.circ_bounds_, self.conv_bounds_, self.d_group_max_,
+                                                self.min_group_size_, self.max_cam_depth_, self.depth_scale_factor_, self.depth_step_, False),
+                                               dict(grouping_mode=self.grouping_mode_,
+                                                    pyramid_level=self.pyramid_level_,
+                                                    slicing_mode=self.slicing_mode_,
+                                                    max_slices=self.max_slices_,
+                                                    adaptive_bin_width=self.adaptive_bin_width_),
+                                               queue_size=self.get_parameter('detector_queue_size').get_parameter_value().integer_value,
+                                               # Set by detectorPoolTimerCallback() when an overlay is rendered
+                                               return_images=False)
+            self.pool_report_t_ = time.monotonic()
+            self.pool_timer_ = self.create_timer(0.005, self.detectorPoolTimerCallback)
+
+        # Temporal ROI gating: search only a window around the predicted target location
+        self.roi_gate_ = None
+        if self.get_parameter('roi_gating').get_parameter_value().bool_value and self.detector_pool_ is None:
+            self.roi_gate_ = RoiGate(self.get_parameter('roi_history').get_parameter_value().integer_value,
+                                     self.get_parameter('roi_margin').get_parameter_value().integer_value,
+                                     self.get_parameter('roi_full_scan_period').get_parameter_value().integer_value)
+
+        # Subscribe to image topic. With depth_transport 'shm', the images are read from the shared memory ring of depth_shm_node,
+        # and only their headers are received. With 'intra', perception_container calls imageCallback() with the images it receives
+        # once for all the nodes of its process
+        self.shm_client_ = None
+        self.image_sub_ = None
+        depth_transport = self.get_parameter('depth_transport').get_parameter_value().string_value
+        if depth_transport == 'shm':
+            self.shm_client_ = ShmFrameClient(self.get_parameter('shm_name').get_parameter_value().string_value)
+            self.image_sub_ = self.create_subscription(Header, "observer/depth_image/shm", self.shmIndexCallback, 10)
+        elif depth_transport != 'intra':
+            self.image_sub_ = self.create_subscription(Image,"observer/depth_image",self.imageCallback,10)
         # Subscribe to camera info topic
         self.caminfo_sub_ = self.create_subscription(CameraInfo, 'observer/camera_info', self.caminfoCallback, 10)
 
         # Publish detections positions
         self.detections_pub_ = self.create_publisher(PoseArray,'detections_poses',10)
-        # Publish image with overlayed detections
-        self.img_pub_ = self.create_publisher( Image,'detections_image',10)
+        # Publish image with overlayed detections. Only rendered when it has subscribers, at most overlay_max_rate times per second
+        self.overlay_ = OverlayRenderer(self, 'detections_image', self.overlay_format_,
+                                        max_rate=self.get_parameter('overlay_max_rate').get_parameter_value().double_value,
+                                        scale=self.get_parameter('overlay_scale').get_parameter_value().double_value,
+                                        max_depth=self.max_cam_depth_,
+                                        enabled=self.pub_processed_images_)
 
         # Ref: https://docs.ros.org/en/humble/Tutorials/Intermediate/Tf2/Writing-A-Tf2-Listener-Py.html
         self.tf_buffer_ = Buffer()
         self.tf_listener_ = TransformListener(self.tf_buffer_,self)
+        self.transform_cache_ = TransformMatrixCache()
+        # Frame the camera is rigidly mounted to (e.g. base_link). The static mount transform is looked up once. Empty disables it
+        self.camera_mount_frame_ = self.get_parameter('camera_mount_frame').get_parameter_value().string_value
+        self.tf_cache_ = TFCache(self.tf_buffer_, self.get_parameter('tf_stamp_tolerance').get_parameter_value().double_value)
+
+        # Frames whose transform is not available yet wait here, until the transform arrives or tf_pending_timeout expires
+        tf_pending_timeout = self.get_parameter('tf_pending_timeout').get_parameter_value().double_value
+        self.pending_frames_ = PendingFrameQueue(self.get_parameter('tf_pending_max').get_parameter_value().integer_value,
+                                                 tf_pending_timeout)
+        self.pending_timer_ = self.create_timer(max(0.01, min(0.1, tf_pending_timeout / 2)), self.pendingFramesTimerCallback)
+
+        # Latency histograms of the processing stages (arrival, tf_lookup, convert, detection, projection, transform, publish, end_to_end),
+        # published as a diagnostics status every diagnostics_period seconds, with the ROI gating statistics
+        self.stage_timer_ = StageTimer(self.get_parameter('stage_timing').get_parameter_value().bool_value)
+        if self.stage_timer_.enabled_ or self.roi_gate_ is not None:
+            self.diagnostics_pub_ = self.create_publisher(DiagnosticArray, '/diagnostics', 10)
+            self.diagnostics_timer_ = self.create_timer(self.get_parameter('diagnostics_period').get_parameter_value().double_value,
+                                                        self.diagnosticsTimerCallback)
+
+    def diagnosticsTimerCallback(self):
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = self.get_clock().now().to_msg()
+        if self.stage_timer_.enabled_:
+            diagnostics.status.append(self.stage_timer_.diagnostic_status('{}: stage latency'.format(self.get_name()), self.get_name()))
+        if self.roi_gate_ is not None:
+            gated_latency, full_latency = self.roi_gate_.mean_latency()
+            status = DiagnosticStatus(name='{}: ROI gating'.format(self.get_name()), hardware_id=self.get_name(),
+                                      level=DiagnosticStatus.OK, message='OK')
+            status.values = [KeyValue(key='gated_frames', value=str(self.roi_gate_.gated_frames_)),
+                             KeyValue(key='full_frames', value=str(self.roi_gate_.full_frames_)),
+                             KeyValue(key='gated_ratio', value='{:.2f}'.format(self.roi_gate_.gated_ratio())),
+                             KeyValue(key='gated/mean_ms', value='{:.3f}'.format(gated_latency * 1e3)),
+                             KeyValue(key='full/mean_ms', value='{:.3f}'.format(full_latency * 1e3))]
+            diagnostics.status.append(status)
+        self.diagnostics_pub_.publish(diagnostics)
+
+    def dumpRejectionsCallback(self, request, response):
+        """
+        @brief Returns the rejection counters and the sampled rejection records of the detector as JSON, and empties the ring
+        """
+        records = self.detector_.rejection_log_.dump(clear=True) if self.detector_.rejection_log_ is not None else []
+        response.success = True
+        response.message = json.dumps({'counts': self.detector_.rejection_counts_, 'records': records})
+        return response
+
+    def messageAge(self, msg: Image):
+        """
+        @return Time since the image stamp [s], in the clock of the node
+        """
+        return (self.get_clock().now().nanoseconds - rclpy.time.Time.from_msg(msg.header.stamp).nanoseconds) * 1e-9
+
+    def shmIndexCallback(self, header: Header):
+        frame = self.shm_client_.get(header)
+        if frame is None:
+            self.get_logger().warn("Depth frame {}.{:09d} is not in the shared memory ring. Dropping it".format(
+                header.stamp.sec, header.stamp.nanosec), throttle_duration_sec=5)
+            return
+        self.imageCallback(frame)
 
     def imageCallback(self, msg: Image):
-        
+        """
+        @param msg: Depth image, or ShmFrame with depth_transport 'shm'
+        """
+        if self.stage_timer_.enabled_:
+            self.stage_timer_.record('arrival', self.messageAge(msg))
+        t = time.perf_counter()
         try:
-            # Convert ROS Image message to OpenCV image
-            cv_image = self.cv_bridge_.imgmsg_to_cv2(msg, desired_encoding="32FC1")#"16UC1")
-        except Exception as e:
-            self.get_logger().error("ros_to_cv conversion error {}".format(e))
+            transform = self.lookupTransform(msg)
+        except TransformException:
+            # The transform at the image stamp is not available yet. The frame waits for it without blocking the executor
+            self.deferFrame(msg)
+            return
+        self.stage_timer_.record_since('tf_lookup', t)
+
+        self.processFrame(msg, transform)
+
+    def lookupTransform(self, msg: Image) -> TransformStamped:
+        """
+        @brief Transform from the image frame to the reference frame, at the image stamp. Does not wait for the transform.
+        @raise TransformException if the transform is not available
+        """
+        self.tf_cache_.add_static_link(msg.header.frame_id, self.camera_mount_frame_)
+        tf_time = rclpy.time.Time.from_msg(msg.header.stamp)
+        return self.tf_cache_.lookup(self.reference_frame_, msg.header.frame_id, tf_time.nanoseconds / 1e9, tf_time)
+
+    def deferFrame(self, msg: Image):
+        """
+        @brief Adds the frame to the pending queue, and completes it when its transform is available
+        """
+        future = self.tf_buffer_.wait_for_transform_async(self.reference_frame_, msg.header.frame_id,
+                                                          rclpy.time.Time.from_msg(msg.header.stamp))
+        key, dropped = self.pending_frames_.push(msg, time.monotonic(), future)
+        for _, dropped_future in dropped:
+            dropped_future.cancel()
+        if dropped:
+            self.get_logger().warn("Pending frame queue is full. Dropped {} frame(s) waiting for their transform".format(len(dropped)),
+                                   throttle_duration_sec=5)
+        # Called right away if the transform arrived in the meantime
+        future.add_done_callback(lambda f, key=key: self.transformReadyCallback(key, f))
+
+    def transformReadyCallback(self, key, future):
+        if future.cancelled():
+            return
+        msg = self.pending_frames_.pop(key)
+        if msg is None:
             return
-        
-        # self.get_logger().info("Max depth = {}. Min depth = {}".format( cv_image.max(), cv_image.min()))
-        
         try:
-            transform = self.tf_buffer_.lookup_transform(
-                self.reference_frame_,
-                msg.header.frame_id,
-                rclpy.time.Time(),
-                timeout=rclpy.duration.Duration(seconds=1.0))
+            transform = self.lookupTransform(msg)
         except TransformException as ex:
             self.get_logger().error(
                 f'Could not transform {self.reference_frame_} to {msg.header.frame_id}: {ex}')
             return
+        self.processFrame(msg, transform)
+
+    def pendingFramesTimerCallback(self):
+        for msg, future in self.pending_frames_.expire(time.monotonic()):
+            future.cancel()
+            self.get_logger().error(
+                f'Could not transform {self.reference_frame_} to {msg.header.frame_id} at the image stamp within {self.pending_frames_.timeout_} s. Dropping the frame',
+                throttle_duration_sec=1)
+        if self.debug_ and len(self.pending_frames_) > 0:
+            self.get_logger().info("Pending frames: {}".format(self.pending_frames_.stats()), throttle_duration_sec=5)
+
+    def processFrame(self, msg: Image, transform: TransformStamped):
+        """
+        @brief Detects the drones in the depth image msg, and publishes their positions in the reference frame
+        @param msg: Depth image
+        @param transform: Transform from the image frame to the reference frame, at the image stamp
+        """
+        t = time.perf_counter()
+        if isinstance(msg, ShmFrame):
+            # preProcessing() modifies its input, so the read-only view is copied
+            cv_image = np.array(msg.array, dtype=np.float32)
+            if not msg.valid():
+                # Overwritten while it waited for its transform, or during the copy
+                self.get_logger().warn("Depth frame was overwritten in the shared memory ring. Dropping it", throttle_duration_sec=5)
+                return
+        else:
+            try:
+                # Convert ROS Image message to OpenCV image
+                cv_image = self.cv_bridge_.imgmsg_to_cv2(msg, desired_encoding="32FC1")#"16UC1")
+            except Exception as e:
+                self.get_logger().error("ros_to_cv conversion error {}".format(e))
+                return
+        self.stage_timer_.record_since('convert', t)
+
+        # self.get_logger().info("Max depth = {}. Min depth = {}".format( cv_image.max(), cv_image.min()))
+
+        window = None
+        stamp = msg.header.stamp.sec + msg.header.stamp.nanosec * 1e-9
+
+        if self.detector_pool_ is not None:
+            # The result is published by detectorPoolTimerCallback()
+            self.detector_pool_.submit(stamp, cv_image, (msg, transform))
+            return
+
+        if self.roi_gate_ is not None:
+            window = self.roi_gate_.next_window(stamp, cv_image.shape)
+
+        self.frame_count_ += 1
+        check_pyramid = self.reference_detector_ is not None and window is None and self.frame_count_ % self.pyramid_check_period_ == 0
+        if check_pyramid:
+            # preProcessing() modifies its input
+            reference_image = cv_image.copy()
 
         try:            
             # Pre-process depth image and extracts contours and their features
-            valid_detections, valid_depths, detections_img = self.detector_.preProcessing(cv_image)
+            t1 = time.perf_counter()
+            if window is None:
+                valid_detections, valid_depths, detections_img = self.detector_.preProcessing(cv_image)
+            else:
+                y0, y1, x0, x1 = window
+                valid_detections, valid_depths, _ = self.detector_.preProcessing(cv_image[y0:y1, x0:x1])
+                valid_detections = [np.asarray(c) + (y0, x0) for c in valid_detections]
+                detections_img = cv_image
+            dt = time.perf_counter() - t1
         except Exception as e:
             self.get_logger().error("Error in preProcessing: {}".format(e))
             return
+        self.stage_timer_.record('detection', dt)
+
+        if check_pyramid:
+            self.checkPyramid(reference_image, valid_detections, dt)
+
+        if self.roi_gate_ is not None:
+            self.roi_gate_.update(stamp, valid_detections, self.detector_.last_radii_, window, dt)
+            if self.debug_:
+                # The same statistics are published on /diagnostics
+                gated_latency, full_latency = self.roi_gate_.mean_latency()
+                self.get_logger().info("ROI gating: gated/full ratio {:.2f}, mean latency gated {:.1f} ms, full {:.1f} ms".format(
+                    self.roi_gate_.gated_ratio(), gated_latency*1e3, full_latency*1e3), throttle_duration_sec=5)
+
+        if self.debug_:
+            # Cumulative number of contours rejected by each stage of DroneDetector.filterContours()
+            self.get_logger().info("Contour rejections: {}".format(self.detector_.rejection_counts_), throttle_duration_sec=5)
+
+        self.publishDetections(msg, transform, valid_detections, valid_depths, self.detector_.last_radii_, detections_img,
+                               self.detector_.last_depth_range_)
+
+    def detectorPoolTimerCallback(self):
+        """
+        @brief Publishes the frames processed by the detector pool, in stamp order, and reports the pool utilization
+        """
+        # The processed images are only copied out of the workers when the overlay is rendered
+        self.detector_pool_.return_images_ = self.overlay_.ready()
+        for result in self.detector_pool_.poll():
+            msg, transform = result.context
+            # Run time in the worker. The time waiting for a worker is in end_to_end
+            self.stage_timer_.record('detection', result.busy_time)
+            if result.error is not None:
+                self.get_logger().error("Error in preProcessing: {}".format(result.error))
+                continue
+            self.publishDetections(msg, transform, result.detections, result.depths, result.radii, result.image)
+
+        now = time.monotonic()
+        if now - self.pool_report_t_ >= 5.0:
+            self.pool_report_t_ = now
+            utilization = self.detector_pool_.utilization()
+            stats = self.detector_pool_.stats()
+            self.get_logger().info("Detector pool: utilization [{}], queue depth {}, dropped {}, late {} of {} frames, {} worker restarts".format(
+                ', '.join('{:.0%}'.format(u) for u in utilization), stats['queue_depth'], stats['dropped'], stats['late'], stats['submitted'],
+                stats['restarts']))
+
+    def publishDetections(self, msg: Image, transform: TransformStamped, valid_detections, valid_depths, valid_radii, detections_img,
+                          depth_range=None):
+        """
+        @brief Publishes the positions of the detections in the reference frame, and the overlay image with the detection markers
+        @param msg: Depth image
+        @param transform: Transform from the image frame to the reference frame, at the image stamp
+        @param valid_detections: Detection centers [row, col]
+        @param valid_depths: Detection depths
+        @param valid_radii: Detection radii [px]
+        @param detections_img: Processed depth image, or None. The markers are drawn on a copy
+        @param depth_range: (min, max) depth of the image [m], shown on the overlay, or None
+        """
+        if self.debug_:
+            self.get_logger().info("TF cache: {}, pending frames: {}".format(self.tf_cache_.stats(), self.pending_frames_.stats()),
+                                   throttle_duration_sec=5)
 
+        t = time.perf_counter()
         try:
             # 3D projections
             positions = self.detector_.depthTo3D(valid_detections, valid_depths)
@@ -119,6 +458,7 @@ class DepthCameraNode(Node):
         except Exception as e:
             self.get_logger().error("Error in depthTo3D: {}".format(e))
             return
+        t = self.stage_timer_.record_since('projection', t)
 
         try:
             pose_array = PoseArray()
@@ -128,26 +468,47 @@ class DepthCameraNode(Node):
         except Exception as e:
             self.get_logger().error("Error in transforming positions: {}".format(e))
             return
+        t = self.stage_timer_.record_since('transform', t)
 
         if len(pose_array.poses) > 0:
             self.detections_pub_.publish(pose_array)
+        t = self.stage_timer_.record_since('publish', t)
 
-        if(self.pub_processed_images_):
-            ros_img = self.cv_bridge_.cv2_to_imgmsg(detections_img)
-            self.img_pub_.publish(ros_img)
-                
+        if detections_img is not None and self.overlay_.ready():
+            text = None if depth_range is None else 'Min Depth: {:.2f}, Max depth: {:.2f}'.format(*depth_range)
+            self.overlay_.publish(detections_img, msg.header, markers=list(zip(valid_detections, valid_radii)), text=text, text_color=(0, 0, 255))
+            self.stage_timer_.record_since('overlay', t)
+        if self.stage_timer_.enabled_:
+            self.stage_timer_.record('end_to_end', self.messageAge(msg))
 
-    def caminfoCallback(self,msg: CameraInfo):
-        # TODO : fill self.camera_info_ field
-        P = np.array(msg.p)
-        K = np.array(msg.k)
-        # if len(P) == 12: # Sanity check
-        #     P = P.reshape((3,4))
-        #     self.detector_.camera_info_ = {'fx': P[0][0], 'fy': P[1][1], 'cx': P[0][2], 'cy': P[1][2]}
+    def checkPyramid(self, img, detections, dt):
+        """
+        @brief Runs the full-resolution detector on img, and logs the speedup and detection agreement of the pyramid mode
+        @param img: Depth image of the current frame
+        @param detections: Detections of the pyramid detector in the current frame
+        @param dt: Processing time of the pyramid detector in the current frame
+        """
+        try:
+            t1 = time.perf_counter()
+            reference_detections, _, _ = self.reference_detector_.preProcessing(img)
+            reference_dt = time.perf_counter() - t1
+        except Exception as e:
+            self.get_logger().error("Error in full-resolution preProcessing: {}".format(e))
+            return
 
-        if len(K) == 9: # Sanity check
-            K = K.reshape((3,3))
-            self.detector_.camera_info_ = {'fx': K[0][0], 'fy': K[1][1], 'cx': K[0][2], 'cy': K[1][2]}
+        agreement = self.detector_.detectionAgreement(reference_detections, detections)
+        self.get_logger().info("Pyramid level {}: {:.1f} ms vs {:.1f} ms at full resolution (speedup {:.2f}x), agreement {:.0%} ({} vs {} detections)".format(
+            self.pyramid_level_, dt*1e3, reference_dt*1e3, reference_dt / max(dt, 1e-9), agreement, len(detections), len(reference_detections)))
+
+    def caminfoCallback(self,msg: CameraInfo):
+        # The camera model is only rebuilt when the intrinsics or the resolution change
+        if self.detector_.camera_model_ is not None and self.detector_.camera_model_.matches(msg):
+            return
+        camera_model = PinholeCamera.from_camera_info(msg)
+        if camera_model is None:
+            self.get_logger().warn("Invalid camera info received.", throttle_duration_sec=5)
+            return
+        self.detector_.camera_model_ = camera_model
 
     def transformPositions(self, positions: list, parent_frame: str, child_frame: str, tf_time, tr: TransformStamped) -> PoseArray:
         """
@@ -156,37 +517,34 @@ class DepthCameraNode(Node):
         @param parent_frame: Frame to transform positions to
         @param child_frame: Current frame of positions
         @param tf_time: Time at which positions were computed
-        @param tr: Transform 4x4 matrix theat encodes rotation and translation
+        @param tr: Transform from child_frame to parent_frame. Its 4x4 matrix is computed once and applied to all positions at once
         @return pose_array: PoseArray of all transformed positions
         """
-        pose_array = PoseArray()
-        pose_array.header.frame_id = parent_frame
-        pose_array.header.stamp = tf_time
-        
-        for pos in positions:            
-            tf2_pose_msg = TF2Pose()
-            tf2_pose_msg.position.x = pos[0]
-            tf2_pose_msg.position.y = pos[1]
-            tf2_pose_msg.position.z = pos[2]
-            tf2_pose_msg.orientation.w = 1.0        
-            
-            try:
-                transformed_pose = do_transform_pose(tf2_pose_msg, tr)
-                pose_array.poses.append(transformed_pose)
-            except Exception as e:
-                self.get_logger().error("Error in transforming point {}".format(e))
-                continue
-
-            
+        pose_array, n_dropped = self.transform_cache_.transform_to_pose_array(positions, tr, parent_frame, tf_time)
+        if n_dropped > 0:
+            self.get_logger().error("Dropped {} positions with non-finite values after transformation".format(n_dropped))
 
         return pose_array
 
+    def close(self):
+        """
+        @brief Stops the detector pool and detaches from the shared memory ring
+        """
+        if self.detector_pool_ is not None:
+            self.detector_pool_.close()
+            self.detector_pool_ = None
+        if self.shm_client_ is not None:
+            self.shm_client_.close()
+
 
 def main(args=None):
     rclpy.init(args=args)
     depth_camera_node = DepthCameraNode()
     depth_camera_node.get_logger().info("Drone detection node has started")
-    rclpy.spin(depth_camera_node)
+    try:
+        rclpy.spin(depth_camera_node)
+    finally:
+        depth_camera_node.close()
     depth_camera_node.destroy_node()
     rclpy.shutdown()
 
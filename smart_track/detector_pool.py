@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+"""
+DetectorPool
+
+Pool of worker processes that run DroneDetector.preProcessing outside the GIL of the node.
+Each worker owns a shared memory block. A frame is copied into the block of an idle worker,
+and the worker processes it in place (preProcessing replaces its NaN/inf values), so the image is never pickled.
+
+When all the workers are busy, frames wait in a bounded queue, and the oldest waiting frame is dropped when it is full.
+Results are returned in stamp order: a result is only released once all the earlier frames are done or dropped.
+A worker that exits (e.g. crashes) fails its frame, and is restarted.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import bisect
+import multiprocessing as mp
+import queue
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def _worker_main(worker_id, detector_args, detector_kwargs, task_queue, result_queue):
+    """
+    Worker process loop. Tasks are (job_id, shm_name, shape, dtype), None to exit.
+    Results are (worker_id, job_id, detections, depths, radii, busy_time, error).
+    """
+    # Imported here, so the pool module itself does not depend on OpenCV
+    from smart_track.detection import DroneDetector
+
+    detector = DroneDetector(*detector_args, **detector_kwargs)
+    shm = None
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        job_id, shm_name, shape, dtype = task
+        t1 = time.perf_counter()
+        try:
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+            img = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            # Processed in place, in the shared block
+            detections, depths, _ = detector.preProcessing(img)
+            result = ([tuple(np.asarray(c).tolist()) for c in detections], list(depths), list(detector.last_radii_), None)
+        except Exception as e:
+            result = ([], [], [], repr(e))
+        result_queue.put((worker_id, job_id) + result[:3] + (time.perf_counter() - t1, result[3]))
+    if shm is not None:
+        shm.close()
+
+
+class DetectorResult:
+    """
+    Result of one frame: detections ([row, col]), depths and radii as returned by DroneDetector.preProcessing,
+    the processed depth image, the context given to submit(), and the run time of preProcessing in the worker [s].
+    """
+
+    def __init__(self, stamp, context, detections, depths, radii, image, error, busy_time=0.0):
+        self.stamp = stamp
+        self.context = context
+        self.detections = detections
+        self.depths = depths
+        self.radii = radii
+        self.image = image
+        self.error = error
+        self.busy_time = busy_time
+
+
+class DetectorPool:
+
+    def __init__(self, num_workers, detector_args, detector_kwargs=None, queue_size=2, return_images=True):
+        """
+        @param num_workers: Number of worker processes
+        @param detector_args: Positional arguments of DroneDetector
+        @param detector_kwargs: Keyword arguments of DroneDetector
+        @param queue_size: Maximum number of frames waiting for an idle worker
+        @param return_images: If False, the processed images are not copied out of the shared blocks (DetectorResult.image is None).
+            Can be changed between poll() calls, e.g. to only copy the images when an overlay is rendered
+        """
+        # spawn: the workers do not inherit the threads of the node process
+        self.ctx_ = mp.get_context('spawn')
+        self.detector_args_ = detector_args
+        self.detector_kwargs_ = detector_kwargs or {}
+        self.num_workers_ = max(1, num_workers)
+        self.queue_size_ = max(0, queue_size)
+        self.return_images_ = return_images
+        self.result_queue_ = self.ctx_.Queue()
+        self.task_queues_ = [None] * self.num_workers_
+        self.workers_ = [None] * self.num_workers_
+        for i in range(self.num_workers_):
+            self.start_worker(i)
+
+        self.shms_ = [None] * self.num_workers_
+        self.shm_layout_ = [None] * self.num_workers_  # (shape, dtype) of the frame in each block
+        self.running_ = [None] * self.num_workers_   # job_id of each busy worker
+        self.waiting_ = deque()                      # (job_id, image) waiting for an idle worker
+        self.jobs_ = {}                              # job_id -> (stamp, context)
+        self.order_ = []                             # (stamp, job_id) of the unreleased jobs, sorted by stamp
+        self.done_ = {}                              # job_id -> DetectorResult
+        self.next_job_id_ = 0
+        self.last_released_stamp_ = float('-inf')
+
+        # Statistics
+        self.submitted_ = 0
+        self.dropped_ = 0
+        self.late_ = 0
+        self.restarts_ = 0
+        self.busy_time_ = [0.0] * self.num_workers_
+        self.stats_t0_ = time.monotonic()
+
+    def start_worker(self, worker_id):
+        """
+        Starts the process of worker_id, with a new task queue (the queue of a dead worker may hold a task it never read).
+        """
+        task_queue = self.ctx_.Queue()
+        worker = self.ctx_.Process(target=_worker_main,
+                                   args=(worker_id, self.detector_args_, self.detector_kwargs_, task_queue, self.result_queue_),
+                                   daemon=True)
+        worker.start()
+        self.task_queues_[worker_id] = task_queue
+        self.workers_[worker_id] = worker
+
+    def submit(self, stamp, image, context=None):
+        """
+        Queues a frame. Does not block.
+
+        @param stamp: Frame stamp [s]
+        @param image: Depth image. It is copied, so the caller can reuse it.
+        @param context: Object returned with the result (e.g. the message header and transform)
+
+        @return Number of frames dropped to make room
+        """
+        if stamp < self.last_released_stamp_:
+            # Older than a result that was already released. Releasing it would break the stamp order
+            self.late_ += 1
+            return 1
+
+        job_id = self.next_job_id_
+        self.next_job_id_ += 1
+        self.submitted_ += 1
+        self.jobs_[job_id] = (stamp, context)
+        bisect.insort(self.order_, (stamp, job_id))
+
+        dropped = 0
+        idle = self.idle_worker()
+        if idle is not None:
+            self.dispatch(idle, job_id, image)
+        else:
+            self.waiting_.append((job_id, image.copy()))
+            while len(self.waiting_) > self.queue_size_:
+                old_job_id, _ = self.waiting_.popleft()
+                self.forget(old_job_id)
+                self.dropped_ += 1
+                dropped += 1
+        return dropped
+
+    def poll(self):
+        """
+        Collects the finished frames without blocking, and dispatches the waiting ones.
+
+        @return List of DetectorResult, in stamp order
+        """
+        while True:
+            try:
+                worker_id, job_id, detections, depths, radii, busy_time, error = self.result_queue_.get_nowait()
+            except queue.Empty:
+                break
+            self.busy_time_[worker_id] += busy_time
+            if self.running_[worker_id] == job_id:
+                self.running_[worker_id] = None
+            if job_id not in self.jobs_:
+                # Already failed as the job of an exited worker
+                continue
+            stamp, context = self.jobs_[job_id]
+            image = None
+            if self.return_images_:
+                # Copy the processed image out of the shared block before the worker gets the next frame
+                shape, dtype = self.shm_layout_[worker_id]
+                image = np.ndarray(shape, dtype=dtype, buffer=self.shms_[worker_id].buf).copy()
+            self.done_[job_id] = DetectorResult(stamp, context, detections, depths, radii, image, error, busy_time)
+
+            if self.waiting_:
+                next_job_id, next_image = self.waiting_.popleft()
+                self.dispatch(worker_id, next_job_id, next_image)
+
+        # A worker that died cannot return its frame. Fail it, so the later frames are not held back, and restart the worker
+        for worker_id, worker in enumerate(self.workers_):
+            if worker.is_alive():
+                continue
+            job_id = self.running_[worker_id]
+            if job_id is not None:
+                self.running_[worker_id] = None
+                stamp, context = self.jobs_[job_id]
+                self.done_[job_id] = DetectorResult(stamp, context, [], [], [], None,
+                                                    'worker {} exited with code {}'.format(worker_id, worker.exitcode))
+            self.task_queues_[worker_id].close()
+            self.start_worker(worker_id)
+            self.restarts_ += 1
+            if self.waiting_:
+                next_job_id, next_image = self.waiting_.popleft()
+                self.dispatch(worker_id, next_job_id, next_image)
+
+        released = []
+        while self.order_ and self.order_[0][1] in self.done_:
+            stamp, job_id = self.order_.pop(0)
+            del self.jobs_[job_id]
+            released.append(self.done_.pop(job_id))
+            self.last_released_stamp_ = stamp
+        return released
+
+    def idle_worker(self):
+        for i, job_id in enumerate(self.running_):
+            # An exited worker is restarted by the next poll()
+            if job_id is None and self.workers_[i].is_alive():
+                return i
+        return None
+
+    def dispatch(self, worker_id, job_id, image):
+        shm = self.shms_[worker_id]
+        if shm is None or shm.size < image.nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = shared_memory.SharedMemory(create=True, size=image.nbytes)
+            self.shms_[worker_id] = shm
+        self.shm_layout_[worker_id] = (image.shape, image.dtype.str)
+        np.copyto(np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf), image)
+        self.running_[worker_id] = job_id
+        self.task_queues_[worker_id].put((job_id, shm.name, image.shape, image.dtype.str))
+
+    def forget(self, job_id):
+        stamp, _ = self.jobs_.pop(job_id)
+        self.order_.remove((stamp, job_id))
+
+    def queue_depth(self):
+        """
+        @return Number of frames waiting for an idle worker
+        """
+        return len(self.waiting_)
+
+    def utilization(self, reset=True):
+        """
+        @param reset: Start a new measurement window
+        @return List of the busy time fraction of each worker since the last reset
+        """
+        elapsed = max(time.monotonic() - self.stats_t0_, 1e-9)
+        utilization = [min(1.0, busy / elapsed) for busy in self.busy_time_]
+        if reset:
+            self.busy_time_ = [0.0] * self.num_workers_
+            self.stats_t0_ = time.monotonic()
+        return utilization
+
+    def stats(self):
+        """
+        @return dict of the submitted, dropped and late frame counts, number of worker restarts, queue depth and number of busy workers
+        """
+        return {
+            'submitted': self.submitted_,
+            'dropped': self.dropped_,
+            'late': self.late_,
+            'restarts': self.restarts_,
+            'queue_depth': len(self.waiting_),
+            'busy_workers': sum(job_id is not None for job_id in self.running_),
+        }
+
+    def close(self):
+        """
+        Stops the workers and releases the shared memory.
+        """
+        for task_queue in self.task_queues_:
+            task_queue.put(None)
+        for worker in self.workers_:
+            worker.join(timeout=1.0)
+            if worker.is_alive():
+                worker.terminate()
+        for shm in self.shms_:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.shms_ = [None] * self.num_workers_
@@ -22,6 +22,8 @@ from geometry_msgs.msg import TransformStamped
 import random
 import numpy as np
 
+from .tf_cache import TFCache
+
 class TFLookupNode(Node):
 
     def __init__(self):
@@ -31,6 +33,7 @@ class TFLookupNode(Node):
         self.declare_parameter('publish_probability', 0.8)
         self.declare_parameter('position_noise_std', 0.0)
         self.declare_parameter('orientation_noise_std', 0.0)
+        self.declare_parameter('tf_stamp_tolerance', 0.0)
 
         self.parent_frame = self.get_parameter('parent_frame').get_parameter_value().string_value
         self.child_frames = self.get_parameter('child_frames').get_parameter_value().string_array_value
@@ -41,6 +44,7 @@ class TFLookupNode(Node):
         self.publisher_ = self.create_publisher(PoseArray, 'pose_array', 10)
         self.tf_buffer = Buffer()
         self.tf_listener = TransformListener(self.tf_buffer, self)
+        self.tf_cache = TFCache(self.tf_buffer, self.get_parameter('tf_stamp_tolerance').get_parameter_value().double_value)
 
         self.timer_period = 0.1  # seconds
         self.timer = self.create_timer(self.timer_period, self.timer_callback)
@@ -51,11 +55,12 @@ class TFLookupNode(Node):
 
         pose_array = PoseArray()
         pose_array.header.frame_id = self.parent_frame
-        pose_array.header.stamp = self.get_clock().now().to_msg()
+        now = self.get_clock().now()
+        pose_array.header.stamp = now.to_msg()
 
         for child_frame in self.child_frames:
             try:
-                transform = self.tf_buffer.lookup_transform(self.parent_frame, child_frame, rclpy.time.Time())
+                transform = self.tf_cache.lookup(self.parent_frame, child_frame, now.nanoseconds / 1e9)
                 pose = self.transform_to_pose(transform)
                 pose_array.poses.append(pose)
             except Exception as e:
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+LatestHandoff
+
+Thread-safe handoff of the latest messages from ingest callbacks to a worker.
+Each input (e.g. 'yolo', 'kf') has a one-message slot. The ingest side puts the newest
+message in its slot and notifies the worker. The worker takes all the filled slots at once.
+A message that is replaced before the worker takes it is stale, and counted as dropped.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import threading
+
+
+class LatestHandoff:
+
+    def __init__(self, notify=None):
+        """
+        @param notify: Called without arguments after each put(), e.g. a guard condition trigger that wakes up the worker
+        """
+        self.lock_ = threading.Lock()
+        self.slots_ = {}
+        self.notify_ = notify
+
+        # Statistics
+        self.put_ = 0
+        self.taken_ = 0
+        self.dropped_ = 0
+
+    def put(self, key, item):
+        """
+        Puts item in the slot of key, replacing a message the worker has not taken yet.
+
+        @return True if a stale message was replaced
+        """
+        with self.lock_:
+            replaced = key in self.slots_
+            self.slots_[key] = item
+            self.put_ += 1
+            if replaced:
+                self.dropped_ += 1
+        if self.notify_ is not None:
+            self.notify_()
+        return replaced
+
+    def take(self):
+        """
+        @return dict {key: item} of the slots filled since the last take(). The slots are emptied.
+        """
+        with self.lock_:
+            items, self.slots_ = self.slots_, {}
+            self.taken_ += len(items)
+        return items
+
+    def stats(self):
+        """
+        @return dict of the put, taken and dropped (stale) message counts
+        """
+        with self.lock_:
+            return {'put': self.put_, 'taken': self.taken_, 'dropped': self.dropped_, 'pending': len(self.slots_)}
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+"""
+OverlayRenderer
+
+Renders and publishes the debug overlay images of the nodes (detection markers, YOLO boxes, KF ellipses on the depth image).
+The overlay is only rendered when the topic has subscribers, at most max_rate times per second,
+and always on a copy of the depth image, so the frame used by the detection is never modified.
+
+Image formats:
+    'raw'   Depth image in its own encoding (e.g. 32FC1) with the shapes drawn in it (sensor_msgs/Image)
+    'bgr8'  8-bit visualization: depth mapped to gray levels (near is bright), colored shapes (sensor_msgs/Image)
+    'jpeg'  The 'bgr8' visualization, JPEG compressed (sensor_msgs/CompressedImage on <topic>/compressed, the image_transport convention)
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+FORMATS = ('raw', 'bgr8', 'jpeg')
+
+
+def draw_detection_marker(img, c, r, color=(0, 0, 255), thickness=2):
+    """
+    Draws a circle with a cross around the target centered at c with radius r.
+
+    @param img: Image, modified in place
+    @param c: Target center [row, col]
+    @param r: Radius of the target's enclosing circle
+    @return img
+    """
+    r = int(r)
+    cx = int(c[1])
+    cy = int(c[0])
+    cv2.circle(img, (cx, cy), r, color, thickness)
+    # Lines pointing to the right, left, top and bottom of the enclosing circle
+    cv2.line(img, (cx + r // 2, cy), (cx + r // 2 + r, cy), color, thickness)
+    cv2.line(img, (cx - r // 2, cy), (cx - r // 2 - r, cy), color, thickness)
+    cv2.line(img, (cx, cy - r // 2), (cx, cy - r // 2 - r), color, thickness)
+    cv2.line(img, (cx, cy + r // 2), (cx, cy + r // 2 + r), color, thickness)
+    return img
+
+
+def depth_to_bgr8(depth, max_depth):
+    """
+    @param depth: Depth image [m]
+    @param max_depth: Depth mapped to black [m]. NaN/inf are black as well
+    @return HxWx3 uint8 image, near is bright
+    """
+    gray = np.nan_to_num(depth, nan=max_depth, posinf=max_depth, neginf=0.0).astype(np.float32, copy=False)
+    np.clip(gray, 0.0, max_depth, out=gray)
+    gray = cv2.convertScaleAbs(gray, alpha=-255.0 / max_depth, beta=255.0)
+    return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+
+
+def render_overlay(depth_image, image_format='raw', scale=1.0, max_depth=20.0,
+                   markers=(), circles=(), ellipses=(), text=None, text_color=(0, 255, 0)):
+    """
+    @param depth_image: Depth image [m]. It is not modified
+    @param image_format: 'raw' (depth image type), or 'bgr8'/'jpeg' (8-bit BGR image)
+    @param scale: Scale of the overlay with respect to the depth image
+    @param max_depth: Far end of the 8-bit depth mapping [m]
+    @param markers: Detection markers [((row, col), radius)], drawn in red
+    @param circles: Circles [((u, v), radius)], drawn in green
+    @param ellipses: Ellipses [((u, v), (axis_u, axis_v), angle [deg])], drawn in green
+    @param text: Label drawn at the top left
+    @param text_color: Color of the label
+    All the coordinates are in depth image pixels.
+    @return Overlay image. A new array
+    """
+    if scale != 1.0:
+        overlay = cv2.resize(depth_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+    else:
+        overlay = depth_image
+    if image_format == 'raw':
+        if overlay is depth_image:
+            overlay = depth_image.copy()
+    else:
+        overlay = depth_to_bgr8(overlay, max_depth)
+
+    for c, r in markers:
+        draw_detection_marker(overlay, (c[0] * scale, c[1] * scale), r * scale)
+    for (u, v), r in circles:
+        cv2.circle(overlay, (int(u * scale), int(v * scale)), int(r * scale), (0, 255, 0), 1)
+    for (u, v), (a, b), angle in ellipses:
+        cv2.ellipse(overlay, (int(u * scale), int(v * scale)), (int(a * scale), int(b * scale)), angle, 0, 360, (0, 255, 0), 2)
+    if text:
+        cv2.putText(overlay, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, text_color, 1, cv2.LINE_AA)
+    return overlay
+
+
+class OverlayRenderer:
+
+    def __init__(self, node, topic, image_format='raw', max_rate=5.0, scale=1.0, max_depth=20.0, jpeg_quality=80, enabled=True):
+        """
+        @param node: Node that owns the publisher
+        @param topic: Image topic. With 'jpeg', the CompressedImage is published on <topic>/compressed
+        @param image_format: 'raw', 'bgr8' or 'jpeg'
+        @param max_rate: Maximum publish rate [Hz] (0 = every frame)
+        @param scale: Scale of the overlay with respect to the depth image
+        @param max_depth: Far end of the 8-bit depth mapping [m]
+        @param jpeg_quality: JPEG quality, 0 to 100
+        @param enabled: If False, nothing is rendered
+        """
+        # Imported here, so the rendering functions do not depend on ROS
+        from sensor_msgs.msg import CompressedImage, Image
+        from cv_bridge import CvBridge
+
+        if image_format not in FORMATS:
+            raise ValueError("Unknown overlay image format '{}'. Expected one of {}".format(image_format, FORMATS))
+        self.image_format_ = image_format
+        self.period_ = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.scale_ = scale
+        self.max_depth_ = max_depth
+        self.jpeg_quality_ = int(jpeg_quality)
+        self.enabled_ = enabled
+        self.last_t_ = float('-inf')
+        self.rendered_ = 0
+        self.cv_bridge_ = CvBridge()
+        self.compressed_msg_type_ = CompressedImage
+        if image_format == 'jpeg':
+            self.publisher_ = node.create_publisher(CompressedImage, topic + '/compressed', 10)
+        else:
+            self.publisher_ = node.create_publisher(Image, topic, 10)
+
+    def has_subscribers(self):
+        """
+        @return True if the overlay is enabled and has subscribers
+        """
+        return self.enabled_ and self.publisher_.get_subscription_count() > 0
+
+    def ready(self):
+        """
+        @return True if the next publish() call would render: the overlay has subscribers, and the throttle period has elapsed
+        """
+        return self.has_subscribers() and time.monotonic() - self.last_t_ >= self.period_
+
+    def publish(self, depth_image, header, **shapes):
+        """
+        Renders the shapes on a copy of depth_image, and publishes it, if ready().
+
+        @param depth_image: Depth image [m]. It is not modified
+        @param header: Header of the depth image, or None
+        @param shapes: markers, circles, ellipses, text, text_color. See render_overlay()
+        @return True if the overlay was published
+        """
+        if not self.ready():
+            return False
+        self.last_t_ = time.monotonic()
+        overlay = render_overlay(depth_image, self.image_format_, self.scale_, self.max_depth_, **shapes)
+        if self.image_format_ == 'jpeg':
+            msg = self.compressed_msg_type_(format='bgr8; jpeg compressed bgr8')
+            msg.data = cv2.imencode('.jpg', overlay, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality_])[1].tobytes()
+        else:
+            msg = self.cv_bridge_.cv2_to_imgmsg(overlay, encoding='passthrough' if self.image_format_ == 'raw' else 'bgr8')
+        if header is not None:
+            msg.header = header
+        self.publisher_.publish(msg)
+        self.rendered_ += 1
+        return True
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""
+PendingFrameQueue
+
+Small bounded queue of frames that wait for something (e.g. their TF transform) before they can be processed.
+Each frame gets a key, so it can be completed out of order when what it waits for is ready.
+Frames expire after a timeout, and the oldest frame is dropped when the queue is full.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+from collections import OrderedDict
+from itertools import count
+
+
+class PendingFrameQueue:
+
+    def __init__(self, max_size=5, timeout=0.5):
+        """
+        @param max_size: Maximum number of pending frames
+        @param timeout: A frame expires after this time in the queue [s]
+        """
+        self.max_size_ = max(1, max_size)
+        self.timeout_ = timeout
+        self.entries_ = OrderedDict()  # key -> (frame, deadline, handle)
+        self.keys_ = count()
+
+        # Statistics
+        self.deferred_ = 0
+        self.completed_ = 0
+        self.expired_ = 0
+        self.dropped_ = 0
+
+    def __len__(self):
+        return len(self.entries_)
+
+    def push(self, frame, now, handle=None):
+        """
+        Adds a frame.
+
+        @param frame: Pending frame
+        @param now: Current time [s]
+        @param handle: Object kept with the frame and returned when it is dropped or expires (e.g. a future to cancel)
+
+        @return key: Key of the frame, for pop()
+        @return dropped: List of (frame, handle) dropped to make room
+        """
+        dropped = []
+        while len(self.entries_) >= self.max_size_:
+            _, (old_frame, _, old_handle) = self.entries_.popitem(last=False)
+            dropped.append((old_frame, old_handle))
+            self.dropped_ += 1
+
+        key = next(self.keys_)
+        self.entries_[key] = (frame, now + self.timeout_, handle)
+        self.deferred_ += 1
+        return key, dropped
+
+    def pop(self, key):
+        """
+        Removes a frame that is ready to be processed.
+
+        @return frame, or None if it was dropped or expired
+        """
+        entry = self.entries_.pop(key, None)
+        if entry is None:
+            return None
+        self.completed_ += 1
+        return entry[0]
+
+    def expire(self, now):
+        """
+        Removes the frames whose deadline has passed.
+
+        @param now: Current time [s]
+        @return List of (frame, handle) of the expired frames
+        """
+        expired = []
+        for key in [k for k, (_, deadline, _) in self.entries_.items() if deadline <= now]:
+            frame, _, handle = self.entries_.pop(key)
+            expired.append((frame, handle))
+        self.expired_ += len(expired)
+        return expired
+
+    def stats(self):
+        """
+        @return dict of the pending, deferred, completed, expired and dropped frame counts
+        """
+        return {
+            'pending': len(self.entries_),
+            'deferred': self.deferred_,
+            'completed': self.completed_,
+            'expired': self.expired_,
+            'dropped': self.dropped_,
+        }
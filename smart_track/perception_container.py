@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+PerceptionContainer
+
+Runs smart_track nodes in one process, under one SingleThreadedExecutor, instead of one process per node.
+The nodes with depth_transport 'intra' do not subscribe to the depth images. The container subscribes once,
+and hands each image message over to them by a direct call, so it is received and deserialized once for all of them.
+
+rclpy has no composable node containers, so the nodes to run are selected with --nodes:
+    ros2 run smart_track perception_container --nodes detection yolo2pose --ros-args -p depth_transport:=intra
+
+All the nodes share one thread. The worker callback group of Yolo2PoseNode (multi_threaded) runs on it too.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import argparse
+import sys
+
+import rclpy
+from rclpy.executors import SingleThreadedExecutor
+from rclpy.node import Node
+from rclpy.utilities import remove_ros_args
+from sensor_msgs.msg import Image
+
+from .detection_node import DepthCameraNode
+from .drone_marker_node import QuadcopterMarkerPublisher
+from .yolo2pose_node import Yolo2PoseNode
+
+# name: (node class, callback that takes the depth images with depth_transport 'intra')
+NODES = {
+    'detection': (DepthCameraNode, 'imageCallback'),
+    'yolo2pose': (Yolo2PoseNode, 'depth_callback'),
+    'marker': (QuadcopterMarkerPublisher, None),
+}
+
+
+class PerceptionContainer(Node):
+
+    def __init__(self, nodes):
+        """
+        @param nodes: Nodes of the process. The container subscribes to the depth images for the ones with depth_transport 'intra'
+        """
+        super().__init__("perception_container")
+        self.nodes_ = nodes
+
+        self.depth_callbacks_ = []
+        for node in nodes:
+            for node_class, callback in NODES.values():
+                if isinstance(node, node_class) and callback is not None and node.get_parameter('depth_transport').value == 'intra':
+                    self.depth_callbacks_.append(getattr(node, callback))
+
+        self.image_sub_ = None
+        if self.depth_callbacks_:
+            self.image_sub_ = self.create_subscription(Image, "observer/depth_image", self.imageCallback, 10)
+
+    def imageCallback(self, msg: Image):
+        # The nodes get the same message object. They only read it
+        for callback in self.depth_callbacks_:
+            callback(msg)
+
+
+def parse_nodes(argv):
+    parser = argparse.ArgumentParser(description='Runs smart_track nodes in one process')
+    # Space or comma separated, so a single launch argument can hold the list
+    parser.add_argument('--nodes', nargs='+', default=['detection', 'yolo2pose'])
+    names = [name for arg in parser.parse_args(argv).nodes for name in arg.replace(',', ' ').split()]
+    unknown = [name for name in names if name not in NODES]
+    if unknown:
+        parser.error("unknown node(s) {}. Choose from {}".format(unknown, list(NODES)))
+    return names
+
+
+def main(args=None):
+    names = parse_nodes(remove_ros_args(args if args is not None else sys.argv)[1:])
+    rclpy.init(args=args)
+    nodes = [NODES[name][0]() for name in names]
+    container = PerceptionContainer(nodes)
+    container.get_logger().info("Perception container has started with nodes {}. Intra-process depth images for {} of them".format(
+        [node.get_name() for node in nodes], len(container.depth_callbacks_)))
+
+    executor = SingleThreadedExecutor()
+    executor.add_node(container)
+    for node in nodes:
+        executor.add_node(node)
+    try:
+        executor.spin()
+    finally:
+        for node in nodes:
+            if hasattr(node, 'close'):
+                node.close()
+    for node in nodes:
+        node.destroy_node()
+    container.destroy_node()
+    rclpy.shutdown()
+
+if __name__ == "__main__":
+    main()
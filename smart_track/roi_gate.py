@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+"""
+RoiGate
+
+Temporal ROI gating for the depth detector.
+Once a target is detected, the next frames are only searched in a fixed-size
+window around its predicted pixel location. The prediction is a constant-velocity
+fit over the last detections. A full-frame scan is done every full_scan_period
+frames, and whenever the track is lost (a gated frame has no detection).
+
+Only the detection closest to the prediction is tracked. Other targets are picked
+up by the periodic full-frame scans.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+from collections import deque
+
+import numpy as np
+
+
+class RoiGate:
+
+    def __init__(self, history=5, margin=40, full_scan_period=10):
+        """
+        @param history: Number of past detections used for the constant-velocity prediction
+        @param margin: Window half-size in pixels, in addition to the target radius
+        @param full_scan_period: A full-frame scan is forced after this many consecutive gated frames
+        """
+        self.history_ = deque(maxlen=max(1, history))  # (t, row, col, radius)
+        self.margin_ = margin
+        self.full_scan_period_ = max(1, full_scan_period)
+        self.frames_since_full_scan_ = 0
+
+        # Statistics
+        self.gated_frames_ = 0
+        self.full_frames_ = 0
+        self.gated_latency_ = 0.0  # Accumulated processing time [s]
+        self.full_latency_ = 0.0
+
+    def predict(self, t):
+        """
+        Constant-velocity prediction of the target pixel location at time t.
+
+        @return (row, col, radius), or None if there is no track
+        """
+        if len(self.history_) == 0:
+            return None
+        t_last, row, col, radius = self.history_[-1]
+        if len(self.history_) > 1:
+            t_first, row_first, col_first, _ = self.history_[0]
+            if t_last > t_first:
+                dt = t - t_last
+                row += (row - row_first) / (t_last - t_first) * dt
+                col += (col - col_first) / (t_last - t_first) * dt
+        return row, col, radius
+
+    def next_window(self, t, shape):
+        """
+        Search window for the frame at time t.
+
+        @param t: Frame time [s]
+        @param shape: Frame shape (height, width)
+
+        @return (y0, y1, x0, x1) window, or None for a full-frame scan
+        """
+        if self.frames_since_full_scan_ >= self.full_scan_period_:
+            return None
+        prediction = self.predict(t)
+        if prediction is None:
+            return None
+
+        row, col, radius = prediction
+        height, width = shape[:2]
+        # The window size only depends on the track radius, so working buffers can be reused between frames
+        half = int(self.margin_ + radius)
+        size_y, size_x = 2 * half + 1, 2 * half + 1
+        if size_y >= height or size_x >= width:
+            return None
+        # Shift the window inside the frame instead of cropping it
+        y0 = int(np.clip(round(row) - half, 0, height - size_y))
+        x0 = int(np.clip(round(col) - half, 0, width - size_x))
+        return y0, y0 + size_y, x0, x0 + size_x
+
+    def update(self, t, detections, radii, window, latency=None):
+        """
+        Updates the track with the detections of the frame at time t.
+
+        @param t: Frame time [s]
+        @param detections: Detection centers [row, col] in full-frame coordinates
+        @param radii: Detection radii
+        @param window: Window returned by next_window() for this frame
+        @param latency: Processing time of the frame [s], for the per-mode statistics
+        """
+        if window is None:
+            self.full_frames_ += 1
+            self.frames_since_full_scan_ = 0
+            if latency is not None:
+                self.full_latency_ += latency
+        else:
+            self.gated_frames_ += 1
+            self.frames_since_full_scan_ += 1
+            if latency is not None:
+                self.gated_latency_ += latency
+
+        if len(detections) == 0:
+            # Track lost. The next frame is a full-frame scan
+            self.history_.clear()
+            return
+
+        centers = np.asarray(detections, dtype=np.float64).reshape(-1, 2)
+        prediction = self.predict(t)
+        if prediction is None:
+            i = 0
+        else:
+            i = int(np.argmin(np.hypot(centers[:, 0] - prediction[0], centers[:, 1] - prediction[1])))
+        self.history_.append((t, centers[i, 0], centers[i, 1], float(radii[i]) if len(radii) > i else 0.0))
+
+    def gated_ratio(self):
+        """
+        @return Fraction of the frames that were searched in a window only
+        """
+        n = self.gated_frames_ + self.full_frames_
+        return self.gated_frames_ / n if n > 0 else 0.0
+
+    def mean_latency(self):
+        """
+        @return (gated, full) mean processing time per frame [s]
+        """
+        gated = self.gated_latency_ / self.gated_frames_ if self.gated_frames_ > 0 else 0.0
+        full = self.full_latency_ / self.full_frames_ if self.full_frames_ > 0 else 0.0
+        return gated, full
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+"""
+ShmFrameRing
+
+Ring of depth frames in one named multiprocessing.shared_memory segment, to hand frames
+over between nodes running on the same machine without copying them per subscriber.
+
+Layout: a header table with one row per slot (sequence number, stamp, shape, dtype), followed by the slots.
+
+Lifetime and overwrite rules:
+    - The producer creates the segment, is the only writer, and unlinks it when it shuts down.
+    - Frames are written round-robin. A slot is rewritten every `slots` frames, so a frame stays
+      readable until the producer has written slots - 1 newer frames.
+    - While a slot is written, its sequence number is odd. Readers only return slots with an even sequence number.
+    - Consumers get read-only views, and must not keep them. After using a view, they call ShmFrame.valid()
+      and discard their results if the slot was overwritten in the meantime.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+_SLOT_HEADER = np.dtype([
+    ('seq', np.uint64),
+    ('sec', np.int32),
+    ('nanosec', np.uint32),
+    ('height', np.uint32),
+    ('width', np.uint32),
+    ('channels', np.uint32),
+    ('dtype', 'S8'),
+])
+# slots, slot_bytes
+_RING_HEADER = np.dtype([('slots', np.uint32), ('slot_bytes', np.uint64)])
+
+# Segments created by this process. Its resource tracker already knows them
+_created = set()
+
+
+def _attach(name):
+    """
+    Attaches to an existing segment without registering it with this process' resource tracker,
+    which would unlink it when this (consumer) process exits.
+    """
+    if name in _created:
+        return shared_memory.SharedMemory(name=name)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class ShmFrame:
+    """
+    Read-only view of one frame of the ring.
+    ShmFrameClient.get() also sets header, so the frame can be used where a message with a header is expected.
+    """
+
+    def __init__(self, ring, slot, seq, sec, nanosec, array, header=None):
+        self.header = header
+        self.ring = ring
+        self.slot = slot
+        self.seq = seq
+        self.sec = sec
+        self.nanosec = nanosec
+        self.array = array
+        self.nbytes = array.nbytes
+
+    def valid(self):
+        """
+        @return True if the slot was not overwritten since this frame was read
+        """
+        return self.ring.slot_seq(self.slot) == self.seq
+
+
+class ShmFrameRing:
+
+    def __init__(self, shm, owner):
+        self.shm_ = shm
+        self.owner_ = owner
+        ring_header = np.ndarray((), dtype=_RING_HEADER, buffer=shm.buf)
+        self.slots_ = int(ring_header['slots'])
+        self.slot_bytes_ = int(ring_header['slot_bytes'])
+        self.headers_ = np.ndarray((self.slots_,), dtype=_SLOT_HEADER, buffer=shm.buf, offset=_RING_HEADER.itemsize)
+        self.data_offset_ = _RING_HEADER.itemsize + self.slots_ * _SLOT_HEADER.itemsize
+        self.next_slot_ = 0
+        self.frames_written_ = 0
+
+    @classmethod
+    def create(cls, name, slots, slot_bytes):
+        """
+        Creates the segment (producer side). An existing segment with the same name, left by a crashed producer, is replaced.
+
+        @param name: Segment name
+        @param slots: Number of frames in the ring
+        @param slot_bytes: Maximum frame size [bytes]
+        """
+        size = _RING_HEADER.itemsize + slots * (_SLOT_HEADER.itemsize + slot_bytes)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Tracked, so unlink() below unregisters it
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _created.add(name)
+        ring_header = np.ndarray((), dtype=_RING_HEADER, buffer=shm.buf)
+        ring_header['slots'] = slots
+        ring_header['slot_bytes'] = slot_bytes
+        ring = cls(shm, owner=True)
+        ring.headers_[:] = np.zeros((), dtype=_SLOT_HEADER)
+        return ring
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attaches to the segment of a producer (consumer side).
+
+        @raise FileNotFoundError if the producer has not created it yet
+        """
+        return cls(_attach(name), owner=False)
+
+    def slot_view(self, slot, shape, dtype):
+        offset = self.data_offset_ + slot * self.slot_bytes_
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm_.buf, offset=offset)
+
+    def slot_seq(self, slot):
+        if self.headers_ is None:
+            # Closed
+            return -1
+        return int(self.headers_[slot]['seq'])
+
+    def write(self, image, sec, nanosec):
+        """
+        Copies image into the next slot.
+
+        @param image: HxW or HxWxC array, at most slot_bytes
+        @param sec: Stamp seconds
+        @param nanosec: Stamp nanoseconds
+        @return seq: Sequence number of the written frame
+        """
+        if image.nbytes > self.slot_bytes_:
+            raise ValueError('Frame of {} bytes does not fit the {} bytes slots'.format(image.nbytes, self.slot_bytes_))
+        slot = self.next_slot_
+        header = self.headers_[slot:slot + 1]
+        # Odd while the slot is being written
+        seq = 2 * self.frames_written_ + 1
+        header['seq'] = seq
+        np.copyto(self.slot_view(slot, image.shape, image.dtype), image)
+        height, width = image.shape[:2]
+        header['sec'] = sec
+        header['nanosec'] = nanosec
+        header['height'] = height
+        header['width'] = width
+        header['channels'] = image.shape[2] if image.ndim > 2 else 0
+        header['dtype'] = image.dtype.str.encode()
+        header['seq'] = seq + 1
+
+        self.next_slot_ = (slot + 1) % self.slots_
+        self.frames_written_ += 1
+        return seq + 1
+
+    def find(self, sec, nanosec):
+        """
+        @return ShmFrame with the given stamp, or None if it is not (or no longer) in the ring
+        """
+        matches = np.flatnonzero((self.headers_['sec'] == sec) & (self.headers_['nanosec'] == nanosec))
+        for slot in matches:
+            slot = int(slot)
+            header = self.headers_[slot]
+            seq = int(header['seq'])
+            if seq == 0 or seq % 2 == 1:
+                continue
+            shape = (int(header['height']), int(header['width']))
+            if header['channels'] > 0:
+                shape += (int(header['channels']),)
+            array = self.slot_view(slot, shape, np.dtype(header['dtype'].decode()))
+            array.flags.writeable = False
+            frame = ShmFrame(self, slot, seq, sec, nanosec, array)
+            # The slot may have been rewritten while the header was read
+            if frame.valid() and int(self.headers_[slot]['sec']) == sec and int(self.headers_[slot]['nanosec']) == nanosec:
+                return frame
+        return None
+
+    def newest_stamp(self):
+        """
+        @return (sec, nanosec) of the newest frame of the ring, or None if it is empty
+        """
+        written = self.headers_[(self.headers_['seq'] > 0) & (self.headers_['seq'] % 2 == 0)]
+        if len(written) == 0:
+            return None
+        newest = np.argmax(written['sec'].astype(np.int64) * 1000000000 + written['nanosec'])
+        return int(written[newest]['sec']), int(written[newest]['nanosec'])
+
+    def close(self):
+        """
+        Detaches from the segment. The producer also unlinks it.
+        Views of the frames must not be used after this.
+        """
+        if self.headers_ is None:
+            return
+        self.headers_ = None
+        try:
+            self.shm_.close()
+        except BufferError:
+            # Views of the frames are still referenced. The mapping is released when they are garbage collected
+            pass
+        if self.owner_:
+            self.shm_.unlink()
+            _created.discard(self.shm_.name)
+
+
+class ShmFrameClient:
+    """
+    Consumer side: resolves the stamps published on the index topic to frames of the ring.
+    Attaches to the segment on the first frame. The producer writes a frame before publishing its stamp,
+    so a stamp newer than all the frames of the ring means that the producer recreated the segment
+    (restart, or larger frames), and the client attaches again. An older stamp was overwritten.
+    """
+
+    def __init__(self, name):
+        self.name_ = name
+        self.ring_ = None
+
+        # Statistics
+        self.found_ = 0
+        self.missed_ = 0
+
+    def get(self, header):
+        """
+        @param header: std_msgs/Header of the index topic
+        @return ShmFrame with this header, or None if the frame is not (or no longer) in the ring
+        """
+        stamp = (header.stamp.sec, header.stamp.nanosec)
+        for _ in range(2):
+            if self.ring_ is None:
+                try:
+                    self.ring_ = ShmFrameRing.attach(self.name_)
+                except FileNotFoundError:
+                    break
+            frame = self.ring_.find(*stamp)
+            if frame is not None:
+                frame.header = header
+                self.found_ += 1
+                return frame
+            newest = self.ring_.newest_stamp()
+            if newest is not None and stamp <= newest:
+                break
+            # Not closed: the views of the old segment may still be in use. It is released when they are garbage collected
+            self.ring_ = None
+        self.missed_ += 1
+        return None
+
+    def stats(self):
+        """
+        @return dict of the found and missed frame counts
+        """
+        return {'found': self.found_, 'missed': self.missed_}
+
+    def close(self):
+        if self.ring_ is not None:
+            self.ring_.close()
+            self.ring_ = None
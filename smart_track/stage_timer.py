@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+"""
+StageTimer
+
+Per-stage latency histograms of a processing pipeline (conversion, TF lookup, segmentation, projection, ...).
+Each stage has a histogram with logarithmic bins from 1 us to 100 s (20 bins per decade, so a percentile is
+within about 12% of the exact value), so recording a sample is O(1) and the memory is fixed.
+The percentiles (p50/p95/p99) are read from the histograms, and reported per window, e.g. as a ROS diagnostics status.
+
+When disabled, the record methods return right away, so the calls can stay on the hot path.
+The timer can be shared by the threads of a MultiThreadedExecutor: recording and the window swap are guarded by a lock.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+MIN_LATENCY = 1e-6    # [s] Lower edge of the first bin
+DECADES = 8           # 1 us .. 100 s
+BINS_PER_DECADE = 20
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        # Bin 0: below MIN_LATENCY, last bin: above the range
+        self.counts_ = np.zeros(DECADES * BINS_PER_DECADE + 2, dtype=np.int64)
+        self.count_ = 0
+        self.sum_ = 0.0
+        self.max_ = 0.0
+
+    def record(self, latency):
+        """
+        @param latency: [s]
+        """
+        if latency < MIN_LATENCY:
+            i = 0
+        else:
+            i = min(int(math.log10(latency / MIN_LATENCY) * BINS_PER_DECADE) + 1, len(self.counts_) - 1)
+        self.counts_[i] += 1
+        self.count_ += 1
+        self.sum_ += latency
+        if latency > self.max_:
+            self.max_ = latency
+
+    def percentile(self, q):
+        """
+        @param q: Percentile, 0 to 100
+        @return Upper edge of the bin of the q-th percentile [s] (at most the max), or 0.0 if there is no sample
+        """
+        if self.count_ == 0:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.counts_), q / 100.0 * self.count_))
+        if i == len(self.counts_) - 1:
+            # Above the range of the bins
+            return self.max_
+        return min(MIN_LATENCY * 10 ** (i / BINS_PER_DECADE), self.max_)
+
+    def copy(self):
+        histogram = LatencyHistogram()
+        histogram.counts_[:] = self.counts_
+        histogram.count_ = self.count_
+        histogram.sum_ = self.sum_
+        histogram.max_ = self.max_
+        return histogram
+
+    def mean(self):
+        return self.sum_ / self.count_ if self.count_ else 0.0
+
+
+class StageTimer:
+
+    def __init__(self, enabled=True):
+        """
+        @param enabled: If False, nothing is recorded
+        """
+        self.enabled_ = enabled
+        self.histograms_ = {}
+        self.window_t0_ = time.monotonic()
+        self.lock_ = threading.Lock()
+
+    def record(self, stage, latency):
+        """
+        Adds a sample to the histogram of stage.
+
+        @param stage: Stage name
+        @param latency: [s]
+        """
+        if not self.enabled_:
+            return
+        with self.lock_:
+            histogram = self.histograms_.get(stage)
+            if histogram is None:
+                histogram = self.histograms_[stage] = LatencyHistogram()
+            histogram.record(latency)
+
+    def record_since(self, stage, t0):
+        """
+        Records the time since t0, and returns the current time, so consecutive stages can be chained:
+            t = time.perf_counter()
+            ...
+            t = timer.record_since('convert', t)
+
+        @param t0: time.perf_counter() at the start of the stage
+        @return time.perf_counter()
+        """
+        t = time.perf_counter()
+        if self.enabled_:
+            self.record(stage, t - t0)
+        return t
+
+    def summary(self, reset=True):
+        """
+        @param reset: Start a new window
+        @return dict {stage: {'count', 'rate', 'mean', 'p50', 'p95', 'p99', 'max'}} of the current window. Latencies in [s], rate in [Hz]
+        """
+        # The window is taken (and swapped) under the lock, and summarized outside of it
+        with self.lock_:
+            histograms = self.histograms_
+            elapsed = max(time.monotonic() - self.window_t0_, 1e-9)
+            if reset:
+                self.histograms_ = {}
+                self.window_t0_ = time.monotonic()
+            else:
+                histograms = {stage: h.copy() for stage, h in histograms.items()}
+        summary = {}
+        for stage, h in histograms.items():
+            summary[stage] = {
+                'count': h.count_,
+                'rate': h.count_ / elapsed,
+                'mean': h.mean(),
+                'p50': h.percentile(50),
+                'p95': h.percentile(95),
+                'p99': h.percentile(99),
+                'max': h.max_,
+            }
+        return summary
+
+    def diagnostic_status(self, name, hardware_id='', reset=True):
+        """
+        @param name: Name of the status, e.g. the node name
+        @param hardware_id: Hardware id of the status
+        @param reset: Start a new window
+        @return diagnostic_msgs/DiagnosticStatus with the count, rate, mean, p50, p95, p99 and max of each stage [ms]
+        """
+        # Imported here, so the timer itself does not depend on ROS
+        from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
+
+        summary = self.summary(reset)
+        status = DiagnosticStatus(name=name, hardware_id=hardware_id, level=DiagnosticStatus.OK, message='OK')
+        for stage, s in sorted(summary.items()):
+            status.values.append(KeyValue(key=stage + '/count', value=str(s['count'])))
+            status.values.append(KeyValue(key=stage + '/rate', value='{:.1f}'.format(s['rate'])))
+            for key in ('mean', 'p50', 'p95', 'p99', 'max'):
+                status.values.append(KeyValue(key='{}/{}_ms'.format(stage, key), value='{:.3f}'.format(s[key] * 1e3)))
+        if not summary:
+            status.message = 'No samples'
+        return status
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+"""
+SyntheticDepthScene
+
+Procedural depth frames with ground truth, for the offline benchmarks and the tests of the detection pipeline.
+A frame has a far wall and a floor, drone-like blobs (flat ellipses the size of a drone body) at known depths,
+elongated clutter (poles, beams) and NaN/inf holes like the ones of a real depth camera.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import cv2
+import numpy as np
+
+from .camera_model import PinholeCamera
+
+
+class SyntheticDepthScene:
+
+    def __init__(self, width=640, height=480, fx=460.0, fy=460.0, drone_size=0.6, depth_range=(3.0, 8.0),
+                 max_depth=15.0, n_drones=2, n_clutter=4, hole_fraction=0.01, inf_fraction=0.002, noise_std=0.01, seed=0):
+        """
+        @param width, height: Frame size [px]
+        @param fx, fy: Focal lengths [px]. The principal point is the image center
+        @param drone_size: Drone body width [m]
+        @param depth_range: (min, max) depth of the drones [m]
+        @param max_depth: Depth of the far wall [m]
+        @param n_drones: Number of drones per frame
+        @param n_clutter: Number of clutter objects per frame
+        @param hole_fraction: Approximate fraction of the pixels in NaN holes
+        @param inf_fraction: Fraction of isolated inf pixels
+        @param noise_std: Depth noise standard deviation [m]
+        @param seed: Random seed. The same seed gives the same frames
+        """
+        self.width_ = width
+        self.height_ = height
+        self.camera_ = PinholeCamera(fx, fy, width / 2.0, height / 2.0, width, height)
+        self.drone_size_ = drone_size
+        self.depth_range_ = depth_range
+        self.max_depth_ = max_depth
+        self.n_drones_ = n_drones
+        self.n_clutter_ = n_clutter
+        self.hole_fraction_ = hole_fraction
+        self.inf_fraction_ = inf_fraction
+        self.noise_std_ = noise_std
+        self.rng_ = np.random.default_rng(seed)
+
+        # Background: far wall, and a floor in the lower third that comes closer towards the bottom of the image
+        self.background_ = np.full((height, width), max_depth, dtype=np.float32)
+        floor_top = 2 * height // 3
+        rows = np.arange(floor_top, height, dtype=np.float32)
+        self.background_[floor_top:, :] = (max_depth * (1.0 - 0.7 * (rows - floor_top) / max(1, height - floor_top)))[:, None]
+
+    def camera(self):
+        """
+        @return PinholeCamera of the frames
+        """
+        return self.camera_
+
+    def frame(self):
+        """
+        @return image: HxW float32 depth image [m] with NaN/inf holes
+        @return targets: Nx4 array of the visible drones: row, col, depth [m], radius [px]
+        """
+        rng = self.rng_
+        image = self.background_ + rng.normal(0.0, self.noise_std_, self.background_.shape).astype(np.float32)
+
+        # Clutter: bars too elongated to pass the circularity filter
+        for _ in range(self.n_clutter_):
+            depth = rng.uniform(self.depth_range_[0] * 0.5, self.max_depth_ * 0.9)
+            long_side = rng.uniform(0.3, 0.9) * self.height_
+            short_side = max(3.0, long_side / rng.uniform(8.0, 15.0))
+            size = (short_side, long_side) if rng.random() < 0.5 else (long_side, short_side)
+            center = (rng.uniform(0, self.width_), rng.uniform(0, self.height_))
+            self.paint(image, cv2.boxPoints((center, size, rng.uniform(-20, 20))), depth)
+
+        # Drones, placed above the floor, far from each other
+        targets = []
+        for _ in range(self.n_drones_):
+            depth = rng.uniform(*self.depth_range_)
+            radius = self.camera_.fx_ * self.drone_size_ / 2.0 / depth
+            for _ in range(20):
+                col = rng.uniform(radius, self.width_ - radius)
+                row = rng.uniform(radius, 2 * self.height_ // 3 - radius)
+                if all(np.hypot(row - t[0], col - t[1]) > 3 * max(radius, t[3]) for t in targets):
+                    break
+            else:
+                continue
+            mask = np.zeros(image.shape, np.uint8)
+            cv2.ellipse(mask, (int(col), int(row)), (int(radius), int(radius * 0.7)), 0, 0, 360, 1, -1)
+            mask = mask.view(bool)
+            # Visible if in front of most of what is already there
+            visible = np.count_nonzero(image[mask] > depth) > 0.5 * np.count_nonzero(mask)
+            np.copyto(image, np.minimum(image, depth + rng.normal(0.0, self.noise_std_, image.shape).astype(np.float32)), where=mask)
+            if visible:
+                targets.append((row, col, depth, radius))
+
+        # Holes: NaN blobs (e.g. reflective or dark surfaces), and isolated inf pixels (out of range)
+        n_pixels = image.size
+        hole_pixels = 0
+        while hole_pixels < self.hole_fraction_ * n_pixels:
+            r = int(rng.integers(2, 9))
+            cv2.circle(image, (int(rng.integers(0, self.width_)), int(rng.integers(0, self.height_))), r, float('nan'), -1)
+            hole_pixels += np.pi * r * r
+        n_inf = int(self.inf_fraction_ * n_pixels)
+        image.ravel()[rng.integers(0, n_pixels, n_inf)] = np.inf
+
+        return image, np.array(targets, dtype=np.float64).reshape(-1, 4)
+
+    def paint(self, image, polygon, depth):
+        """
+        Fills polygon with depth where it is in front of the image.
+        """
+        mask = np.zeros(image.shape, np.uint8)
+        cv2.fillPoly(mask, [np.round(polygon).astype(np.int32)], 1)
+        np.copyto(image, np.minimum(image, np.float32(depth)), where=mask.view(bool))
+
+
+def match_detections(detections, targets, min_radius=10.0):
+    """
+    Greedy nearest matching of detections to the ground truth.
+    A detection matches a drone if its center is within the drone radius (at least min_radius pixels).
+
+    @param detections: Detection centers [row, col]
+    @param targets: Nx4 array of row, col, depth, radius (SyntheticDepthScene.frame())
+    @return List of (detection index, target index) pairs
+    """
+    if len(detections) == 0 or len(targets) == 0:
+        return []
+    det = np.asarray(detections, dtype=np.float64).reshape(-1, 2)
+    dist = np.linalg.norm(det[:, None, :] - targets[None, :, :2], axis=2)
+    dist[dist > np.maximum(targets[:, 3], min_radius)[None, :]] = np.inf
+    matches = []
+    while np.isfinite(dist).any():
+        i, j = np.unravel_index(np.argmin(dist), dist.shape)
+        matches.append((int(i), int(j)))
+        dist[i, :] = np.inf
+        dist[:, j] = np.inf
+    return matches
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""
+TFCache
+
+Cache layer over a tf2_ros Buffer.
+The lookups never wait: a transform that is not in the buffer raises the buffer's
+TransformException right away, instead of blocking the executor thread.
+
+A transform chain can be split at the frame a sensor is rigidly mounted to
+(e.g. map <- base_link <- camera). The static segment (base_link <- camera) is
+looked up once and memoized. The dynamic segment (map <- base_link) is reused
+for queries whose stamp is within stamp_tolerance of a cached query.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+from rclpy.time import Time
+
+from .transforms import compose_transforms
+
+
+class TFCache:
+
+    def __init__(self, tf_buffer, stamp_tolerance=0.0):
+        """
+        @param tf_buffer: tf2_ros Buffer
+        @param stamp_tolerance: A dynamic transform is reused for queries within this stamp difference [s].
+                                Negative disables the reuse.
+        """
+        self.tf_buffer_ = tf_buffer
+        self.stamp_tolerance_ = stamp_tolerance
+
+        self.static_links_ = {}    # child frame -> parent frame it is rigidly mounted to
+        self.static_cache_ = {}    # (parent, child) -> TransformStamped
+        self.dynamic_cache_ = {}   # (target, source) -> (query stamp [s], TransformStamped)
+
+        # Statistics
+        self.static_hits_ = 0
+        self.static_misses_ = 0
+        self.dynamic_hits_ = 0
+        self.dynamic_misses_ = 0
+        self.failures_ = 0
+
+    def add_static_link(self, child_frame, parent_frame):
+        """
+        Declares child_frame as rigidly mounted to parent_frame, so chains through child_frame are split at parent_frame.
+        """
+        if not child_frame or not parent_frame or child_frame == parent_frame:
+            return
+        if self.static_links_.get(child_frame) != parent_frame:
+            self.static_links_[child_frame] = parent_frame
+            self.static_cache_.pop((parent_frame, child_frame), None)
+
+    def lookup(self, target_frame, source_frame, stamp, time=None):
+        """
+        Transform from source_frame to target_frame.
+
+        @param target_frame: Target frame
+        @param source_frame: Source frame
+        @param stamp: Stamp of the data to transform [s]. Used to decide if a cached dynamic transform can be reused.
+        @param time: rclpy Time at which the dynamic segment is looked up. None for the latest transform.
+
+        @return TransformStamped
+        @raise tf2_ros.TransformException if the transform is not available
+        """
+        source_parent = self.static_links_.get(source_frame)
+        target_parent = self.static_links_.get(target_frame)
+        if source_parent == target_frame or target_parent == source_frame:
+            return self.lookup_static(target_frame, source_frame)
+        if source_parent is not None:
+            # target <- parent (dynamic) <- source (static)
+            return compose_transforms(self.lookup_dynamic(target_frame, source_parent, stamp, time),
+                                      self.lookup_static(source_parent, source_frame))
+        if target_parent is not None:
+            # target <- parent (static) <- source (dynamic)
+            return compose_transforms(self.lookup_static(target_frame, target_parent),
+                                      self.lookup_dynamic(target_parent, source_frame, stamp, time))
+        return self.lookup_dynamic(target_frame, source_frame, stamp, time)
+
+    def lookup_static(self, target_frame, source_frame):
+        key = (target_frame, source_frame)
+        transform = self.static_cache_.get(key)
+        if transform is not None:
+            self.static_hits_ += 1
+            return transform
+        self.static_misses_ += 1
+        transform = self.lookup_buffer(target_frame, source_frame)
+        self.static_cache_[key] = transform
+        return transform
+
+    def lookup_dynamic(self, target_frame, source_frame, stamp, time=None):
+        key = (target_frame, source_frame)
+        cached = self.dynamic_cache_.get(key)
+        if cached is not None and abs(stamp - cached[0]) <= self.stamp_tolerance_:
+            self.dynamic_hits_ += 1
+            return cached[1]
+        self.dynamic_misses_ += 1
+        transform = self.lookup_buffer(target_frame, source_frame, time)
+        self.dynamic_cache_[key] = (stamp, transform)
+        return transform
+
+    def lookup_buffer(self, target_frame, source_frame, time=None):
+        # No timeout: the lookup does not wait for the transform
+        try:
+            return self.tf_buffer_.lookup_transform(target_frame, source_frame, Time() if time is None else time)
+        except Exception:
+            self.failures_ += 1
+            raise
+
+    def hit_rate(self):
+        """
+        @return Fraction of the static and dynamic segment lookups served from the cache
+        """
+        hits = self.static_hits_ + self.dynamic_hits_
+        n = hits + self.static_misses_ + self.dynamic_misses_
+        return hits / n if n > 0 else 0.0
+
+    def stats(self):
+        """
+        @return dict of the hit/miss counts, failures and hit rate
+        """
+        return {
+            'static_hits': self.static_hits_,
+            'static_misses': self.static_misses_,
+            'dynamic_hits': self.dynamic_hits_,
+            'dynamic_misses': self.dynamic_misses_,
+            'failures': self.failures_,
+            'hit_rate': self.hit_rate(),
+        }
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""
+Batch rigid transforms of 3D points.
+
+Converts a geometry_msgs/TransformStamped into a 4x4 homogeneous matrix once,
+transforms Nx3 arrays of points with a single matrix multiply, and fills
+geometry_msgs/PoseArray messages from the result.
+
+This replaces building one tf2_geometry_msgs Pose per point and calling
+do_transform_pose on each of them, when all the points of a frame share the same transform.
+
+Author: Mohamed Abdelkader
+Contact: mohamedashraf123@gmail.com
+"""
+
+import numpy as np
+from geometry_msgs.msg import Point, Pose, PoseArray, Quaternion, TransformStamped
+
+
+def quaternion_to_rotation_matrix(x, y, z, w):
+    """
+    Rotation matrix of the (x, y, z, w) quaternion. The quaternion is normalized first.
+    """
+    n = x*x + y*y + z*z + w*w
+    if n == 0.0:
+        return np.identity(3)
+    s = 2.0 / n
+    return np.array([
+        [1.0 - s*(y*y + z*z), s*(x*y - z*w),       s*(x*z + y*w)],
+        [s*(x*y + z*w),       1.0 - s*(x*x + z*z), s*(y*z - x*w)],
+        [s*(x*z - y*w),       s*(y*z + x*w),       1.0 - s*(x*x + y*y)],
+    ])
+
+
+def transform_to_matrix(transform):
+    """
+    4x4 homogeneous matrix of a geometry_msgs/TransformStamped (or geometry_msgs/Transform).
+
+    @param transform: Transform from the child frame to the header frame
+    @return T: 4x4 np.ndarray, such that p_parent = T @ [p_child, 1]
+    """
+    tf = transform.transform if hasattr(transform, 'transform') else transform
+    q = tf.rotation
+    T = np.identity(4)
+    T[:3, :3] = quaternion_to_rotation_matrix(q.x, q.y, q.z, q.w)
+    T[:3, 3] = (tf.translation.x, tf.translation.y, tf.translation.z)
+    return T
+
+
+def compose_transforms(a, b):
+    """
+    Composition of two TransformStamped, a (target <- middle) and b (middle <- source).
+
+    @return TransformStamped from b's child frame to a's header frame, with the later of the two stamps.
+    One of the two is usually a static transform, so this is the stamp of the dynamic one
+    """
+    qa, ta = a.transform.rotation, a.transform.translation
+    qb, tb = b.transform.rotation, b.transform.translation
+    t = quaternion_to_rotation_matrix(qa.x, qa.y, qa.z, qa.w) @ (tb.x, tb.y, tb.z)
+
+    out = TransformStamped()
+    out.header.frame_id = a.header.frame_id
+    sa, sb = a.header.stamp, b.header.stamp
+    out.header.stamp = sa if (sa.sec, sa.nanosec) >= (sb.sec, sb.nanosec) else sb
+    out.child_frame_id = b.child_frame_id
+    out.transform.translation.x = ta.x + t[0]
+    out.transform.translation.y = ta.y + t[1]
+    out.transform.translation.z = ta.z + t[2]
+    # Hamilton product qa * qb
+    out.transform.rotation.x = qa.w*qb.x + qa.x*qb.w + qa.y*qb.z - qa.z*qb.y
+    out.transform.rotation.y = qa.w*qb.y - qa.x*qb.z + qa.y*qb.w + qa.z*qb.x
+    out.transform.rotation.z = qa.w*qb.z + qa.x*qb.y - qa.y*qb.x + qa.z*qb.w
+    out.transform.rotation.w = qa.w*qb.w - qa.x*qb.x - qa.y*qb.y - qa.z*qb.z
+    return out
+
+
+def transform_points(T, points):
+    """
+    Transforms an Nx3 array of points with a 4x4 homogeneous matrix, and drops non-finite results.
+
+    @param T: 4x4 transform matrix
+    @param points: Nx3 array-like of points
+
+    @return transformed: Mx3 array of the finite transformed points (M <= N)
+    @return valid: Boolean mask of length N of the points that were kept
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    transformed = points @ T[:3, :3].T + T[:3, 3]
+    valid = np.isfinite(transformed).all(axis=1)
+    return transformed[valid], valid
+
+
+def points_to_pose_array(points, frame_id, stamp, orientation=None):
+    """
+    Fills a PoseArray with one pose per point.
+
+    @param points: Nx3 array of positions
+    @param frame_id: PoseArray frame
+    @param stamp: PoseArray stamp (builtin_interfaces/Time)
+    @param orientation: geometry_msgs/Quaternion given to all the poses. Defaults to identity.
+
+    @return pose_array: PoseArray
+    """
+    if orientation is None:
+        orientation = Quaternion(x=0.0, y=0.0, z=0.0, w=1.0)
+    pose_array = PoseArray()
+    pose_array.header.frame_id = frame_id
+    pose_array.header.stamp = stamp
+    pose_array.poses = [Pose(position=Point(x=x, y=y, z=z), orientation=orientation)
+                        for x, y, z in np.asarray(points, dtype=np.float64).reshape(-1, 3).tolist()]
+    return pose_array
+
+
+class TransformMatrixCache:
+    """
+    Caches the 4x4 matrix of the last TransformStamped, keyed on its frames and stamp,
+    so the conversion is done once per frame even if several callers need it.
+    """
+
+    def __init__(self):
+        self.key_ = None
+        self.matrix_ = None
+
+    def matrix(self, transform):
+        key = (transform.header.frame_id, transform.child_frame_id,
+               transform.header.stamp.sec, transform.header.stamp.nanosec)
+        if key != self.key_:
+            self.matrix_ = transform_to_matrix(transform)
+            self.key_ = key
+        return self.matrix_
+
+    def transform_to_pose_array(self, points, transform, frame_id, stamp):
+        """
+        Transforms camera-frame points with transform, and returns them as a PoseArray.
+        As with do_transform_pose on an identity orientation, all the poses get the rotation of the transform.
+
+        @param points: Nx3 array-like of points in the transform's child frame
+        @param transform: TransformStamped from the points frame to frame_id
+        @param frame_id: PoseArray frame
+        @param stamp: PoseArray stamp
+
+        @return pose_array: PoseArray of the finite transformed points
+        @return n_dropped: Number of points dropped because their transform is not finite
+        """
+        transformed, valid = transform_points(self.matrix(transform), points)
+        pose_array = points_to_pose_array(transformed, frame_id, stamp, transform.transform.rotation)
+        return pose_array, int(len(valid) - np.count_nonzero(valid))
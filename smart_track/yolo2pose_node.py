@@ -16,18 +16,30 @@ Contact: mohamedashraf123@gmail.com
 
 import rclpy
 from rclpy.node import Node
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
+from rclpy.executors import MultiThreadedExecutor
 from sensor_msgs.msg import Image, CameraInfo
+from std_msgs.msg import Float64, Header
 from cv_bridge import CvBridge
+from diagnostic_msgs.msg import DiagnosticArray
 from yolov8_msgs.msg import DetectionArray
 from multi_target_kf.msg import KFTracks
 from geometry_msgs.msg import PoseArray, Pose, PoseWithCovarianceStamped, TransformStamped
 from tf2_ros import Buffer, TransformListener, TransformException
 from tf2_geometry_msgs import Pose as TF2Pose
 from tf2_geometry_msgs import do_transform_pose, do_transform_pose_with_covariance_stamped
-from message_filters import Subscriber, ApproximateTimeSynchronizer
+import time
 import cv2
 import numpy as np
-import copy
+
+from .camera_model import PinholeCamera
+from .depth_buffer import DepthRingBuffer
+from .handoff import LatestHandoff
+from .overlay_renderer import FORMATS as OVERLAY_FORMATS, OverlayRenderer
+from .shm_ring import ShmFrame, ShmFrameClient
+from .stage_timer import StageTimer
+from .tf_cache import TFCache
+from .transforms import TransformMatrixCache
 
 class Yolo2PoseNode(Node):
 
@@ -46,23 +58,64 @@ class Yolo2PoseNode(Node):
                 ('kf_feedback', True),
                 ('depth_roi', 5.0),
                 ('std_range', 5.0),
+                ('event_driven', False),
+                ('depth_buffer_mb', 64.0),
+                ('sync_slop', 0.1),
+                ('overlay_scale', 0.5),
+                ('overlay_format', 'raw'),
+                ('overlay_max_rate', 5.0),
+                ('overlay_max_depth', 20.0),
+                ('camera_mount_frame', ''),
+                ('tf_stamp_tolerance', 0.0),
+                ('multi_threaded', False),
+                ('num_threads', 3),
+                ('depth_transport', 'topic'),
+                ('shm_name', 'smart_track_depth'),
+                ('stage_timing', True),
+                ('diagnostics_period', 5.0),
             ]
         )
 
         # Get parameters
         self.debug_ = self.get_parameter('debug').value
         self.publish_processed_images_ = self.get_parameter('publish_processed_images').value
+        # Scale of the overlay images with respect to the depth image
+        self.overlay_scale_ = self.get_parameter('overlay_scale').value
+        # Format of the overlay images: 'raw' (depth image), 'bgr8' (8-bit visualization, depth mapped up to overlay_max_depth),
+        # or 'jpeg' (compressed 8-bit, on overlay_yolo_image/compressed)
+        self.overlay_format_ = self.get_parameter('overlay_format').value
+        if self.overlay_format_ not in OVERLAY_FORMATS:
+            self.get_logger().warn("[Yolo2PoseNode] Unknown overlay_format '{}'. Using 'raw'".format(self.overlay_format_))
+            self.overlay_format_ = 'raw'
         self.reference_frame_ = self.get_parameter('reference_frame').value
         self.camera_frame_ = self.get_parameter('camera_frame').value
+        # If True, a synchronized pair is processed as soon as it arrives. Otherwise, on a 20 Hz timer
+        self.event_driven_ = self.get_parameter('event_driven').value
+        # If True, the node is spun by a MultiThreadedExecutor. The ingest callbacks hand the latest messages over to a worker
+        self.multi_threaded_ = self.get_parameter('multi_threaded').value
+
+        # Callback groups. Ingest (depth, detections, KF tracks, camera info) stays responsive while the worker computes the poses.
+        # Without multi_threaded, both are the default group of the node.
+        self.ingest_group_ = None
+        self.worker_group_ = None
+        self.handoff_ = None
+        self.handoff_guard_ = None
+        if self.multi_threaded_:
+            self.ingest_group_ = MutuallyExclusiveCallbackGroup()
+            self.worker_group_ = MutuallyExclusiveCallbackGroup()
 
         self.cv_bridge_ = CvBridge()
 
-        # Camera intrinsics
-        self.camera_info_ = None
+        # Camera intrinsics (PinholeCamera)
+        self.camera_model_ = None
 
         # TF buffer and listener
         self.tf_buffer_ = Buffer()
         self.tf_listener_ = TransformListener(self.tf_buffer_, self)
+        self.transform_cache_ = TransformMatrixCache()
+        # Frame the camera is rigidly mounted to (e.g. base_link). The static mount transform is looked up once. Empty disables it
+        self.camera_mount_frame_ = self.get_parameter('camera_mount_frame').value
+        self.tf_cache_ = TFCache(self.tf_buffer_, self.get_parameter('tf_stamp_tolerance').value)
 
         # Initialize variables
         self.latest_detections_msg_ = DetectionArray()
@@ -76,30 +129,69 @@ class Yolo2PoseNode(Node):
         self.new_measurements_yolo = False
         self.new_measurements_kf = False
 
-        # Subscribers using message_filters
-        self.depth_sub_ = Subscriber(self, Image, "observer/depth_image")
-        self.detections_sub_ = Subscriber(self, DetectionArray, "detections")
-        self.kftracks_sub_ = Subscriber(self, KFTracks, "kf/good_tracks")
-
-        # Synchronizers
-        self.detection_depth_sync = ApproximateTimeSynchronizer(
-            [self.detections_sub_, self.depth_sub_], queue_size=100, slop=0.1)
-        self.detection_depth_sync.registerCallback(self.detection_depth_callback)
-
-        self.kftracks_depth_sync = ApproximateTimeSynchronizer(
-            [self.kftracks_sub_, self.depth_sub_], queue_size=100, slop=0.1)
-        self.kftracks_depth_sync.registerCallback(self.kftracks_depth_callback)
+        # Single depth subscription. YOLO detections and KF tracks are matched with the nearest depth frame in the buffer
+        self.depth_buffer_ = DepthRingBuffer(capacity_mb=self.get_parameter('depth_buffer_mb').value,
+                                             slop=self.get_parameter('sync_slop').value)
+        # Latest measurement of each path that arrived before its depth frame: {callback: msg}
+        self.pending_measurements_ = {}
+
+        # With depth_transport 'shm', the depth images are read from the shared memory ring of depth_shm_node,
+        # and only their headers are received. The buffer then holds ShmFrame views instead of Image messages.
+        # With 'intra', perception_container calls depth_callback() with the images it receives once for all the nodes of its process
+        self.shm_client_ = None
+        self.depth_sub_ = None
+        depth_transport = self.get_parameter('depth_transport').value
+        if depth_transport == 'shm':
+            self.shm_client_ = ShmFrameClient(self.get_parameter('shm_name').value)
+            self.depth_sub_ = self.create_subscription(Header, "observer/depth_image/shm", self.shm_index_callback, 10,
+                                                       callback_group=self.ingest_group_)
+        elif depth_transport != 'intra':
+            self.depth_sub_ = self.create_subscription(Image, "observer/depth_image", self.depth_callback, 10,
+                                                       callback_group=self.ingest_group_)
+        self.detections_sub_ = self.create_subscription(
+            DetectionArray, "detections", lambda msg: self.match_depth(msg, self.detection_depth_callback), 10,
+            callback_group=self.ingest_group_)
+        self.kftracks_sub_ = self.create_subscription(
+            KFTracks, "kf/good_tracks", lambda msg: self.match_depth(msg, self.kftracks_depth_callback), 10,
+            callback_group=self.ingest_group_)
 
         # Camera info subscriber
         self.caminfo_sub_ = self.create_subscription(
-            CameraInfo, 'observer/camera_info', self.caminfoCallback, 10)
+            CameraInfo, 'observer/camera_info', self.caminfoCallback, 10, callback_group=self.ingest_group_)
+
+        if self.multi_threaded_:
+            # The worker runs when the guard condition is triggered by a put(), in event-driven mode
+            if self.event_driven_:
+                self.handoff_guard_ = self.create_guard_condition(self.handoff_callback, callback_group=self.worker_group_)
+                self.handoff_ = LatestHandoff(notify=self.handoff_guard_.trigger)
+            else:
+                self.handoff_ = LatestHandoff()
 
         # Timer for state machine
-        self.timer_ = self.create_timer(0.05, self.timer_callback)  # Adjust interval as needed
+        self.timer_ = None
+        if not self.event_driven_:
+            self.timer_ = self.create_timer(0.05, self.timer_callback, callback_group=self.worker_group_)  # Adjust interval as needed
 
         # Publishers
         self.poses_pub_ = self.create_publisher(PoseArray, 'yolo_poses', 10)
-        self.overlay_ellipses_image_yolo_ = self.create_publisher(Image, "overlay_yolo_image", 10)
+        # End-to-end latency [s], from the measurement header stamp to the poses publish
+        self.latency_pub_ = self.create_publisher(Float64, 'yolo_poses/latency', 10)
+        self.latency_sum_ = 0.0
+        self.latency_count_ = 0
+        # Overlay of the YOLO detections or KF ellipses. Only rendered when it has subscribers, at most overlay_max_rate times per second
+        self.overlay_ = OverlayRenderer(self, "overlay_yolo_image", self.overlay_format_,
+                                        max_rate=self.get_parameter('overlay_max_rate').value,
+                                        scale=self.overlay_scale_,
+                                        max_depth=self.get_parameter('overlay_max_depth').value,
+                                        enabled=self.publish_processed_images_)
+
+        # Latency histograms of the processing stages (arrival, convert, tf_lookup, segmentation, projection, transform, overlay,
+        # publish, end_to_end), published as a diagnostics status every diagnostics_period seconds
+        self.stage_timer_ = StageTimer(self.get_parameter('stage_timing').value)
+        if self.stage_timer_.enabled_:
+            self.diagnostics_pub_ = self.create_publisher(DiagnosticArray, '/diagnostics', 10)
+            self.diagnostics_timer_ = self.create_timer(self.get_parameter('diagnostics_period').value, self.diagnostics_callback,
+                                                        callback_group=self.ingest_group_)
 
         # Initialize variables for processing
         self.latest_pixels_ = []
@@ -109,25 +201,107 @@ class Yolo2PoseNode(Node):
         self.filter_kernel_size = (5, 5)
         self.depth_threshold = 0
 
+    def shm_index_callback(self, header: Header):
+        """
+        Resolves the header to a frame of the shared memory ring, and buffers it.
+        """
+        frame = self.shm_client_.get(header)
+        if frame is None:
+            self.get_logger().warn("[Yolo2PoseNode::shm_index_callback] Depth frame is not in the shared memory ring. Dropping it",
+                                   throttle_duration_sec=5)
+            return
+        self.depth_callback(frame)
+
+    def diagnostics_callback(self):
+        """
+        Publishes the stage latency percentiles of the last window.
+        """
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = self.get_clock().now().to_msg()
+        diagnostics.status.append(self.stage_timer_.diagnostic_status('{}: stage latency'.format(self.get_name()), self.get_name()))
+        self.diagnostics_pub_.publish(diagnostics)
+
+    def depth_callback(self, depth_msg: Image):
+        """
+        Buffers the depth frame (Image, or ShmFrame with depth_transport 'shm'), and retries the measurements that were waiting for it.
+        """
+        if self.stage_timer_.enabled_:
+            self.stage_timer_.record('arrival', (self.get_clock().now() - rclpy.time.Time.from_msg(depth_msg.header.stamp)).nanoseconds / 1e9)
+        self.depth_buffer_.push(rclpy.time.Time.from_msg(depth_msg.header.stamp).nanoseconds / 1e9,
+                                depth_msg, depth_msg.nbytes if isinstance(depth_msg, ShmFrame) else len(depth_msg.data))
+
+        pending, self.pending_measurements_ = self.pending_measurements_, {}
+        for callback, msg in pending.items():
+            self.match_depth(msg, callback)
+
+        if self.debug_:
+            self.get_logger().info("[Yolo2PoseNode::depth_callback] Depth buffer: {}".format(self.depth_buffer_.stats()),
+                                   throttle_duration_sec=5)
+
+    def match_depth(self, msg, callback):
+        """
+        Calls callback(msg, depth_msg) with the buffered depth frame nearest to msg's stamp, within sync_slop.
+        If the matching frame may still arrive, msg waits for the next depth frames. It replaces the previous waiting msg of the same callback.
+        """
+        t = rclpy.time.Time.from_msg(msg.header.stamp).nanoseconds / 1e9
+        waiting = self.depth_buffer_.may_match_later(t)
+        depth_msg = self.depth_buffer_.lookup(t, record_miss=not waiting)
+        if depth_msg is not None:
+            callback(msg, depth_msg)
+        elif waiting:
+            self.pending_measurements_[callback] = msg
+
     def detection_depth_callback(self, detections_msg, depth_msg):
         """
         Callback for synchronized detections and depth images.
         """
+        if self.handoff_ is not None:
+            self.handoff_.put('yolo', (detections_msg, depth_msg))
+            return
         # Process synchronized depth and detection messages
-        self.latest_detections_msg_ = detections_msg
-        self.latest_depth_synced_with_yolo_msg_ = depth_msg
-        self.latest_detection_time_ = self.get_clock().now()
+        self.set_latest_detections(detections_msg, depth_msg)
         # self.update_detections(detections_msg)
+        if self.event_driven_:
+            self.process_measurements()
 
     def kftracks_depth_callback(self, kftracks_msg, depth_msg):
         """
         Callback for synchronized KFTracks and depth images.
         """
+        if self.handoff_ is not None:
+            self.handoff_.put('kf', (kftracks_msg, depth_msg))
+            return
         # Process synchronized depth and KF tracks messages
+        self.set_latest_kf_tracks(kftracks_msg, depth_msg)
+        # self.update_kf_tracks(kftracks_msg)
+        if self.event_driven_:
+            self.process_measurements()
+
+    def handoff_callback(self):
+        """
+        Worker callback in multi-threaded, event-driven mode. Processes the latest handed-off pairs, in the YOLO-first order.
+        Older pairs that were replaced while the worker was busy are dropped as stale.
+        """
+        items = self.handoff_.take()
+        if 'yolo' in items:
+            self.set_latest_detections(*items['yolo'])
+            self.process_measurements()
+        if 'kf' in items:
+            self.set_latest_kf_tracks(*items['kf'])
+            self.process_measurements()
+        if self.debug_:
+            self.get_logger().info("[Yolo2PoseNode::handoff_callback] Handoff: {}".format(self.handoff_.stats()),
+                                   throttle_duration_sec=5)
+
+    def set_latest_detections(self, detections_msg, depth_msg):
+        self.latest_detections_msg_ = detections_msg
+        self.latest_depth_synced_with_yolo_msg_ = depth_msg
+        self.latest_detection_time_ = self.get_clock().now()
+
+    def set_latest_kf_tracks(self, kftracks_msg, depth_msg):
         self.latest_kftracks_msg_ = kftracks_msg
         self.latest_depth_synced_with_kf_msg_ = depth_msg
         self.latest_kftracks_time_ = self.get_clock().now()
-        # self.update_kf_tracks(kftracks_msg)
 
     def is_new_detections(self):
         """
@@ -159,11 +333,24 @@ class Yolo2PoseNode(Node):
             else:
                 return False
         else:
-            False
+            return False
 
     def timer_callback(self):
         """
-        Timer callback acting as a state machine to decide whether to use YOLO or KF measurements.
+        Timer callback, used when event_driven is False.
+        """
+        if self.handoff_ is not None:
+            items = self.handoff_.take()
+            if 'yolo' in items:
+                self.set_latest_detections(*items['yolo'])
+            if 'kf' in items:
+                self.set_latest_kf_tracks(*items['kf'])
+        self.process_measurements()
+
+    def process_measurements(self):
+        """
+        State machine to decide whether to use YOLO or KF measurements.
+        YOLO detections are used first. KF tracks are only used if they are newer than the last YOLO detections.
         """
         use_yolo = self.get_parameter('yolo_measurement_only').value
         use_kf = self.get_parameter('kf_feedback').value
@@ -172,10 +359,10 @@ class Yolo2PoseNode(Node):
             if self.is_new_detections():
                 yolo_poses = self.yolo_process_pose(self.latest_depth_synced_with_yolo_msg_, self.latest_detections_msg_)
                 if yolo_poses and len(yolo_poses.poses) > 0:
-                    self.poses_pub_.publish(yolo_poses)
+                    self.publish_poses(yolo_poses, self.latest_detections_msg_.header.stamp)
                     return
                 else:
-                    self.get_logger().warn("[Yolo2PoseNode::timer_callback] Got a new Yolo measurment, but could not compute new poses!")
+                    self.get_logger().warn("[Yolo2PoseNode::process_measurements] Got a new Yolo measurment, but could not compute new poses!")
             # else:
             #     self.get_logger().warn("[Yolo2PoseNode::timer_callback] No new YOLO detections!")
 
@@ -183,71 +370,91 @@ class Yolo2PoseNode(Node):
             if self.is_new_kf_tracks():
                 kf_poses = self.kf_process_pose(self.latest_depth_synced_with_kf_msg_, self.latest_kftracks_msg_)
                 if kf_poses and len(kf_poses.poses) > 0:
-                    self.poses_pub_.publish(kf_poses)
+                    self.publish_poses(kf_poses, self.latest_kftracks_msg_.header.stamp)
                     return
                 else:
-                    self.get_logger().warn("[Yolo2PoseNode::timer_callback] Got new KF tracks, but could not compute new poses!")
+                    self.get_logger().warn("[Yolo2PoseNode::process_measurements] Got new KF tracks, but could not compute new poses!")
             # else:
             #     self.get_logger().warn("[Yolo2PoseNode::timer_callback] No new KF Tracks!")
 
         if not use_yolo and not use_kf:
-            self.get_logger().warn("[Yolo2PoseNode::timer_callback] use_yolo and use_kf are False")
+            self.get_logger().warn("[Yolo2PoseNode::process_measurements] use_yolo and use_kf are False")
     
+    def publish_poses(self, poses_msg: PoseArray, measurement_stamp):
+        """
+        Publishes the poses, and the latency from the measurement header stamp to now.
+        """
+        t = time.perf_counter()
+        self.poses_pub_.publish(poses_msg)
+        self.stage_timer_.record_since('publish', t)
+
+        latency = (self.get_clock().now() - rclpy.time.Time.from_msg(measurement_stamp)).nanoseconds / 1e9
+        self.stage_timer_.record('end_to_end', latency)
+        self.latency_pub_.publish(Float64(data=latency))
+        self.latency_sum_ += latency
+        self.latency_count_ += 1
+        if self.debug_:
+            self.get_logger().info("[Yolo2PoseNode::publish_poses] Latency {:.1f} ms, mean {:.1f} ms over {} publishes".format(
+                latency * 1e3, self.latency_sum_ / self.latency_count_ * 1e3, self.latency_count_), throttle_duration_sec=5)
+
     def caminfoCallback(self, msg: CameraInfo):
         """
         Callback function for handling camera information.
         """
-        # Fill self.camera_info_ field
-        K = np.array(msg.k)
-        if len(K) == 9:
-            K = K.reshape((3, 3))
-            self.camera_info_ = {'fx': K[0][0], 'fy': K[1][1], 'cx': K[0][2], 'cy': K[1][2]}
-        else:
+        # The camera model is only rebuilt when the intrinsics or the resolution change
+        if self.camera_model_ is not None and self.camera_model_.matches(msg):
+            return
+        camera_model = PinholeCamera.from_camera_info(msg)
+        if camera_model is None:
             self.get_logger().warn("[Yolo2PoseNode::caminfoCallback] Invalid camera info received.")
+            return
+        self.camera_model_ = camera_model
 
     def yolo_process_pose(self, depth_msg: Image, yolo_msg: DetectionArray):
         """
         Processes YOLO detections in the provided depth image to extract object poses.
         """
-        if self.camera_info_ is None:
+        if self.camera_model_ is None:
             if self.debug_:
                 self.get_logger().warn("[Yolo2PoseNode::yolo_process_pose] camera_info is None. Return")
             return None
 
+        t = time.perf_counter()
         try:
-            # Convert ROS Image message to OpenCV image
-            cv_image = self.cv_bridge_.imgmsg_to_cv2(depth_msg, desired_encoding="32FC1")
+            # Convert ROS Image message to OpenCV image. passthrough is a view of the message data, without a full-frame copy.
+            # Other encodings are converted per bounding box.
+            cv_image = self.depth_image_view(depth_msg)
         except Exception as e:
             self.get_logger().error("[Yolo2PoseNode::yolo_process_pose] Image to CvImg conversion error {}".format(e))
             return None
+        t = self.stage_timer_.record_since('convert', t)
 
         try:
-
-            transform = self.tf_buffer_.lookup_transform(
-                self.reference_frame_,
-                depth_msg.header.frame_id,
-                rclpy.time.Time(seconds=0),  # Use time=0 to get the latest transform
-                timeout=rclpy.duration.Duration(seconds=1.0)  # You can still specify a timeout
-            )
+            transform = self.lookup_camera_transform(self.reference_frame_, depth_msg.header.frame_id,
+                                                     depth_msg.header.frame_id, depth_msg.header.stamp)
         except TransformException as ex:
             self.get_logger().error(
                 f'[Yolo2PoseNode::yolo_process_pose] Could not transform {self.reference_frame_} to {depth_msg.header.frame_id}: {ex}')
             return None
+        t = self.stage_timer_.record_since('tf_lookup', t)
 
-        poses_msg = PoseArray()
-        poses_msg.header = copy.deepcopy(yolo_msg.header)
-        poses_msg.header.frame_id = self.reference_frame_
-        ellipse_color = (0, 255, 0)
-        text_color = (0, 255, 0)
+        # Centroid pixels (u, v) and depths, back-projected together after the loop
+        pixels = []
+        depths = []
+        # (center, radius) of the detections, for the overlay
+        circles = []
 
         for obj in yolo_msg.detections:
             x = int(obj.bbox.center.position.x - obj.bbox.size.x / 2)
             y = int(obj.bbox.center.position.y - obj.bbox.size.y / 2)
             w = int(obj.bbox.size.x)
             h = int(obj.bbox.size.y)
-            self.filter_kernel_size = (5, 5)
-            self.depth_threshold = 0
-            depth_image_roi = cv_image[y:y + h, x:x + w]
+            # Clip the bounding box to the image. Negative starts would wrap around in the slicing
+            x1 = min(x + w, cv_image.shape[1])
+            y1 = min(y + h, cv_image.shape[0])
+            x, y = max(x, 0), max(y, 0)
+            # View of the bounding box. Only the bounding box is converted if the image is not 32FC1
+            depth_image_roi = np.asarray(cv_image[y:y1, x:x1], dtype=np.float32)
 
             if depth_image_roi.size == 0:
                 self.get_logger().warn("[Yolo2PoseNode::yolo_process_pose] The bounding box from Yolo has no pixels. Skipping")
@@ -271,27 +478,49 @@ class Yolo2PoseNode(Node):
                 depth_at_centroid = depth_image_roi[cy, cx]
 
                 # Use centroid pixel and depth_at_centroid for further processing:
-                pixel = [x + cx, y + cy]
-                pose_msg = self.depthToPoseMsg(pixel, depth_at_centroid)
-                transformed_pose_msg = self.transform_pose(pose_msg, transform)
+                pixels.append((x + cx, y + cy))
+                depths.append(depth_at_centroid)
 
-                if transformed_pose_msg is not None:
-                    poses_msg.poses.append(transformed_pose_msg)
+                circles.append(((obj.bbox.center.position.x, obj.bbox.center.position.y), w / 2))
 
-                # Drawing circle for this detection
-                center_coordinates = (int(obj.bbox.center.position.x), int(obj.bbox.center.position.y))
-                cv2.circle(cv_image, center_coordinates, int(w / 2), ellipse_color, 1)
+        if not self.depth_frame_valid(depth_msg):
+            return None
+        t = self.stage_timer_.record_since('segmentation', t)
 
-        cv2.putText(cv_image, "YOLO", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, text_color, 2)
-        image_msg = self.cv_bridge_.cv2_to_imgmsg(cv_image, encoding="passthrough")
-        self.overlay_ellipses_image_yolo_.publish(image_msg)
+        camera_points = self.backproject_pixels(pixels, depths)
+        t = self.stage_timer_.record_since('projection', t)
+        poses_msg = self.transform_points(camera_points, transform, yolo_msg.header.stamp)
+        t = self.stage_timer_.record_since('transform', t)
+
+        if self.overlay_.publish(cv_image, depth_msg.header, circles=circles, text="YOLO"):
+            self.stage_timer_.record_since('overlay', t)
         return poses_msg
 
+    def depth_image_view(self, depth_msg):
+        """
+        @param depth_msg: Image, or ShmFrame with depth_transport 'shm'
+        @return Depth image as a view of the message data or of the shared memory slot, without a copy.
+            The view of a ShmFrame is read-only.
+        """
+        if isinstance(depth_msg, ShmFrame):
+            return depth_msg.array
+        return self.cv_bridge_.imgmsg_to_cv2(depth_msg, desired_encoding="passthrough")
+
+    def depth_frame_valid(self, depth_msg):
+        """
+        @return False if depth_msg is a ShmFrame that the producer overwrote while it was used
+        """
+        if isinstance(depth_msg, ShmFrame) and not depth_msg.valid():
+            self.get_logger().warn("[Yolo2PoseNode] Depth frame was overwritten in the shared memory ring. Discarding the poses",
+                                   throttle_duration_sec=5)
+            return False
+        return True
+
     def kf_process_pose(self, depth_msg: Image, kf_msg: KFTracks):
         """
         Processes Kalman Filter tracks in the provided depth image to extract object poses.
         """
-        if self.camera_info_ is None:
+        if self.camera_model_ is None:
             if self.debug_:
                 self.get_logger().warn("[Yolo2PoseNode::kf_process_pose] camera_info is None. Return")
             return None
@@ -299,27 +528,32 @@ class Yolo2PoseNode(Node):
         depth_roi_ = self.get_parameter('depth_roi').value
         std_range_ = self.get_parameter('std_range').value
 
+        t = time.perf_counter()
         try:
-            transform = self.tf_buffer_.lookup_transform(
-                self.reference_frame_,
-                depth_msg.header.frame_id,
-                rclpy.time.Time(seconds=0),  # Use time=0 to get the latest transform
-                timeout=rclpy.duration.Duration(seconds=1.0)  # You can still specify a timeout
-            )
+            transform = self.lookup_camera_transform(self.reference_frame_, depth_msg.header.frame_id,
+                                                     depth_msg.header.frame_id, depth_msg.header.stamp)
         except TransformException as ex:
             self.get_logger().error(f'[kf_process_pose] Could not transform {self.reference_frame_} to {depth_msg.header.frame_id}: {ex}')
             return None
+        t = self.stage_timer_.record_since('tf_lookup', t)
 
-        poses_msg_kf = PoseArray()
-        poses_msg_kf.header = copy.deepcopy(depth_msg.header)
-        poses_msg_kf.header.frame_id = self.reference_frame_
+        pixels = []
+        depths = []
 
-        depth_image_cv = self.cv_bridge_.imgmsg_to_cv2(depth_msg, desired_encoding='passthrough')
+        # View of the message data or of the shared memory slot. The ellipses are drawn on a copy, by the overlay renderer
+        depth_image_cv = self.depth_image_view(depth_msg)
+        t = self.stage_timer_.record_since('convert', t)
         image_width = depth_image_cv.shape[1]
         image_height = depth_image_cv.shape[0]
 
         self.latest_pixels_, self.latest_covariances_2d_, self.latest_depth_ranges_ = self.process_and_store_track_data(kf_msg)
 
+        # The blur is shared by all the tracks. Each track only masks and searches its covariance-ellipse ROI,
+        # so the per-frame cost grows with the number of tracks times the ROI area.
+        depth_image_blurred = None
+        # Ellipses of the overlay
+        ellipses = []
+
         for mean_pixel, covariance_matrix, depth_range in zip(self.latest_pixels_, self.latest_covariances_2d_, self.latest_depth_ranges_):
             x, y = mean_pixel
 
@@ -331,15 +565,17 @@ class Yolo2PoseNode(Node):
                     continue
                 rotation_angle = np.degrees(np.arctan2(eigenvectors[1, 0], eigenvectors[0, 0]))
                 axes_lengths = (int(depth_roi_ * np.sqrt(eigenvalues[0])), int(depth_roi_ * np.sqrt(eigenvalues[1])))
+                ellipses.append(((x, y), axes_lengths, rotation_angle))
 
-                # Draw the ellipse on the depth image
-                cv2.ellipse(depth_image_cv, (x, y), axes_lengths, rotation_angle, 0, 360, (0, 255, 0), 2)
+                if depth_image_blurred is None:
+                    depth_image_blurred = cv2.GaussianBlur(depth_image_cv, (5, 5), 0)
 
-                # Perform depth-based filtering
-                depth_image_blurred = cv2.GaussianBlur(depth_image_cv, (5, 5), 0)
-                depth_mask = cv2.inRange(depth_image_blurred, depth_range[0], depth_range[1])
+                # Bounding box of the rotated ellipse
+                x0, y0, x1, y1 = self.ellipse_roi(x, y, axes_lengths, rotation_angle, image_width, image_height)
 
-                kfcontours, _ = cv2.findContours(depth_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                # Perform depth-based filtering. offset= returns the contours in full-image coordinates
+                depth_mask = cv2.inRange(depth_image_blurred[y0:y1, x0:x1], depth_range[0], depth_range[1])
+                kfcontours, _ = cv2.findContours(depth_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0))
 
                 nearest_depth_value = None
                 min_distance = float('inf')
@@ -368,22 +604,38 @@ class Yolo2PoseNode(Node):
                                     nearest_centroid_y = centroid_y
 
                 if nearest_depth_value is not None:
-                    pixel_pose = [nearest_centroid_x, nearest_centroid_y]
-                    kf_pose_msg = self.depthToPoseMsg(pixel_pose, nearest_depth_value)
-                    kf_transformed_pose_msg = self.transform_pose(kf_pose_msg, transform)
-                    if kf_transformed_pose_msg is not None:
-                        poses_msg_kf.poses.append(kf_transformed_pose_msg)
+                    pixels.append((nearest_centroid_x, nearest_centroid_y))
+                    depths.append(nearest_depth_value)
                 else:
                     self.get_logger().warn("No valid depth value found for KF tracks.")
 
-        cv2.putText(depth_image_cv, "KF", (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        if not self.depth_frame_valid(depth_msg):
+            return None
+        t = self.stage_timer_.record_since('segmentation', t)
+
+        camera_points = self.backproject_pixels(pixels, depths)
+        t = self.stage_timer_.record_since('projection', t)
+        poses_msg_kf = self.transform_points(camera_points, transform, depth_msg.header.stamp)
+        t = self.stage_timer_.record_since('transform', t)
 
-        # Publish the modified depth image with ellipses
-        ellipses_image_msg = self.cv_bridge_.cv2_to_imgmsg(depth_image_cv, encoding="passthrough")
-        self.overlay_ellipses_image_yolo_.publish(ellipses_image_msg)
+        if self.overlay_.publish(depth_image_cv, depth_msg.header, ellipses=ellipses, text="KF"):
+            self.stage_timer_.record_since('overlay', t)
 
         return poses_msg_kf
 
+    def ellipse_roi(self, x, y, axes_lengths, rotation_angle, image_width, image_height):
+        """
+        Bounding box (x0, y0, x1, y1) of an ellipse drawn with cv2.ellipse, clipped to the image.
+        """
+        a, b = axes_lengths
+        theta = np.radians(rotation_angle)
+        c, s = np.cos(theta), np.sin(theta)
+        # +1 px to cover the rounding of the axes lengths
+        half_w = int(np.ceil(np.sqrt((a * c) ** 2 + (b * s) ** 2))) + 1
+        half_h = int(np.ceil(np.sqrt((a * s) ** 2 + (b * c) ** 2))) + 1
+        return (max(0, x - half_w), max(0, y - half_h),
+                min(image_width, x + half_w + 1), min(image_height, y + half_h + 1))
+
     def process_and_store_track_data(self, kf_msg: KFTracks):
         """
         Processes Kalman Filter track data to extract pixel coordinates, 2D covariances, and depth ranges.
@@ -393,11 +645,8 @@ class Yolo2PoseNode(Node):
         self.latest_depth_ranges_.clear()
 
         try:
-            transform = self.tf_buffer_.lookup_transform(
-                self.camera_frame_,
-                kf_msg.header.frame_id,
-                rclpy.time.Time(),
-                timeout=rclpy.duration.Duration(seconds=1.0))
+            transform = self.lookup_camera_transform(self.camera_frame_, kf_msg.header.frame_id,
+                                                     self.camera_frame_, kf_msg.header.stamp)
         except TransformException as ex:
             self.get_logger().error(
                 f'[process_and_store_track_data] Could not transform {kf_msg.header.frame_id} to {self.camera_frame_}: {ex}')
@@ -462,25 +711,16 @@ class Yolo2PoseNode(Node):
         """
         Projects 3D coordinates onto 2D pixel coordinates.
         """
-        pixel = [0, 0]
-        fx = self.camera_info_['fx']
-        fy = self.camera_info_['fy']
-        cx = self.camera_info_['cx']
-        cy = self.camera_info_['cy']
-
-        # Calculate 2D pixel coordinates from 3D positions (XYZ)
-        if z_cam != 0:
-            u = int(fx * x_cam / z_cam + cx)
-            v = int(fy * y_cam / z_cam + cy)
-            pixel = [u, v]
-        return pixel
+        # Calculate 2D pixel coordinates from 3D positions (XYZ). [0, 0] if z_cam == 0
+        u, v = self.camera_model_.project((x_cam, y_cam, z_cam))[0]
+        return [int(u), int(v)]
 
     def project_3d_covariance_to_2d(self, x_cam, y_cam, z_cam, cov_x, cov_y, cov_z):
         """
         Projects 3D covariances onto 2D covariances.
         """
-        fx = self.camera_info_['fx']
-        fy = self.camera_info_['fy']
+        fx = self.camera_model_.fx_
+        fy = self.camera_model_.fy_
 
         J = np.array([[fx / z_cam, 0, -fx * x_cam / z_cam**2],
                       [0, fy / z_cam, -fy * y_cam / z_cam**2]])
@@ -489,33 +729,49 @@ class Yolo2PoseNode(Node):
         covariance_2d = J @ covariance_3d @ J.T
         return covariance_2d
 
+    def backproject_pixels(self, pixels, depths):
+        """
+        Computes 3D projections of (u, v) pixels with known depths in the camera frame, in one call.
+        """
+        if len(pixels) == 0:
+            return np.empty((0, 3))
+        pixels = np.asarray(pixels, dtype=np.float64)
+        return self.camera_model_.backproject(pixels[:, 0], pixels[:, 1], depths)
+
     def depthToPoseMsg(self, pixel, depth):
         """
         Computes 3D projections of detections in the camera frame.
         """
         pose_msg = Pose()
-        if self.camera_info_ is None:
+        if self.camera_model_ is None:
             self.get_logger().warn("[Yolo2PoseNode::depthToPoseMsg] Camera intrinsic parameters are not available.")
             return pose_msg
 
-        fx = self.camera_info_['fx']
-        fy = self.camera_info_['fy']
-        cx = self.camera_info_['cx']
-        cy = self.camera_info_['cy']
-        u = pixel[0]  # horizontal image coordinate
-        v = pixel[1]  # vertical image coordinate
-        d = depth  # depth
-
-        x = d * (u - cx) / fx
-        y = d * (v - cy) / fy
+        x, y, d = self.camera_model_.backproject(pixel[0], pixel[1], depth)[0].tolist()
 
         pose_msg.position.x = x
         pose_msg.position.y = y
-        pose_msg.position.z = float(d)
+        pose_msg.position.z = d
         pose_msg.orientation.w = 1.0
 
         return pose_msg
 
+    def lookup_camera_transform(self, target_frame, source_frame, camera_frame, stamp) -> TransformStamped:
+        """
+        Latest transform from source_frame to target_frame, through the TF cache. Does not wait for the transform.
+
+        @param camera_frame: Camera frame of the chain, rigidly mounted to camera_mount_frame
+        @param stamp: Stamp of the data to transform (builtin_interfaces/Time)
+        @raise TransformException if the transform is not available
+        """
+        self.tf_cache_.add_static_link(camera_frame, self.camera_mount_frame_)
+        t = rclpy.time.Time.from_msg(stamp).nanoseconds / 1e9
+        transform = self.tf_cache_.lookup(target_frame, source_frame, t)
+        if self.debug_:
+            self.get_logger().info("[Yolo2PoseNode::lookup_camera_transform] TF cache: {}".format(self.tf_cache_.stats()),
+                                   throttle_duration_sec=5)
+        return transform
+
     def transform_pose(self, pose: Pose, tr: TransformStamped) -> Pose:
         """
         Converts 3D positions in the camera frame to the reference frame.
@@ -539,6 +795,23 @@ class Yolo2PoseNode(Node):
 
         return transformed_pose
 
+    def transform_points(self, points, tr: TransformStamped, stamp) -> PoseArray:
+        """
+        Converts 3D points in the camera frame to a PoseArray in the reference frame, with a single matrix multiply.
+        """
+        try:
+            poses_msg, n_dropped = self.transform_cache_.transform_to_pose_array(points, tr, self.reference_frame_, stamp)
+        except Exception as e:
+            self.get_logger().error("[transform_points] Error in transforming points: {}".format(e))
+            poses_msg = PoseArray()
+            poses_msg.header.frame_id = self.reference_frame_
+            poses_msg.header.stamp = stamp
+            return poses_msg
+
+        if n_dropped > 0:
+            self.get_logger().error("[transform_points] {} transformed poses contain NaN in the position values".format(n_dropped))
+        return poses_msg
+
     def transform_pose_cov(self, pose: PoseWithCovarianceStamped, tr: TransformStamped) -> PoseWithCovarianceStamped:
         """
         Converts 3D pose with covariance from the frame in pose to the frame in tr.
@@ -551,11 +824,24 @@ class Yolo2PoseNode(Node):
 
         return pose_cov_stamped
 
+    def close(self):
+        """
+        Detaches from the shared memory ring.
+        """
+        if self.shm_client_ is not None:
+            self.shm_client_.close()
+
 def main(args=None):
     rclpy.init(args=args)
     yolo2pose_node = Yolo2PoseNode()
     yolo2pose_node.get_logger().info("Yolo to Pose conversion node has started")
-    rclpy.spin(yolo2pose_node)
+    if yolo2pose_node.multi_threaded_:
+        executor = MultiThreadedExecutor(num_threads=yolo2pose_node.get_parameter('num_threads').value)
+        executor.add_node(yolo2pose_node)
+        executor.spin()
+    else:
+        rclpy.spin(yolo2pose_node)
+    yolo2pose_node.close()
     yolo2pose_node.destroy_node()
     rclpy.shutdown()
 
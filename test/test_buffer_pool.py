@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.buffer_pool.BufferPool, and of its use by DroneDetector.preProcessing.
+"""
+
+import numpy as np
+from smart_track.buffer_pool import BufferPool
+from smart_track.detection import DroneDetector
+from smart_track.synthetic_depth import SyntheticDepthScene
+
+
+def test_buffers_are_reused_across_frames():
+    pool = BufferPool()
+    pool.begin_frame((480, 640))
+    norm = pool.get('norm', np.float32)
+    assert norm.shape == (480, 640) and norm.dtype == np.float32
+    pool.end_frame()
+
+    pool.begin_frame((480, 640))
+    assert pool.get('norm', np.float32) is norm
+    assert pool.get('norm', np.uint8) is not norm
+    assert pool.get('crop', np.uint8, (10, 20)).shape == (10, 20)
+
+
+def test_resolution_change_and_eviction():
+    pool = BufferPool(max_resolutions=2)
+    buffers = {}
+    for resolution in [(480, 640), (120, 160), (480, 640)]:
+        pool.begin_frame(resolution)
+        buf = pool.get('norm', np.float32)
+        assert buf.shape == resolution
+        buffers.setdefault(resolution, buf)
+        pool.end_frame()
+    assert buffers[(480, 640)] is pool.get('norm', np.float32)
+
+    # A third resolution drops the least recently used one (120x160)
+    pool.begin_frame((240, 320))
+    pool.get('norm', np.float32)
+    pool.begin_frame((120, 160))
+    assert pool.get('norm', np.float32) is not buffers[(120, 160)]
+    assert set(pool.pools_) == {(240, 320), (120, 160)}
+
+
+def test_frame_and_peak_bytes():
+    pool = BufferPool()
+    pool.begin_frame((100, 100))
+    pool.get('a', np.float32)
+    pool.get('a', np.float32)
+    pool.get('b', np.uint8)
+    assert pool.end_frame() == 100 * 100 * 5
+
+    pool.begin_frame((100, 100))
+    pool.get('b', np.uint8)
+    assert pool.end_frame() == 100 * 100
+    assert pool.peak_frame_bytes_ == 100 * 100 * 5
+    assert pool.total_bytes() == 100 * 100 * 5
+
+
+def test_detector_reuses_its_working_buffers():
+    detector = DroneDetector([300, 10000], [0.4, 0.99], [0.7, 1.0], 30, 4, 15.0, 1.0, 2.0, False)
+    scene = SyntheticDepthScene(seed=2)
+    detector.preProcessing(scene.frame()[0])
+    buffers = dict(detector.buffer_pool_.buffers_)
+    assert {'norm', 'eroded', 'thr', 'not_eroded_thr', 'contours_mask'} <= set(buffers)
+
+    for _ in range(3):
+        detector.preProcessing(scene.frame()[0])
+    assert all(detector.buffer_pool_.buffers_[name] is buf for name, buf in buffers.items())
+    assert detector.buffer_pool_.peak_frame_bytes_ >= detector.buffer_pool_.frame_bytes_ > 0
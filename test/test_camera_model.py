@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.camera_model.PinholeCamera against the per-pixel back-projection loop it replaced.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from smart_track.camera_model import PinholeCamera
+
+FX, FY, CX, CY = 615.3, 614.8, 321.7, 238.2
+
+
+def reference_backproject(u, v, d):
+    """
+    Former DroneDetector.depthTo3D loop, one pixel at a time
+    """
+    return [d*(u-CX)/FX, d*(v-CY)/FY, d]
+
+
+@pytest.fixture
+def camera():
+    return PinholeCamera(FX, FY, CX, CY, 640, 480)
+
+
+def test_backproject_matches_loop(camera):
+    rng = np.random.default_rng(0)
+    u = rng.uniform(0, 640, 100)
+    v = rng.uniform(0, 480, 100)
+    d = rng.uniform(0.3, 20.0, 100)
+    expected = [reference_backproject(*p) for p in zip(u, v, d)]
+    np.testing.assert_allclose(camera.backproject(u, v, d), expected, rtol=1e-12)
+    # Lists and scalars are accepted as well
+    np.testing.assert_allclose(camera.backproject(u.tolist(), v.tolist(), d.tolist()), expected, rtol=1e-12)
+    np.testing.assert_allclose(camera.backproject(10, 20, 3.0), [reference_backproject(10, 20, 3.0)], rtol=1e-12)
+    assert camera.backproject([], [], []).shape == (0, 3)
+
+
+@pytest.mark.parametrize('x0, y0, w, h', [(0, 0, 640, 480), (100, 50, 37, 21), (600, 450, 40, 30)])
+def test_backproject_crop_matches_loop(camera, x0, y0, w, h):
+    crop = np.random.default_rng(x0).uniform(0.3, 20.0, (h, w)).astype(np.float32)
+    crop[0, 0] = np.nan
+    points = camera.backproject_crop(crop, x0, y0)
+
+    assert points.shape == (h, w, 3)
+    expected = np.array([[reference_backproject(x0 + c, y0 + r, float(crop[r, c])) for c in range(w)] for r in range(h)])
+    np.testing.assert_allclose(points, expected, rtol=1e-12)
+
+
+def test_crop_past_the_resolution_grows_the_table():
+    camera = PinholeCamera(FX, FY, CX, CY)
+    crop = np.full((10, 20), 2.0)
+    points = camera.backproject_crop(crop, 630, 475)
+    assert (camera.width_, camera.height_) == (650, 485)
+    np.testing.assert_allclose(points[9, 19], reference_backproject(649, 484, 2.0), rtol=1e-12)
+
+
+def test_project_inverts_backproject(camera):
+    rng = np.random.default_rng(1)
+    pixels = rng.uniform(0, [640, 480], size=(50, 2))
+    points = camera.backproject(pixels[:, 0], pixels[:, 1], rng.uniform(0.3, 20.0, 50))
+    np.testing.assert_allclose(camera.project(points), pixels, rtol=1e-12)
+    np.testing.assert_array_equal(camera.project([[1.0, 2.0, 0.0]]), [[0.0, 0.0]])
+
+
+def test_from_camera_info():
+    msg = SimpleNamespace(k=[FX, 0.0, CX, 0.0, FY, CY, 0.0, 0.0, 1.0], width=640, height=480)
+    camera = PinholeCamera.from_camera_info(msg)
+    assert camera.matches(msg)
+    assert PinholeCamera.from_camera_info(SimpleNamespace(k=[0.0] * 9, width=640, height=480)) is None
+    msg.width = 1280
+    assert not camera.matches(msg)
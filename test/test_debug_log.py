@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.debug_log: rate limiting, lazy formatting and the sampled rejection ring.
+"""
+
+import numpy as np
+
+from smart_track.debug_log import RateLimitedLogger, RejectionLog
+
+
+class ListSink:
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(('info', message))
+
+    def warning(self, message):
+        self.messages.append(('warning', message))
+
+
+class Unformattable:
+
+    def __format__(self, spec):
+        raise AssertionError('formatted a suppressed message')
+
+
+def test_rate_limit_per_key():
+    now = [0.0]
+    sink = ListSink()
+    log = RateLimitedLogger(sink, period=1.0, clock=lambda: now[0])
+    assert log.info('a', 'x = {}', 1)
+    assert not log.info('a', 'x = {}', Unformattable())
+    assert not log.info('a', 'x = {}', Unformattable())
+    # Other keys are limited separately
+    assert log.warning('b', 'y')
+    now[0] = 1.5
+    assert log.info('a', 'x = {}', 2)
+    assert sink.messages == [('info', 'x = 1'), ('warning', 'y'), ('info', 'x = 2 (2 similar messages suppressed)')]
+
+
+def test_rejection_ring_sampling():
+    ring = RejectionLog(capacity=4, sample_period=3)
+    ring.add(1, 'area', np.arange(5.0), np.arange(5.0), [10, 100])
+    ring.add(2, 'circularity', np.array([0.1, 0.2, 0.3]), np.array([50.0, 60.0, 70.0]), [0.3, 0.99])
+    # Rejections 0, 3 of the first call and 6 (the second of the second call)
+    assert [(r['frame'], r['reason'], r['value']) for r in ring.dump()] == [(1, 'area', 0.0), (1, 'area', 3.0), (2, 'circularity', 0.2)]
+    assert ring.dump()[2]['area'] == 60.0 and ring.dump()[2]['bounds'] == [0.3, 0.99]
+
+    ring.add(3, 'convexity', np.arange(9.0), np.arange(9.0), [0.7, 1.0])
+    records = ring.dump(clear=True)
+    # Bounded: only the newest 4 records are kept
+    assert len(records) == 4 and records[-1]['frame'] == 3
+    assert len(ring) == 0
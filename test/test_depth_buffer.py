@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.depth_buffer.DepthRingBuffer: stamp matching within the slop, and eviction by size.
+"""
+
+import pytest
+from smart_track.depth_buffer import DepthRingBuffer
+
+MB = 1024 * 1024
+
+
+def filled(stamps, capacity_mb=64.0, slop=0.02, nbytes=MB):
+    buffer = DepthRingBuffer(capacity_mb, slop)
+    for stamp in stamps:
+        buffer.push(stamp, 'frame {}'.format(stamp), nbytes)
+    return buffer
+
+
+def test_lookup_returns_nearest_frame_within_slop():
+    buffer = filled([1.0, 1.1, 1.2])
+    assert buffer.lookup(1.1) == 'frame 1.1'
+    assert buffer.lookup(1.115) == 'frame 1.1'
+    assert buffer.lookup(1.186) == 'frame 1.2'
+    assert buffer.lookup(0.99) == 'frame 1.0'
+    assert buffer.lookup(1.15) is None
+    assert buffer.lookup(1.3) is None
+
+    stats = buffer.stats()
+    assert (stats['hits'], stats['misses']) == (4, 2)
+    assert stats['max_match_error'] == pytest.approx(0.015)
+    assert stats['mean_match_error'] == pytest.approx((0.0 + 0.015 + 0.014 + 0.01) / 4)
+
+
+def test_out_of_order_frames_are_sorted():
+    buffer = filled([1.0, 1.2, 1.1, 0.9])
+    assert buffer.stamps_ == [0.9, 1.0, 1.1, 1.2]
+    assert buffer.lookup(1.1) == 'frame 1.1'
+
+
+def test_miss_can_be_left_uncounted():
+    buffer = filled([1.0])
+    assert buffer.may_match_later(1.0)
+    assert buffer.lookup(1.5, record_miss=False) is None
+    assert buffer.stats()['misses'] == 0
+    buffer.push(2.0, 'frame 2.0', MB)
+    assert not buffer.may_match_later(1.5)
+    assert filled([]).may_match_later(1.5)
+
+
+def test_oldest_frames_are_evicted():
+    buffer = filled([0.1 * i for i in range(10)], capacity_mb=4.0)
+    assert len(buffer) == 4
+    assert buffer.stamps_ == pytest.approx([0.6, 0.7, 0.8, 0.9])
+    assert buffer.lookup(0.0) is None
+    assert buffer.lookup(0.6) == 'frame {}'.format(0.1 * 6)
+
+    stats = buffer.stats()
+    assert stats['evictions'] == 6
+    assert stats['bytes'] == 4 * MB and stats['occupancy'] == pytest.approx(1.0)
+
+
+def test_newest_frame_is_kept_when_larger_than_capacity():
+    buffer = filled([1.0, 2.0], capacity_mb=1.0, nbytes=3 * MB)
+    assert buffer.stamps_ == [2.0]
+    assert buffer.lookup(2.0) == 'frame 2.0'
+
+
+def test_empty_buffer():
+    buffer = DepthRingBuffer()
+    assert buffer.nearest(1.0) == (None, float('inf'))
+    assert buffer.lookup(1.0) is None
+    assert buffer.stats()['misses'] == 1
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.depth_recording: round trip, zero-copy replay, lookup by stamp and interrupted recordings.
+"""
+
+import numpy as np
+import pytest
+
+from smart_track.camera_model import PinholeCamera
+from smart_track.depth_recording import DepthRecording, DepthRecordingWriter
+
+CAMERA = PinholeCamera(460.0, 461.0, 32.0, 24.0, 64, 48)
+
+
+def frames(n):
+    rng = np.random.default_rng(0)
+    images = rng.uniform(0.5, 15.0, size=(n, 48, 64)).astype(np.float32)
+    images[:, 0, 0] = np.nan
+    images[:, 0, 1] = np.inf
+    return images
+
+
+def record(path, images, stamps, dtype='float32'):
+    with DepthRecordingWriter(str(path), 64, 48, dtype, 'camera') as writer:
+        for stamp, image in zip(stamps, images):
+            writer.write_frame(stamp, image, CAMERA)
+        writer.write_detections(stamps[1], [(10.0, 20.0, 8.0, 6.0, 0.9, 0), (30.0, 20.0, 4.0, 4.0, 0.5, 1)])
+
+
+def test_round_trip_float32(tmp_path):
+    images = frames(5)
+    stamps = [1000 + 33 * i for i in range(5)]
+    record(tmp_path / 'rec', images, stamps)
+
+    recording = DepthRecording(str(tmp_path / 'rec'))
+    assert len(recording) == 5
+    assert recording.frame_id_ == 'camera'
+    for i, (stamp, frame) in enumerate(recording):
+        assert stamp == stamps[i]
+        assert np.array_equal(frame, images[i], equal_nan=True)
+    camera = recording.camera(2)
+    assert (camera.fx_, camera.fy_, camera.cx_, camera.cy_) == (460.0, 461.0, 32.0, 24.0)
+
+
+def test_frames_are_read_only_views(tmp_path):
+    record(tmp_path / 'rec', frames(3), [0, 1, 2])
+    recording = DepthRecording(str(tmp_path / 'rec'))
+    frame = recording.frame(1)
+    assert isinstance(frame.base, np.memmap) or isinstance(frame, np.memmap)
+    assert not frame.flags.writeable
+    with pytest.raises(ValueError):
+        frame[0, 0] = 1.0
+
+
+def test_float16_storage(tmp_path):
+    images = frames(2)
+    record(tmp_path / 'rec', images, [0, 1], dtype='float16')
+    recording = DepthRecording(str(tmp_path / 'rec'))
+    assert recording.frame(0).dtype == np.float16
+    finite = np.isfinite(images[0])
+    assert np.allclose(recording.frame(0)[finite], images[0][finite], atol=0.01)
+    assert np.isnan(recording.frame(0)[0, 0]) and np.isinf(recording.frame(0)[0, 1])
+
+
+def test_find_by_stamp_and_detections(tmp_path):
+    stamps = [1000, 1033, 1066, 1100]
+    record(tmp_path / 'rec', frames(4), stamps)
+    recording = DepthRecording(str(tmp_path / 'rec'))
+    assert recording.find(1066) == 2
+    assert recording.find(1040, slop_ns=10) == 1
+    assert recording.find(1050, slop_ns=10) is None
+    assert recording.find(5000, slop_ns=10) is None
+
+    detections = recording.detections_at(1033)
+    assert len(detections) == 2
+    assert detections[0]['cx'] == 10.0 and detections[1]['class_id'] == 1
+    assert len(recording.detections_at(1000)) == 0
+
+
+def test_interrupted_recording(tmp_path):
+    path = str(tmp_path / 'rec')
+    record(path, frames(3), [0, 1, 2])
+    # Half of a 4th frame, without its index record
+    with open(path + '.depth', 'ab') as f:
+        f.write(b'\0' * 100)
+    assert len(DepthRecording(path)) == 3
+
+
+def test_wrong_frame_size(tmp_path):
+    with DepthRecordingWriter(str(tmp_path / 'rec'), 64, 48) as writer:
+        with pytest.raises(ValueError):
+            writer.write_frame(0, np.zeros((10, 10), np.float32), CAMERA)
+    assert len(DepthRecording(str(tmp_path / 'rec'))) == 0
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.detection.DroneDetector: nested blobs, adaptive slicing, contour grouping, contour filter and contour depth.
+"""
+
+import copy
+
+import cv2
+import numpy as np
+import pytest
+
+from smart_track.detection import DroneDetector
+from smart_track.synthetic_depth import SyntheticDepthScene
+
+
+def make_detector(**kwargs):
+    return DroneDetector([300, 10000], [0.4, 0.99], [0.7, 1.0], 30, 4, 15.0, 1.0, 2.0, False, **kwargs)
+
+
+def nested_scene():
+    """
+    Wall at 3 m with an opening, a drone at 5.95 m seen through it, background at 14 m
+    """
+    image = np.full((480, 640), 14.0, np.float32)
+    image[100:400, 150:500] = 3.0
+    image[180:320, 250:400] = 14.0
+    cv2.ellipse(image, (324, 250), (40, 28), 0, 0, 360, 5.95, -1)
+    return image
+
+
+def test_blob_nested_in_a_nearer_surface():
+    detections, depths, _ = make_detector().preProcessing(nested_scene())
+    assert len(detections) == 1
+    assert np.allclose(detections[0], (250, 323), atol=2)
+    assert depths[0] == pytest.approx(5.95, abs=1e-3)
+
+
+def test_adaptive_slicing_of_a_far_wall():
+    """
+    Drone at 5 m in front of a wall at 12 m: fewer adaptive than uniform thresholds, and the drone is still detected
+    """
+    image = np.full((480, 640), 12.0, np.float32)
+    cv2.ellipse(image, (421, 173), (30, 20), 0, 0, 360, 5.0, -1)
+    uniform = make_detector()
+    adaptive = make_detector(slicing_mode='adaptive')
+
+    # min_group_size thresholds behind the drone and none behind the wall, against 8 uniform ones (6 m to 12 m)
+    thresholds = adaptive.getAdaptiveDepthThresholds(image, 5.0, 12.0)
+    assert len(thresholds) == adaptive.min_group_size_ < 8
+    assert np.all((thresholds > 5.0) & (thresholds < 12.0))
+
+    detections, depths, _ = adaptive.preProcessing(image.copy())
+    assert len(detections) == 1
+    assert run(adaptive, image)[:2] == run(uniform, image)[:2]
+    assert depths[0] == pytest.approx(5.0, abs=1e-3)
+
+
+def run(detector, image):
+    detections, depths, _ = detector.preProcessing(image.copy())
+    return np.asarray(detections).tolist(), list(depths), list(detector.last_radii_)
+
+
+def make_candidates(n_centers, n_slices=8, n_targets=5, width=640, height=480, seed=0):
+    """
+    Per-slice lists of contour centers, depths and radii: jittered copies of a few targets, and uniform clutter
+    """
+    rng = np.random.default_rng(seed)
+    targets = rng.uniform([0, 0], [height, width], size=(n_targets, 2))
+    n_clutter = n_centers // 2
+    points = np.vstack([
+        targets[rng.integers(0, n_targets, n_centers - n_clutter)] + rng.normal(0, 10, (n_centers - n_clutter, 2)),
+        rng.uniform([0, 0], [height, width], size=(n_clutter, 2)),
+    ]).astype(int)
+    slices = rng.integers(0, n_slices, n_centers)
+
+    centers_list, depths_list, radii_list = [], [], []
+    for k in range(n_slices):
+        idx = np.flatnonzero(slices == k)
+        centers_list.append([list(p) for p in points[idx]])
+        depths_list.append(list(rng.uniform(1.0, 10.0, len(idx))))
+        radii_list.append(list(rng.integers(5, 40, len(idx))))
+    return centers_list, depths_list, radii_list
+
+
+def group(method, candidates):
+    # getValidDetections() consumes the centers lists
+    detections, depths, radii = method(*copy.deepcopy(candidates))
+    return np.asarray(detections).tolist(), list(depths), list(radii)
+
+
+@pytest.mark.parametrize('n_centers, seed', [(0, 0), (10, 1), (100, 2), (500, 3), (1000, 4)])
+def test_grid_grouping_matches_pairwise(n_centers, seed):
+    detector = make_detector()
+    candidates = make_candidates(n_centers, seed=seed)
+    grid = group(detector.getValidDetectionsGrid, candidates)
+    pairwise = group(detector.getValidDetections, candidates)
+    assert len(grid[0]) == len(pairwise[0])
+    np.testing.assert_allclose(np.reshape(grid[0], (-1, 2)), np.reshape(pairwise[0], (-1, 2)), rtol=1e-12)
+    np.testing.assert_allclose(grid[1], pairwise[1], rtol=1e-12)
+    np.testing.assert_allclose(grid[2], pairwise[2], rtol=1e-12)
+
+
+def test_grid_grouping_at_the_distance_threshold():
+    # d_group_max = 30: int(dist) <= 30 is grouped, across grid cell boundaries (cell size 31)
+    detector = make_detector()
+    centers = [[[30, 30]], [[30, 60]], [[30, 0]], [[51, 52]], [[61, 61]], [[30, 91]]]
+    candidates = (centers, [[float(i + 1)] for i in range(6)], [[10 + i] for i in range(6)])
+    grid = group(detector.getValidDetectionsGrid, candidates)
+    assert grid == group(detector.getValidDetections, candidates)
+    assert len(grid[0]) == 1
+
+
+@pytest.mark.parametrize('slicing_mode', ['uniform', 'adaptive'])
+def test_grouping_modes_match_on_frames(slicing_mode):
+    grid = make_detector(slicing_mode=slicing_mode, grouping_mode='grid')
+    pairwise = make_detector(slicing_mode=slicing_mode, grouping_mode='pairwise')
+    scene = SyntheticDepthScene(hole_fraction=0.03, n_clutter=6, seed=5)
+    for _ in range(6):
+        image = scene.frame()[0]
+        assert run(grid, image) == run(pairwise, image)
+
+
+def polygon_contour(points):
+    return np.array(points, dtype=np.int32).reshape(-1, 1, 2)
+
+
+def reference_features(cnt):
+    area = cv2.contourArea(cnt)
+    perimeter = cv2.arcLength(cnt, True)
+    circularity = 4.0 * np.pi * area / perimeter**2 if perimeter > 0 else np.nan
+    hull_area = cv2.contourArea(cv2.convexHull(cnt))
+    convexity = area / hull_area if hull_area > 0 else np.nan
+    return area, circularity, convexity
+
+
+def test_filter_contours_counts_rejections_per_stage():
+    detector = DroneDetector([300, 10000], [0.4, 0.99], [0.95, 1.0], 30, 4, 15.0, 1.0, 2.0, False)
+    contours = [
+        polygon_contour([(0, 0), (60, 0), (60, 60), (0, 60)]),                          # valid
+        polygon_contour([(0, 0), (10, 0), (10, 10), (0, 10)]),                          # area
+        polygon_contour([(0, 0), (300, 0), (300, 5), (0, 5)]),                          # circularity
+        polygon_contour([(0, 0), (60, 0), (60, 40), (40, 40), (40, 60), (0, 60)]),      # convexity
+        polygon_contour([(0, 0), (80, 0), (80, 80), (0, 80)]),                          # valid
+    ]
+    valid_idx = detector.filterContours(contours)
+
+    # Same result as checking all the features of every contour
+    expected = []
+    for i, cnt in enumerate(contours):
+        area, circularity, convexity = reference_features(cnt)
+        if 300 <= area <= 10000 and 0.4 <= circularity <= 0.99 and 0.95 <= convexity <= 1.0:
+            expected.append(i)
+    assert valid_idx.tolist() == expected == [0, 4]
+    assert detector.rejection_counts_ == {'contours': 5, 'area': 1, 'circularity': 1, 'convexity': 1}
+    assert detector.resetRejectionCounts()['contours'] == 5
+    assert detector.rejection_counts_ == {'contours': 0, 'area': 0, 'circularity': 0, 'convexity': 0}
+    assert len(detector.filterContours([])) == 0
+
+
+def reference_contour_depth(cnt, img, not_eroded_thr_img):
+    """
+    Full-frame version of DroneDetector.getContourDepth(), as before the bounding-box crop
+    """
+    x, y, w, h = cv2.boundingRect(cnt)
+    mask = np.zeros(img.shape, np.uint8)
+    mask[y:y+h, x:x+w] = not_eroded_thr_img[y:y+h, x:x+w]
+    contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[-2:]
+    mask = np.zeros(img.shape, np.uint8)
+    cv2.drawContours(mask, contours, 0, 255, -1)
+    min_val, _, min_loc, _ = cv2.minMaxLoc(img, mask=mask)
+    return min_val, min_loc
+
+
+def test_contour_depth_on_crop_matches_full_frame():
+    detector = make_detector()
+    scene = SyntheticDepthScene(hole_fraction=0.0, inf_fraction=0.0, seed=5)
+    n_checked = 0
+    for _ in range(3):
+        img, _ = scene.frame()
+        norm_img = cv2.normalize(img, None, 0, 1, cv2.NORM_MINMAX)
+        eroded_img = detector.erode(norm_img)
+        for t in (0.3, 0.5, 0.7):
+            thr_img = detector.thresholding(eroded_img, t).astype(np.uint8)
+            not_eroded_thr_img = detector.thresholding(norm_img, t).astype(np.uint8)
+            contours, _ = cv2.findContours(thr_img, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)[-2:]
+            for cnt in contours:
+                assert detector.getContourDepth(cnt, img, not_eroded_thr_img) == reference_contour_depth(cnt, img, not_eroded_thr_img)
+                n_checked += 1
+    assert n_checked > 20
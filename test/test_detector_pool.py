@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.detector_pool: stamp order, drop-oldest queueing and restart of an exited worker.
+"""
+
+import time
+
+import pytest
+
+from smart_track.detector_pool import DetectorPool
+from smart_track.synthetic_depth import SyntheticDepthScene
+
+DETECTOR_ARGS = ([50, 3000], [0.4, 0.99], [0.7, 1.0], 15, 4, 15.0, 1.0, 2.0, False)
+
+
+def frames(n):
+    scene = SyntheticDepthScene(160, 120, 115.0, 115.0, n_clutter=0, hole_fraction=0.0, seed=2)
+    return [scene.frame()[0] for _ in range(n)]
+
+
+def poll_until(pool, n, timeout=60.0):
+    results = []
+    t0 = time.monotonic()
+    while len(results) < n:
+        assert time.monotonic() - t0 < timeout, 'timed out waiting for the workers'
+        results.extend(pool.poll())
+        time.sleep(0.01)
+    return results
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(num_workers, queue_size):
+        pool = DetectorPool(num_workers, DETECTOR_ARGS, queue_size=queue_size)
+        pools.append(pool)
+        return pool
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_results_in_stamp_order(make_pool):
+    pool = make_pool(2, 8)
+    images = frames(6)
+    for i, image in enumerate(images):
+        pool.submit(float(i), image, context=i)
+    results = poll_until(pool, len(images))
+    assert [r.stamp for r in results] == [float(i) for i in range(len(images))]
+    assert [r.context for r in results] == list(range(len(images)))
+    assert all(r.error is None for r in results)
+    assert all(r.image.shape == images[0].shape for r in results)
+    # Older than a released frame
+    assert pool.submit(0.5, images[0]) == 1 and pool.stats()['late'] == 1
+
+
+def test_oldest_waiting_frame_is_dropped(make_pool):
+    pool = make_pool(1, 1)
+    images = frames(4)
+    dropped = [pool.submit(float(i), image) for i, image in enumerate(images)]
+    # Frame 0 runs, frames 1 and 2 are dropped from the queue in turn, frame 3 waits
+    assert dropped == [0, 0, 1, 1]
+    results = poll_until(pool, 2)
+    assert [r.stamp for r in results] == [0.0, 3.0]
+    assert pool.stats()['dropped'] == 2
+
+
+def test_exited_worker_is_restarted(make_pool):
+    pool = make_pool(1, 2)
+    images = frames(3)
+    pool.submit(0.0, images[0])
+    pool.workers_[0].kill()
+    pool.workers_[0].join()
+
+    results = poll_until(pool, 1)
+    assert 'exited' in results[0].error
+    assert pool.stats()['restarts'] == 1
+
+    # The restarted worker processes the next frames
+    pool.submit(1.0, images[1])
+    pool.submit(2.0, images[2])
+    results = poll_until(pool, 2)
+    assert [r.stamp for r in results] == [1.0, 2.0]
+    assert all(r.error is None for r in results)
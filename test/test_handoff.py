@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+Stress test of smart_track.handoff.LatestHandoff at 60 Hz input.
+
+An ingest thread puts a YOLO and a KF message every 1/60 s, and wakes up a worker thread,
+as the ingest callback group and the guard condition do in Yolo2PoseNode.
+"""
+
+import threading
+import time
+
+from smart_track.handoff import LatestHandoff
+
+RATE = 60.0
+N_MESSAGES = 60
+
+
+def run(work_time):
+    wakeup = threading.Event()
+    handoff = LatestHandoff(notify=wakeup.set)
+    consumed = {'yolo': [], 'kf': []}
+    done = threading.Event()
+
+    def worker():
+        while not (done.is_set() and handoff.stats()['pending'] == 0):
+            if not wakeup.wait(timeout=0.1):
+                continue
+            wakeup.clear()
+            for key, item in handoff.take().items():
+                consumed[key].append(item)
+                time.sleep(work_time)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    t0 = time.monotonic()
+    for i in range(N_MESSAGES):
+        handoff.put('yolo', i)
+        handoff.put('kf', i)
+        # Absolute schedule, so the input rate does not drift
+        time.sleep(max(0.0, t0 + (i + 1) / RATE - time.monotonic()))
+    done.set()
+    thread.join(timeout=5.0)
+    assert not thread.is_alive()
+    return handoff.stats(), consumed
+
+
+def test_no_message_loss_at_60hz():
+    stats, consumed = run(work_time=0.002)
+
+    assert stats['put'] == 2 * N_MESSAGES
+    assert stats['dropped'] == 0
+    assert stats['taken'] == stats['put']
+    assert consumed['yolo'] == list(range(N_MESSAGES))
+    assert consumed['kf'] == list(range(N_MESSAGES))
+
+
+def test_slow_worker_drops_stale_messages_only():
+    stats, consumed = run(work_time=0.03)
+
+    # Every message is either processed or replaced by a newer one
+    assert stats['dropped'] > 0
+    assert stats['taken'] + stats['dropped'] == stats['put']
+    for key in ('yolo', 'kf'):
+        assert consumed[key] == sorted(consumed[key])
+        assert consumed[key][-1] == N_MESSAGES - 1
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.overlay_renderer: the overlay is drawn on a copy, and the 8-bit depth mapping.
+"""
+
+import numpy as np
+
+from smart_track.detection import DroneDetector
+from smart_track.overlay_renderer import depth_to_bgr8, render_overlay
+from smart_track.synthetic_depth import SyntheticDepthScene
+
+
+def depth_image():
+    image = np.full((48, 64), 10.0, np.float32)
+    image[10:30, 20:40] = 2.0
+    image[0, 0] = np.nan
+    return image
+
+
+def test_raw_overlay_is_a_copy():
+    image = depth_image()
+    original = image.copy()
+    overlay = render_overlay(image, 'raw', markers=[((20, 30), 8)], circles=[((30, 20), 5)], text='YOLO')
+    assert np.array_equal(image, original, equal_nan=True)
+    assert overlay.dtype == np.float32 and overlay.shape == image.shape
+    assert not np.array_equal(overlay, original, equal_nan=True)
+
+
+def test_bgr8_overlay():
+    image = depth_image()
+    overlay = render_overlay(image, 'bgr8', scale=0.5, max_depth=10.0, ellipses=[((30, 20), (10, 6), 30.0)])
+    assert overlay.dtype == np.uint8 and overlay.shape == (24, 32, 3)
+    # Ellipses are green
+    assert np.any((overlay[:, :, 1] == 255) & (overlay[:, :, 0] == 0))
+
+    gray = depth_to_bgr8(image, 10.0)[:, :, 0]
+    # Near is bright, the max depth and NaN are black
+    assert gray[20, 30] == 204 and gray[40, 5] == 0 and gray[0, 0] == 0
+
+
+def test_preprocessing_does_not_draw():
+    scene = SyntheticDepthScene(160, 120, 115.0, 115.0, max_depth=15.0, n_clutter=0, seed=1)
+    image, _ = scene.frame()
+    detector = DroneDetector([20, 1000], [0.4, 0.99], [0.7, 1.0], 10, 4, 15.0, 1.0, 2.0, False)
+    expected = np.where(np.isfinite(image), image, np.float32(15.0))
+    detections, _, processed = detector.preProcessing(image)
+    assert len(detections) > 0
+    # Only the NaN/inf values are replaced. The markers are drawn by the overlay renderer
+    assert processed is image
+    assert np.array_equal(processed, expected)
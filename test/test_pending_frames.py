@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.pending_frames.PendingFrameQueue: deferral, out-of-order completion, expiry and drop-oldest.
+"""
+
+from smart_track.pending_frames import PendingFrameQueue
+
+
+def test_frames_complete_out_of_order():
+    queue = PendingFrameQueue(max_size=5, timeout=0.5)
+    keys = [queue.push('frame {}'.format(i), 0.0)[0] for i in range(3)]
+    assert len(queue) == 3
+
+    assert queue.pop(keys[1]) == 'frame 1'
+    assert queue.pop(keys[1]) is None
+    assert queue.pop(keys[0]) == 'frame 0'
+    assert len(queue) == 1
+    assert queue.stats() == {'pending': 1, 'deferred': 3, 'completed': 2, 'expired': 0, 'dropped': 0}
+
+
+def test_frames_expire_after_timeout():
+    queue = PendingFrameQueue(max_size=5, timeout=0.5)
+    k0, _ = queue.push('frame 0', 0.0, handle='future 0')
+    k1, _ = queue.push('frame 1', 0.2, handle='future 1')
+
+    assert queue.expire(0.49) == []
+    assert queue.expire(0.5) == [('frame 0', 'future 0')]
+    assert queue.pop(k0) is None
+    assert queue.expire(1.0) == [('frame 1', 'future 1')]
+    assert queue.pop(k1) is None
+    assert queue.stats()['expired'] == 2 and queue.stats()['completed'] == 0
+
+
+def test_oldest_frame_is_dropped_when_full():
+    queue = PendingFrameQueue(max_size=2, timeout=0.5)
+    k0, dropped = queue.push('frame 0', 0.0, handle='future 0')
+    assert dropped == []
+    k1, _ = queue.push('frame 1', 0.1)
+    k2, dropped = queue.push('frame 2', 0.2)
+
+    assert dropped == [('frame 0', 'future 0')]
+    assert queue.pop(k0) is None
+    # The remaining frames keep their insertion order
+    assert [frame for frame, _ in queue.expire(10.0)] == ['frame 1', 'frame 2']
+    assert queue.stats()['dropped'] == 1
+
+
+def test_keys_are_not_reused():
+    queue = PendingFrameQueue(max_size=1)
+    k0, _ = queue.push('frame 0', 0.0)
+    assert queue.pop(k0) == 'frame 0'
+    k1, _ = queue.push('frame 1', 0.0)
+    assert k1 != k0
+    assert queue.pop(k0) is None
+    assert queue.pop(k1) == 'frame 1'
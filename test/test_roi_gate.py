@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.roi_gate.RoiGate: window size and placement, full-frame fallbacks, and window offsets.
+"""
+
+import cv2
+import numpy as np
+import pytest
+from smart_track.detection import DroneDetector
+from smart_track.roi_gate import RoiGate
+
+SHAPE = (480, 640)
+
+
+def window_size(window):
+    y0, y1, x0, x1 = window
+    return y1 - y0, x1 - x0
+
+
+def test_first_frame_is_a_full_scan():
+    gate = RoiGate(margin=40)
+    assert gate.next_window(0.0, SHAPE) is None
+    gate.update(0.0, [[240, 320]], [10], None)
+    assert gate.next_window(0.1, SHAPE) == (190, 291, 270, 371)
+
+
+def test_window_grows_and_shrinks_with_the_radius():
+    gate = RoiGate(history=1, margin=40, full_scan_period=100)
+    sizes = []
+    for i, radius in enumerate([10, 30, 60, 20]):
+        gate.update(0.1 * i, [[240, 320]], [radius], None)
+        window = gate.next_window(0.1 * (i + 1), SHAPE)
+        sizes.append(window_size(window))
+    assert sizes == [(101, 101), (141, 141), (201, 201), (121, 121)]
+
+
+def test_window_follows_constant_velocity():
+    gate = RoiGate(history=3, margin=20, full_scan_period=100)
+    for i in range(3):
+        gate.update(0.1 * i, [[200 + 10 * i, 300 - 20 * i]], [5], None)
+    # Predicted at (230, 240) at t = 0.3
+    y0, y1, x0, x1 = gate.next_window(0.3, SHAPE)
+    assert ((y0 + y1 - 1) / 2, (x0 + x1 - 1) / 2) == (230, 240)
+
+
+def test_window_is_shifted_inside_the_frame():
+    gate = RoiGate(history=1, margin=40, full_scan_period=100)
+    gate.update(0.0, [[5, 635]], [10], None)
+    assert gate.next_window(0.1, SHAPE) == (0, 101, 539, 640)
+
+
+def test_full_frame_fallbacks():
+    gate = RoiGate(history=2, margin=40, full_scan_period=3)
+    gate.update(0.0, [[240, 320]], [10], None)
+
+    # A full-frame scan every full_scan_period gated frames
+    windows = []
+    for i in range(1, 7):
+        window = gate.next_window(0.1 * i, SHAPE)
+        windows.append(window is None)
+        gate.update(0.1 * i, [[240, 320]], [10], window)
+    assert windows == [False, False, False, True, False, False]
+    assert (gate.gated_frames_, gate.full_frames_) == (5, 2)
+
+    # Track lost in a window
+    window = gate.next_window(0.7, SHAPE)
+    assert window is not None
+    gate.update(0.7, [], [], window)
+    assert gate.next_window(0.8, SHAPE) is None
+
+    # Window larger than the frame
+    gate.update(1.0, [[240, 320]], [300], None)
+    assert gate.next_window(1.1, SHAPE) is None
+
+
+def test_tracks_the_detection_closest_to_the_prediction():
+    gate = RoiGate(history=2, margin=40, full_scan_period=100)
+    gate.update(0.0, [[100, 100]], [10], None)
+    gate.update(0.1, [[400, 600], [105, 110], [300, 300]], [20, 12, 30], None)
+    assert gate.history_[-1][1:] == (105, 110, 12.0)
+
+
+def test_latency_statistics():
+    gate = RoiGate()
+    gate.update(0.0, [[240, 320]], [10], None, latency=0.02)
+    gate.update(0.1, [[240, 320]], [10], gate.next_window(0.1, SHAPE), latency=0.004)
+    gate.update(0.2, [[240, 320]], [10], gate.next_window(0.2, SHAPE), latency=0.006)
+    assert gate.gated_ratio() == pytest.approx(2 / 3)
+    assert gate.mean_latency() == pytest.approx((0.005, 0.02))
+
+
+def test_window_detections_match_full_frame():
+    image = np.full(SHAPE, 14.0, np.float32)
+    image[300:, :] = 2.0
+    cv2.ellipse(image, (421, 173), (30, 20), 0, 0, 360, 6.0, -1)
+    detector = DroneDetector([300, 10000], [0.4, 0.99], [0.7, 1.0], 30, 4, 15.0, 1.0, 2.0, False)
+
+    full, _, _ = detector.preProcessing(image.copy())
+    assert len(full) == 1
+
+    gate = RoiGate(margin=40)
+    gate.update(0.0, full, detector.last_radii_, None)
+    y0, y1, x0, x1 = gate.next_window(0.1, SHAPE)
+    gated, _, _ = detector.preProcessing(image[y0:y1, x0:x1].copy())
+    assert len(gated) == 1
+    np.testing.assert_allclose(np.asarray(gated[0]) + (y0, x0), full[0], atol=1.0)
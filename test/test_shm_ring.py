@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.shm_ring: lookup by stamp, overwrite detection and producer restarts.
+"""
+
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from smart_track.shm_ring import ShmFrameClient, ShmFrameRing
+
+NAME = 'smart_track_test_{}'.format(os.getpid())
+
+
+def header(sec, nanosec=0):
+    return SimpleNamespace(stamp=SimpleNamespace(sec=sec, nanosec=nanosec))
+
+
+@pytest.fixture
+def ring():
+    ring = ShmFrameRing.create(NAME, 3, 48 * 64 * 4)
+    yield ring
+    ring.close()
+
+
+def frame(i):
+    return np.full((48, 64), i, dtype=np.float32)
+
+
+def test_find_returns_read_only_view(ring):
+    ring.write(frame(1), 1, 500)
+    found = ring.find(1, 500)
+    assert found is not None
+    assert np.array_equal(found.array, frame(1))
+    assert not found.array.flags.writeable
+    assert ring.find(1, 501) is None
+
+
+def test_overwritten_frame_is_invalid(ring):
+    ring.write(frame(0), 0, 0)
+    found = ring.find(0, 0)
+    for i in range(1, 4):
+        ring.write(frame(i), i, 0)
+    # Slot 0 was rewritten by the 4th frame
+    assert not found.valid()
+    assert ring.find(0, 0) is None
+    assert ring.newest_stamp() == (3, 0)
+
+
+def test_frame_too_large(ring):
+    with pytest.raises(ValueError):
+        ring.write(np.zeros((100, 100), dtype=np.float32), 0, 0)
+
+
+def test_client_attaches_again_after_producer_restart(ring):
+    client = ShmFrameClient(NAME)
+    ring.write(frame(1), 1, 0)
+    assert client.get(header(1)).header.stamp.sec == 1
+
+    # Larger frames: the producer recreates the segment
+    ring.close()
+    restarted = ShmFrameRing.create(NAME, 3, 96 * 64 * 4)
+    try:
+        restarted.write(np.ones((96, 64), dtype=np.float32), 2, 0)
+        found = client.get(header(2))
+        assert found is not None and found.array.shape == (96, 64)
+        # Older than the newest frame: overwritten, not a restart
+        assert client.get(header(1)) is None
+        assert client.stats() == {'found': 2, 'missed': 1}
+    finally:
+        client.close()
+        restarted.close()
+
+
+def test_client_without_producer():
+    client = ShmFrameClient('smart_track_test_missing')
+    assert client.get(header(0)) is None
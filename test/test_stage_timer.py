@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.stage_timer: percentile accuracy of the histograms, windows and the disabled timer.
+"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from smart_track.stage_timer import LatencyHistogram, StageTimer
+
+
+def test_percentiles_within_bin_width():
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(np.log(5e-3), 0.5, size=10000)
+    histogram = LatencyHistogram()
+    for sample in samples:
+        histogram.record(sample)
+    for q in (50, 95, 99):
+        exact = np.percentile(samples, q)
+        # Upper bin edge: at least the exact value, at most one bin (12%) above it
+        assert exact * 0.999 <= histogram.percentile(q) <= exact * 1.13
+    assert histogram.mean() == pytest.approx(samples.mean())
+    assert histogram.percentile(100) == samples.max()
+
+
+def test_out_of_range_samples():
+    histogram = LatencyHistogram()
+    histogram.record(0.0)
+    histogram.record(1e4)
+    assert histogram.count_ == 2
+    assert histogram.percentile(50) <= 1e-6
+    assert histogram.percentile(100) == 1e4
+    assert LatencyHistogram().percentile(50) == 0.0
+
+
+def test_summary_window():
+    timer = StageTimer()
+    for _ in range(10):
+        timer.record('convert', 1e-3)
+    t = timer.record_since('detection', time.perf_counter())
+    assert t <= time.perf_counter()
+
+    summary = timer.summary()
+    assert set(summary) == {'convert', 'detection'}
+    assert summary['convert']['count'] == 10
+    assert summary['convert']['p50'] <= 1e-3 * 1.13 and summary['convert']['max'] == 1e-3
+    assert summary['convert']['rate'] > 0
+    # A new window starts after the summary
+    assert timer.summary() == {}
+
+
+def test_disabled_timer_records_nothing():
+    timer = StageTimer(enabled=False)
+    timer.record('convert', 1e-3)
+    t0 = time.perf_counter()
+    assert timer.record_since('convert', t0) >= t0
+    assert timer.summary() == {}
+
+
+def test_concurrent_record_and_summary():
+    timer = StageTimer()
+    stop = threading.Event()
+    n_recorded = [0, 0]
+
+    def record(i, stages):
+        while not stop.is_set():
+            for stage in stages:
+                timer.record(stage, 1e-3)
+            n_recorded[i] += len(stages)
+
+    threads = [threading.Thread(target=record, args=(0, ['arrival'])),
+               threading.Thread(target=record, args=(1, ['stage{}'.format(k) for k in range(20)]))]
+    for thread in threads:
+        thread.start()
+    total = 0
+    try:
+        for _ in range(200):
+            total += sum(s['count'] for s in timer.summary().values())
+            assert timer.summary(reset=False) is not None
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    total += sum(s['count'] for s in timer.summary().values())
+    # No sample is lost or counted twice across the window swaps
+    assert total == sum(n_recorded)
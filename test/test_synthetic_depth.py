@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.synthetic_depth, and of the detection pipeline on its frames.
+"""
+
+import numpy as np
+
+from smart_track.detection import DroneDetector
+from smart_track.synthetic_depth import SyntheticDepthScene, match_detections
+
+
+def make_detector(max_depth):
+    return DroneDetector([300, 10000], [0.4, 0.99], [0.7, 1.0], 30, 4, max_depth, 1.0, 2.0, False,
+                         grouping_mode='grid')
+
+
+def test_frames_are_reproducible():
+    a, targets_a = SyntheticDepthScene(seed=7).frame()
+    b, targets_b = SyntheticDepthScene(seed=7).frame()
+    assert np.array_equal(a, b, equal_nan=True)
+    assert np.array_equal(targets_a, targets_b)
+
+
+def test_frame_has_holes_and_ground_truth():
+    image, targets = SyntheticDepthScene(n_drones=3, seed=1).frame()
+    assert image.dtype == np.float32 and image.shape == (480, 640)
+    assert np.isnan(image).any() and np.isinf(image).any()
+    assert 1 <= len(targets) <= 3
+    for row, col, depth, radius in targets:
+        assert 0 <= row < 480 and 0 <= col < 640
+        assert 3.0 <= depth <= 8.0
+        # The drone center is at its depth, up to the noise
+        assert abs(image[int(row), int(col)] - depth) < 0.1 or not np.isfinite(image[int(row), int(col)])
+
+
+def test_detector_finds_drones_in_clean_frames():
+    scene = SyntheticDepthScene(n_clutter=0, hole_fraction=0.0, inf_fraction=0.0, seed=1)
+    detector = make_detector(scene.max_depth_)
+    detector.camera_model_ = scene.camera()
+    for _ in range(10):
+        image, targets = scene.frame()
+        detections, depths, _ = detector.preProcessing(image)
+        matches = match_detections(detections, targets)
+        assert len(matches) == len(targets) == len(detections)
+        for d, t in matches:
+            assert abs(depths[d] - targets[t, 2]) < 0.1
+        positions = detector.depthTo3D(detections, depths)
+        assert positions.shape == (len(detections), 3)
+
+
+def test_match_detections():
+    targets = np.array([[100.0, 100.0, 5.0, 20.0], [300.0, 400.0, 4.0, 25.0]])
+    matches = match_detections([[105.0, 98.0], [200.0, 200.0], [310.0, 390.0]], targets)
+    assert sorted(matches) == [(0, 0), (2, 1)]
+    assert match_detections([], targets) == []
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+Unit tests of smart_track.tf_cache.TFCache against a fake tf2 buffer.
+"""
+
+from geometry_msgs.msg import TransformStamped
+import numpy as np
+import pytest
+from smart_track.tf_cache import TFCache
+from smart_track.transforms import transform_to_matrix, TransformMatrixCache
+from tf2_ros import LookupException
+
+
+def make_transform(parent, child, translation, rotation):
+    tr = TransformStamped()
+    tr.header.frame_id = parent
+    tr.child_frame_id = child
+    tr.transform.translation.x, tr.transform.translation.y, tr.transform.translation.z = translation
+    q = np.asarray(rotation, dtype=np.float64)
+    q /= np.linalg.norm(q)
+    tr.transform.rotation.x, tr.transform.rotation.y, tr.transform.rotation.z, tr.transform.rotation.w = q.tolist()
+    return tr
+
+
+class FakeBuffer:
+    """Serves fixed transforms and counts the lookups."""
+
+    def __init__(self, transforms):
+        self.transforms_ = {(t.header.frame_id, t.child_frame_id): t for t in transforms}
+        self.calls_ = []
+
+    def lookup_transform(self, target_frame, source_frame, time, timeout=None):
+        self.calls_.append((target_frame, source_frame))
+        if (target_frame, source_frame) not in self.transforms_:
+            raise LookupException('{} -> {}'.format(source_frame, target_frame))
+        return self.transforms_[(target_frame, source_frame)]
+
+
+@pytest.fixture
+def tf_buffer():
+    map_base = make_transform('map', 'base_link', (1.0, 2.0, 3.0), (0.1, 0.2, 0.3, 0.9))
+    base_cam = make_transform('base_link', 'camera', (0.1, 0.0, -0.05), (-0.5, 0.5, -0.5, 0.5))
+    cam_base = make_transform('camera', 'base_link', (0.0, 0.0, 0.0), (0.5, -0.5, 0.5, 0.5))
+    base_map = make_transform('base_link', 'map', (-1.0, 0.5, 0.0), (0.0, 0.0, 0.6, 0.8))
+    return FakeBuffer([map_base, base_cam, cam_base, base_map])
+
+
+def test_static_segment_is_memoized(tf_buffer):
+    cache = TFCache(tf_buffer, stamp_tolerance=-1.0)
+    cache.add_static_link('camera', 'base_link')
+    for i in range(5):
+        cache.lookup('map', 'camera', float(i))
+
+    assert tf_buffer.calls_.count(('base_link', 'camera')) == 1
+    assert tf_buffer.calls_.count(('map', 'base_link')) == 5
+    assert cache.static_hits_ == 4 and cache.static_misses_ == 1
+    assert cache.dynamic_hits_ == 0 and cache.dynamic_misses_ == 5
+
+
+def test_dynamic_segment_reused_within_tolerance(tf_buffer):
+    cache = TFCache(tf_buffer, stamp_tolerance=0.02)
+    cache.lookup('map', 'base_link', 10.0)
+    cache.lookup('map', 'base_link', 10.01)
+    cache.lookup('map', 'base_link', 10.05)
+
+    assert tf_buffer.calls_ == [('map', 'base_link'), ('map', 'base_link')]
+    assert cache.dynamic_hits_ == 1 and cache.dynamic_misses_ == 2
+    assert cache.hit_rate() == pytest.approx(1.0 / 3.0)
+
+
+def test_composition_matches_chain(tf_buffer):
+    cache = TFCache(tf_buffer)
+    cache.add_static_link('camera', 'base_link')
+
+    # map <- base_link (dynamic) <- camera (static)
+    T = transform_to_matrix(cache.lookup('map', 'camera', 0.0))
+    expected = transform_to_matrix(tf_buffer.transforms_[('map', 'base_link')]) @ \
+        transform_to_matrix(tf_buffer.transforms_[('base_link', 'camera')])
+    np.testing.assert_allclose(T, expected, atol=1e-12)
+
+    # camera <- base_link (static) <- map (dynamic)
+    T = transform_to_matrix(cache.lookup('camera', 'map', 0.0))
+    expected = transform_to_matrix(tf_buffer.transforms_[('camera', 'base_link')]) @ \
+        transform_to_matrix(tf_buffer.transforms_[('base_link', 'map')])
+    np.testing.assert_allclose(T, expected, atol=1e-12)
+
+    # Static segment only
+    assert cache.lookup('base_link', 'camera', 0.0) is tf_buffer.transforms_[('base_link', 'camera')]
+
+
+def test_composition_takes_dynamic_stamp(tf_buffer):
+    cache = TFCache(tf_buffer, stamp_tolerance=-1.0)
+    cache.add_static_link('camera', 'base_link')
+    matrix_cache = TransformMatrixCache()
+    base_map = tf_buffer.transforms_[('base_link', 'map')]
+
+    # camera <- base_link (static, memoized) <- map (dynamic)
+    matrices = []
+    for sec in (10, 11):
+        base_map.header.stamp.sec = sec
+        base_map.transform.translation.x = float(sec)
+        transform = cache.lookup('camera', 'map', float(sec))
+        assert transform.header.stamp.sec == sec
+        matrices.append(matrix_cache.matrix(transform))
+    assert not np.allclose(matrices[0], matrices[1])
+
+    # map <- base_link (dynamic) <- camera (static)
+    tf_buffer.transforms_[('map', 'base_link')].header.stamp.sec = 12
+    assert cache.lookup('map', 'camera', 12.0).header.stamp.sec == 12
+
+
+def test_failures_are_raised_and_counted(tf_buffer):
+    cache = TFCache(tf_buffer)
+    with pytest.raises(LookupException):
+        cache.lookup('map', 'unknown', 0.0)
+    assert cache.failures_ == 1
+    assert cache.stats()['failures'] == 1
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+"""
+Tests of smart_track.transforms against a hand-computed quaternion reference, and against tf2_geometry_msgs if available.
+"""
+
+from geometry_msgs.msg import TransformStamped
+import numpy as np
+import pytest
+from smart_track.transforms import compose_transforms, transform_points, transform_to_matrix, TransformMatrixCache
+
+
+def make_transform(parent, child, translation, rotation, sec=0):
+    tr = TransformStamped()
+    tr.header.frame_id = parent
+    tr.header.stamp.sec = sec
+    tr.child_frame_id = child
+    tr.transform.translation.x, tr.transform.translation.y, tr.transform.translation.z = translation
+    q = np.asarray(rotation, dtype=np.float64)
+    q /= np.linalg.norm(q)
+    tr.transform.rotation.x, tr.transform.rotation.y, tr.transform.rotation.z, tr.transform.rotation.w = q.tolist()
+    return tr
+
+
+def quaternion_product(a, b):
+    ax, ay, az, aw = a
+    bx, by, bz, bw = b
+    return (aw*bx + ax*bw + ay*bz - az*by,
+            aw*by - ax*bz + ay*bw + az*bx,
+            aw*bz + ax*by - ay*bx + az*bw,
+            aw*bw - ax*bx - ay*by - az*bz)
+
+
+def reference_transform_point(tr, p):
+    """
+    p' = q p q* + t, one point at a time
+    """
+    r, t = tr.transform.rotation, tr.transform.translation
+    q = (r.x, r.y, r.z, r.w)
+    x, y, z, _ = quaternion_product(quaternion_product(q, (p[0], p[1], p[2], 0.0)), (-r.x, -r.y, -r.z, r.w))
+    return np.array([x + t.x, y + t.y, z + t.z])
+
+
+@pytest.fixture
+def points():
+    return np.random.default_rng(0).uniform(-10.0, 10.0, size=(50, 3))
+
+
+def test_quarter_turn_about_z():
+    tr = make_transform('map', 'camera', (1.0, 2.0, 3.0), (0.0, 0.0, np.sqrt(0.5), np.sqrt(0.5)))
+    transformed, valid = transform_points(transform_to_matrix(tr), [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    np.testing.assert_allclose(transformed, [[1.0, 3.0, 3.0], [0.0, 2.0, 3.0]], atol=1e-12)
+    assert valid.all()
+
+
+def test_transform_points_matches_reference(points):
+    for seed in range(5):
+        rng = np.random.default_rng(seed)
+        tr = make_transform('map', 'camera', rng.normal(size=3).tolist(), rng.normal(size=4).tolist())
+        transformed, valid = transform_points(transform_to_matrix(tr), points)
+        assert valid.all()
+        np.testing.assert_allclose(transformed, [reference_transform_point(tr, p) for p in points], atol=1e-12)
+
+
+def test_transform_points_drops_non_finite(points):
+    tr = make_transform('map', 'camera', (0.5, 0.0, -1.0), (0.1, 0.2, 0.3, 0.9))
+    points[[3, 7], 2] = np.nan
+    points[11, 0] = np.inf
+    transformed, valid = transform_points(transform_to_matrix(tr), points)
+    assert np.flatnonzero(~valid).tolist() == [3, 7, 11]
+    np.testing.assert_allclose(transformed, [reference_transform_point(tr, p) for p in points[valid]], atol=1e-12)
+
+
+def test_compose_transforms_matches_chain(points):
+    a = make_transform('map', 'base_link', (1.0, 2.0, 3.0), (0.1, 0.2, 0.3, 0.9), sec=5)
+    b = make_transform('base_link', 'camera', (0.1, 0.0, -0.05), (-0.5, 0.5, -0.5, 0.5))
+    ab = compose_transforms(a, b)
+
+    assert (ab.header.frame_id, ab.child_frame_id, ab.header.stamp.sec) == ('map', 'camera', 5)
+    r = ab.transform.rotation
+    assert np.linalg.norm([r.x, r.y, r.z, r.w]) == pytest.approx(1.0)
+    transformed, _ = transform_points(transform_to_matrix(ab), points)
+    np.testing.assert_allclose(transformed, [reference_transform_point(a, reference_transform_point(b, p)) for p in points],
+                               atol=1e-12)
+
+
+def test_pose_array_gets_transform_rotation():
+    tr = make_transform('map', 'camera', (1.0, 0.0, 0.0), (0.1, 0.2, 0.3, 0.9), sec=7)
+    pose_array, n_dropped = TransformMatrixCache().transform_to_pose_array(
+        [[1.0, 2.0, 3.0], [np.nan, 0.0, 0.0]], tr, 'map', tr.header.stamp)
+
+    assert n_dropped == 1 and len(pose_array.poses) == 1
+    assert pose_array.header.frame_id == 'map' and pose_array.header.stamp.sec == 7
+    p = pose_array.poses[0].position
+    np.testing.assert_allclose([p.x, p.y, p.z], reference_transform_point(tr, (1.0, 2.0, 3.0)), atol=1e-12)
+    assert pose_array.poses[0].orientation is tr.transform.rotation
+
+
+def test_matrix_cache_keyed_on_stamp():
+    tr = make_transform('map', 'camera', (1.0, 0.0, 0.0), (0.0, 0.0, 0.0, 1.0), sec=1)
+    cache = TransformMatrixCache()
+    first = cache.matrix(tr)
+    assert cache.matrix(tr) is first
+    tr.header.stamp.sec = 2
+    tr.transform.translation.x = 2.0
+    assert cache.matrix(tr)[0, 3] == 2.0
+
+
+def test_transform_points_matches_do_transform_point(points):
+    tf2_geometry_msgs = pytest.importorskip('tf2_geometry_msgs')
+    from geometry_msgs.msg import PointStamped
+    tr = make_transform('map', 'camera', (1.0, 2.0, 3.0), (0.1, 0.2, 0.3, 0.9))
+    transformed, _ = transform_points(transform_to_matrix(tr), points)
+    for p, expected in zip(points, transformed):
+        point = PointStamped()
+        point.point.x, point.point.y, point.point.z = p.tolist()
+        out = tf2_geometry_msgs.do_transform_point(point, tr).point
+        np.testing.assert_allclose([out.x, out.y, out.z], expected, atol=1e-9)